@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Benchmark harness for the Top10 generator
+Feeds synthetic deals through the fetch -> normalize -> rank -> render pipeline,
+serving API responses from a local stub server instead of RapidAPI
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+# Add parent directory to path to import generate module
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import generate
+
+
+DEFAULT_SIZES = [10, 1000, 100000]
+DEFAULT_CATEGORIES = 50
+DEFAULT_LATENCY = 0.2
+DEFAULT_TOLERANCE = 0.25
+DEFAULT_REPEAT = 3
+# Stages faster than this are too noisy to flag as regressions
+NOISE_FLOOR_SECONDS = 0.005
+STUB_PAGE_SIZE = 100
+
+BENCH_CONFIG = {
+    "rapidapi_key": "bench_key",
+    "rapidapi_host": "localhost",
+    "amazon_affiliate_id": "bench-20",
+    "domain": "US",
+    "node_id": "0",
+    "requests_per_second": 0,
+    "max_retries": 0
+}
+
+
+def make_deals(count: int, seed: int = 0) -> List[Dict]:
+    """Build a deterministic list of synthetic deals in the RapidAPI product shape"""
+    rng = random.Random(seed)
+    deals = []
+    for i in range(count):
+        asin = f"B{seed % 100:02d}{i:07d}"
+        deals.append({
+            "product_title": f"Synthetic product {i} with a reasonably long marketing title & extras",
+            "product_price": f"${rng.uniform(5, 500):.2f}",
+            "product_original_price": f"${rng.uniform(500, 900):.2f}",
+            "product_star_rating": f"{rng.uniform(1, 5):.1f}",
+            "product_num_ratings": f"{rng.randint(0, 250000):,}",
+            "product_url": f"https://www.amazon.com/dp/{asin}",
+            "product_photo": f"https://m.media-amazon.com/images/I/{asin}._AC_SL1500_.jpg"
+        })
+    return deals
+
+
+class StubApiHandler(BaseHTTPRequestHandler):
+    """Serves synthetic /deals pages with an artificial delay"""
+    
+    latency = 0.0
+    page_size = STUB_PAGE_SIZE
+    
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        node_id = int(query.get('node_id', ['0'])[0] or 0)
+        page = int(query.get('page', ['1'])[0])
+        
+        time.sleep(self.latency)
+        body = json.dumps({"data": {"deals": make_deals(self.page_size, seed=node_id * 1000 + page)}})
+        payload = body.encode('utf-8')
+        
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+    
+    def log_message(self, format, *args):
+        pass
+
+
+@contextlib.contextmanager
+def stub_server(latency: float = DEFAULT_LATENCY, page_size: int = STUB_PAGE_SIZE):
+    """Run a local stub of the deals endpoint and yield its URL"""
+    handler = type('ConfiguredStubApiHandler', (StubApiHandler,), {
+        'latency': latency,
+        'page_size': page_size
+    })
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}/deals"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def measure(stage: str, size: int, fn: Callable[[], object], track_memory: bool = True,
+            repeat: int = DEFAULT_REPEAT) -> Dict:
+    """Time one stage (best of `repeat`) and, separately, record its peak traced memory"""
+    timings = []
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    seconds = min(timings)
+    
+    peak_kb = None
+    if track_memory:
+        tracemalloc.start()
+        try:
+            fn()
+            peak_kb = tracemalloc.get_traced_memory()[1] // 1024
+        finally:
+            tracemalloc.stop()
+    
+    return {
+        'stage': stage,
+        'size': size,
+        'seconds': round(seconds, 6),
+        'items_per_sec': round(size / seconds, 1) if seconds > 0 else None,
+        'peak_kb': peak_kb
+    }
+
+
+def bench_pipeline(sizes: List[int], track_memory: bool = True, repeat: int = DEFAULT_REPEAT) -> List[Dict]:
+    """Benchmark the CPU-bound stages over synthetic deal lists"""
+    config = dict(BENCH_CONFIG)
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        page_path = os.path.join(workdir, "index.html")
+        for size in sizes:
+            deals = make_deals(size)
+            stages = {
+                'affiliate': lambda: [
+                    generate.add_affiliate_tag(deal['product_url'], config['amazon_affiliate_id'])
+                    for deal in deals
+                ],
+                'normalize': lambda: list(generate.normalize_deals(deals)),
+                'rank': lambda: generate.rank_deals(deals, config),
+                'render': lambda: generate.generate_html(deals, config, limit=size),
+                'write': lambda: generate.write_atomic(page_path, generate.iter_html(deals, config, limit=size))
+            }
+            for stage, fn in stages.items():
+                results.append(measure(stage, size, fn, track_memory, repeat))
+    return results
+
+
+def bench_network(categories: int, latency: float, workers: int, repeat: int = DEFAULT_REPEAT) -> List[Dict]:
+    """Benchmark concurrent category fetches and a full batch run against the stub server"""
+    results = []
+    with stub_server(latency) as url:
+        config = dict(BENCH_CONFIG, api_endpoint=url)
+        category_list = [
+            {"slug": f"category-{i}", "title": f"Category {i}", "node_id": str(i)}
+            for i in range(categories)
+        ]
+        
+        def fetch():
+            client = generate.ApiClient(max_retries=0, requests_per_second=0, pool_size=workers)
+            generate.fetch_categories(config, category_list, max_workers=workers, client=client)
+            client.close()
+        
+        def full_run():
+            with tempfile.TemporaryDirectory() as workdir:
+                config_path = os.path.join(workdir, "config.json")
+                with open(config_path, 'w') as f:
+                    json.dump(dict(config, categories=category_list), f)
+                cwd = os.getcwd()
+                os.chdir(workdir)
+                try:
+                    generate.main(['--config', config_path, '--batch', '--no-cache',
+                                   '--workers', str(workers)])
+                finally:
+                    os.chdir(cwd)
+        
+        with contextlib.redirect_stdout(io.StringIO()):
+            results.append(measure('fetch', categories, fetch, track_memory=False, repeat=repeat))
+            results.append(measure('main', categories, full_run, track_memory=False, repeat=repeat))
+    return results
+
+
+def compare_to_baseline(results: List[Dict], baseline: List[Dict],
+                        tolerance: float = DEFAULT_TOLERANCE) -> List[str]:
+    """Return a message for every stage that got slower than baseline by more than `tolerance`"""
+    previous = {(entry['stage'], entry['size']): entry for entry in baseline}
+    regressions = []
+    for entry in results:
+        base = previous.get((entry['stage'], entry['size']))
+        if not base or max(base['seconds'], entry['seconds']) < NOISE_FLOOR_SECONDS:
+            continue
+        if entry['seconds'] > base['seconds'] * (1 + tolerance):
+            regressions.append(
+                f"{entry['stage']}[{entry['size']}]: {entry['seconds']:.4f}s vs "
+                f"baseline {base['seconds']:.4f}s (+{entry['seconds'] / base['seconds'] - 1:.0%})"
+            )
+    return regressions
+
+
+def print_results(results: List[Dict]) -> None:
+    """Print a human-readable results table"""
+    print(f"{'stage':<10} {'size':>8} {'seconds':>10} {'items/s':>14} {'peak KB':>10}")
+    for entry in results:
+        rate = f"{entry['items_per_sec']:,.0f}" if entry['items_per_sec'] else '-'
+        peak = f"{entry['peak_kb']:,}" if entry['peak_kb'] is not None else '-'
+        print(f"{entry['stage']:<10} {entry['size']:>8} {entry['seconds']:>10.4f} {rate:>14} {peak:>10}")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="Top10 pipeline benchmarks")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help="Synthetic deal list sizes for the CPU-bound stages")
+    parser.add_argument('--categories', type=int, default=DEFAULT_CATEGORIES,
+                        help="Number of categories fetched from the stub server")
+    parser.add_argument('--latency', type=float, default=DEFAULT_LATENCY,
+                        help="Stub server response delay in seconds")
+    parser.add_argument('--workers', type=int, default=generate.DEFAULT_MAX_WORKERS,
+                        help="Concurrent fetch workers")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                        help="Runs per stage; the fastest is reported")
+    parser.add_argument('--no-memory', action='store_true', help="Skip peak memory tracing")
+    parser.add_argument('--no-network', action='store_true', help="Skip the stub server stages")
+    parser.add_argument('--output', help="Write results as JSON to this path")
+    parser.add_argument('--baseline', help="Compare against a saved results file")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="Allowed slowdown versus baseline before failing (0.25 = 25%%)")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Run the benchmarks and optionally check them against a baseline"""
+    args = parse_args(argv)
+    
+    results = bench_pipeline(args.sizes, track_memory=not args.no_memory, repeat=args.repeat)
+    if not args.no_network:
+        results += bench_network(args.categories, args.latency, args.workers, repeat=args.repeat)
+    
+    print_results(results)
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n✓ Results written to {args.output}")
+    
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_to_baseline(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\n✗ Performance regressions:")
+            for message in regressions:
+                print(f"  - {message}")
+            return 1
+        print("\n✓ No regressions against baseline")
+    
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,23 +4,390 @@ Top10 Site Generator
 Fetches Amazon deals from RapidAPI and generates a static HTML site
 """
 
+import argparse
+import base64
+import contextlib
+import functools
+import glob
+import gzip
+import hashlib
+import heapq
+import html as html_lib
+import io
 import json
+import math
 import os
+import random
+import re
+import signal
+import sqlite3
 import sys
-from datetime import datetime
-from typing import Dict, List, Optional
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from urllib.parse import urlsplit
 import requests
 
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional; without it Amazon's own resized variants are used
+    Image = None
 
-def load_config(config_path: str = "config.json") -> Dict:
-    """Load configuration from JSON file"""
+try:
+    import brotli
+except ImportError:  # Brotli is optional; without it only .gz siblings are written
+    brotli = None
+
+
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_CACHE_DIR = ".cache/responses"
+DEFAULT_CACHE_TTL = 3600
+DEFAULT_CACHE_MAX_ENTRIES = 500
+DEFAULT_HISTORY_PATH = ".cache/price_history.sqlite3"
+DEFAULT_PRODUCT_INDEX_PATH = ".cache/product_index.json"
+DEFAULT_LINK_CACHE_PATH = ".cache/link_status.json"
+DEFAULT_LINK_CACHE_TTL = 86400
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_RETRY_BACKOFF = 0.5
+DEFAULT_MAX_BACKOFF = 30.0
+DEFAULT_REQUESTS_PER_SECOND = 5.0
+DEFAULT_REFRESH_INTERVAL = 3600
+DEFAULT_REFRESH_JITTER = 0.1
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class RunMetrics:
+    """Thread-safe per-stage timings and event counters for one generator run"""
+    
+    def __init__(self):
+        self.reset()
+    
+    def reset(self) -> None:
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.stages = {}
+        self.counters = {}
+    
+    def add_time(self, stage: str, seconds: float, calls: int = 1) -> None:
+        """Record `calls` executions of a stage taking `seconds` in total"""
+        with self._lock:
+            entry = self.stages.setdefault(stage, {'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+            entry['calls'] += calls
+            entry['seconds'] += seconds
+            entry['max_seconds'] = max(entry['max_seconds'], seconds / max(calls, 1))
+    
+    @contextlib.contextmanager
+    def timed(self, stage: str):
+        """Time the enclosed block as one call of `stage`"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start)
+    
+    def count(self, name: str, amount: int = 1) -> None:
+        """Increment an event counter"""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+    
+    def report(self, cache: Optional['ResponseCache'] = None,
+               client: Optional['ApiClient'] = None) -> Dict:
+        """Snapshot the run as a JSON-serializable dict, folding in cache and HTTP stats"""
+        counters = dict(self.counters)
+        if cache is not None:
+            counters.update({f"cache_{name}": value for name, value in cache.stats.items()})
+        if client is not None:
+            counters.update({f"http_{name}": value for name, value in client.stats.items()})
+        
+        return {
+            'started_at': datetime.fromtimestamp(self.started_at).isoformat(timespec='seconds'),
+            'duration_seconds': round(time.time() - self.started_at, 6),
+            'stages': {
+                name: {key: round(value, 6) for key, value in entry.items()}
+                for name, entry in sorted(self.stages.items())
+            },
+            'counters': dict(sorted(counters.items()))
+        }
+
+
+# Shared by every worker thread; reset at the start of each run
+METRICS = RunMetrics()
+
+
+def append_run_report(path: str, report: Dict) -> None:
+    """Append one run report as a JSON line"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(report, sort_keys=True) + "\n")
+
+
+def prometheus_metrics(report: Dict) -> str:
+    """Render a run report in the Prometheus text exposition format"""
+    lines = [
+        "# HELP top10_run_duration_seconds Wall time of the last generator run.",
+        "# TYPE top10_run_duration_seconds gauge",
+        f"top10_run_duration_seconds {report['duration_seconds']}",
+        "# HELP top10_run_timestamp_seconds Unix time the last generator run started.",
+        "# TYPE top10_run_timestamp_seconds gauge",
+        f"top10_run_timestamp_seconds {int(datetime.fromisoformat(report['started_at']).timestamp())}",
+        "# HELP top10_stage_seconds Total time spent per stage in the last run.",
+        "# TYPE top10_stage_seconds gauge"
+    ]
+    lines += [f'top10_stage_seconds{{stage="{name}"}} {entry["seconds"]}' for name, entry in report['stages'].items()]
+    lines += [
+        "# HELP top10_stage_calls Number of times each stage ran in the last run.",
+        "# TYPE top10_stage_calls gauge"
+    ]
+    lines += [f'top10_stage_calls{{stage="{name}"}} {entry["calls"]}' for name, entry in report['stages'].items()]
+    lines += [
+        "# HELP top10_events Event counts (bytes, retries, cache hits, fallbacks) in the last run.",
+        "# TYPE top10_events gauge"
+    ]
+    lines += [f'top10_events{{name="{name}"}} {value}' for name, value in report['counters'].items()]
+    return "\n".join(lines) + "\n"
+
+
+DEFAULT_OUTPUT_DIR = "output"
+DEFAULT_TAXONOMY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "taxonomy.json")
+NUMBER = (int, float)
+
+# key: (accepted types, default, minimum); a default of None means "unset"
+CONFIG_SCHEMA = {
+    'rapidapi_key': (str, None, None),
+    'rapidapi_host': (str, 'amazon-real-time-api.p.rapidapi.com', None),
+    'amazon_affiliate_id': (str, None, None),
+    'api_endpoint': (str, 'https://amazon-real-time-api.p.rapidapi.com/deals', None),
+    'domain': (str, 'US', None),
+    'node_id': ((str, int), None, None),
+    'niche': (str, None, None),
+    'search_query': (str, None, None),
+    'taxonomy_path': (str, None, None),
+    'jekyll_dir': (str, None, None),
+    'search': (bool, None, None),
+    'check_links': (bool, None, None),
+    'link_cache_path': (str, None, None),
+    'link_cache_ttl': (NUMBER, None, 0),
+    'link_check_per_host': (int, None, 1),
+    'title': (str, None, None),
+    'top_n': (int, None, 1),
+    'max_pages': (int, None, 1),
+    'target_candidates': (int, None, 1),
+    'mock_fallback': (bool, None, None),
+    'keywords': (list, None, None),
+    'ranking': (dict, None, None),
+    'output_dir': (str, DEFAULT_OUTPUT_DIR, None),
+    'cache_dir': (str, None, None),
+    'cache_ttl': (NUMBER, None, 0),
+    'cache_max_entries': (int, None, 1),
+    'history_path': (str, None, None),
+    'product_index_path': (str, None, None),
+    'max_retries': (int, None, 0),
+    'retry_backoff': (NUMBER, None, 0),
+    'requests_per_second': (NUMBER, None, 0),
+    'max_workers': (int, None, 1),
+    'images': (bool, None, None),
+    'optimize': (bool, None, None),
+    'dedupe': (bool, None, None),
+    'site_url': (str, None, None),
+    'site_title': (str, None, None),
+    'report_path': (str, None, None),
+    'prometheus_path': (str, None, None),
+    'refresh_interval': (NUMBER, None, 1),
+    'refresh_jitter': (NUMBER, None, 0),
+    'api_budget_per_hour': (int, None, 1),
+    'categories': (list, None, None),
+    'sites': (list, None, None),
+}
+
+# Names shared with .github/scripts/fill-template.js; every other key reads TOP10_<KEY>
+CONFIG_ENV_ALIASES = {
+    'rapidapi_key': 'RAPID_KEY',
+    'amazon_affiliate_id': 'AMAZON_AFFILIATE_ID',
+    'node_id': 'NODE_ID',
+    'niche': 'NICHE',
+    'search_query': 'SEARCH_QUERY',
+}
+
+SLUG_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_-]*$')
+
+
+def config_env_name(key: str) -> str:
+    """Environment variable that overrides a top-level configuration key"""
+    return CONFIG_ENV_ALIASES.get(key, f"TOP10_{key.upper()}")
+
+
+def parse_env_value(key: str, value: str):
+    """Convert an environment string to the type the schema expects"""
+    types = CONFIG_SCHEMA[key][0]
+    if types is bool:
+        return value.strip().lower() in ('1', 'true', 'yes', 'on')
+    if types is int:
+        return int(value)
+    if types is NUMBER:
+        return float(value)
+    if types in (list, dict):
+        return json.loads(value)
+    return value
+
+
+def apply_env_overrides(config: Dict, env: Optional[Dict[str, str]] = None) -> List[str]:
+    """Override top-level keys from the environment; returns parse errors"""
+    env = os.environ if env is None else env
+    errors = []
+    for key in CONFIG_SCHEMA:
+        name = config_env_name(key)
+        if name not in env or env[name] == '':
+            continue
+        try:
+            config[key] = parse_env_value(key, env[name])
+        except ValueError:
+            errors.append(f"{name}: can't parse {env[name]!r} for '{key}'")
+    return errors
+
+
+def check_config_types(config: Dict, where: str) -> List[str]:
+    """Check every known key in one config level against the schema"""
+    errors = []
+    for key, value in config.items():
+        if key not in CONFIG_SCHEMA or value is None:
+            continue
+        types, _, minimum = CONFIG_SCHEMA[key]
+        # bool is an int subclass but never a valid count
+        if not isinstance(value, types) or (isinstance(value, bool) and types is not bool):
+            expected = types.__name__ if isinstance(types, type) else '/'.join(t.__name__ for t in types)
+            errors.append(f"{where}'{key}' should be {expected}, got {type(value).__name__}")
+        elif minimum is not None and value < minimum:
+            errors.append(f"{where}'{key}' must be at least {minimum}")
+    return errors
+
+
+def site_config(config: Dict, site: Dict) -> Dict:
+    """Overlay one entry of the `sites` list on top of the base configuration"""
+    merged = {key: value for key, value in config.items() if key != 'sites'}
+    merged.update(site)
+    if 'output_dir' not in site:
+        merged['output_dir'] = os.path.join(config.get('output_dir', DEFAULT_OUTPUT_DIR), site.get('name', ''))
+    return merged
+
+
+def validate_config(config: Dict, use_mock: bool = False, batch: bool = False) -> List[str]:
+    """Return every problem that would otherwise surface mid-run, after API calls were paid for"""
+    errors = check_config_types(config, '')
+    if not config.get('amazon_affiliate_id'):
+        errors.append(f"'amazon_affiliate_id' is required (or set {config_env_name('amazon_affiliate_id')})")
+    if not use_mock and not config.get('rapidapi_key'):
+        errors.append(f"'rapidapi_key' is required (or set {config_env_name('rapidapi_key')})")
+    
+    categories = config.get('categories') or []
+    if batch and not categories:
+        errors.append("Batch and daemon modes need a non-empty 'categories' list")
+    if not batch and not use_mock and not config.get('node_id'):
+        errors.append(f"'node_id' is required (or set {config_env_name('node_id')} or a matching 'niche')")
+    
+    if isinstance(categories, list):
+        seen = set()
+        for position, category in enumerate(categories):
+            where = f"categories[{position}]: "
+            if not isinstance(category, dict):
+                errors.append(f"{where}should be an object")
+                continue
+            slug = category.get('slug')
+            if not isinstance(slug, str) or not SLUG_PATTERN.match(slug):
+                errors.append(f"{where}'slug' must be letters, digits, '-' or '_'")
+            elif slug in seen:
+                errors.append(f"{where}duplicate slug '{slug}'")
+            seen.add(slug)
+            if not category.get('node_id'):
+                errors.append(f"{where}'node_id' is required" + (
+                    f" (no taxonomy match for '{category_phrase(category)}')" if category_phrase(category) else ''))
+            errors.extend(check_config_types(category, where))
+    return errors
+
+
+def category_phrase(entry: Dict) -> str:
+    """Niche and search phrase used to look up an entry's browse node"""
+    return " ".join(filter(None, (entry.get('niche'), entry.get('search_query')))).strip()
+
+
+def resolve_node_ids(config: Dict) -> List[str]:
+    """Fill in node_id from `niche`/`search_query` wherever one isn't given; returns load errors"""
+    entries = [config]
+    for site in config.get('sites') or []:
+        if isinstance(site, dict):
+            entries.append(site)
+            entries.extend(site.get('categories') or [])
+    entries.extend(config.get('categories') or [])
+    
+    for entry in entries:
+        if not isinstance(entry, dict) or entry.get('node_id') or not category_phrase(entry):
+            continue
+        try:
+            resolver = load_taxonomy(config.get('taxonomy_path', DEFAULT_TAXONOMY_PATH))
+        except (OSError, ValueError, KeyError) as e:
+            return [f"can't load taxonomy: {e}"]
+        node_id = resolver.best(category_phrase(entry))
+        if node_id:
+            entry['node_id'] = node_id
+    return []
+
+
+def load_config(config_path: str = "config.json", use_mock: bool = False, batch: bool = False,
+                env: Optional[Dict[str, str]] = None) -> Dict:
+    """Load, default, env-override and validate the configuration before any network I/O
+    
+    With a `sites` list, every site (overlaid on the top-level settings) is
+    validated; pick one with `site_config`.
+    """
     if not os.path.exists(config_path):
         print(f"Error: Configuration file '{config_path}' not found.")
         print("Please create config.json from config.example.json")
         sys.exit(1)
     
-    with open(config_path, 'r') as f:
-        return json.load(f)
+    try:
+        with open(config_path, 'r') as f:
+            config = json.load(f)
+    except ValueError as e:
+        print(f"Error: Configuration file '{config_path}' is not valid JSON: {e}")
+        sys.exit(1)
+    
+    errors = apply_env_overrides(config, env)
+    for key, (_, default, _) in CONFIG_SCHEMA.items():
+        if default is not None:
+            config.setdefault(key, default)
+    errors.extend(resolve_node_ids(config))
+    
+    sites = config.get('sites')
+    if isinstance(sites, list) and sites:
+        for position, site in enumerate(sites):
+            if not isinstance(site, dict) or not site.get('name'):
+                errors.append(f"sites[{position}]: needs a 'name'")
+                continue
+            errors.extend(f"sites[{position}] ({site['name']}): {error}"
+                          for error in validate_config(site_config(config, site), use_mock, batch))
+    else:
+        errors.extend(validate_config(config, use_mock, batch))
+    
+    if errors:
+        print(f"Error: Invalid configuration in '{config_path}':")
+        for error in errors:
+            print(f"  - {error}")
+        sys.exit(1)
+    return config
+
+
+# Set on deals served by --mock or the mock fallback so they never reach the price history
+MOCK_MARKER = '_mock'
+
+
+def mark_mock(deals: List[Dict]) -> List[Dict]:
+    """Tag demo deals so later stages can tell them from API data"""
+    return [dict(deal, **{MOCK_MARKER: True}) for deal in deals]
 
 
 def get_mock_deals() -> List[Dict]:
@@ -109,12 +476,359 @@ def get_mock_deals() -> List[Dict]:
     ]
 
 
-def fetch_amazon_deals(config: Dict, use_mock: bool = False) -> Optional[List[Dict]]:
+class ResponseCache:
+    """Persistent on-disk cache of API responses keyed by endpoint and params"""
+    
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, ttl: float = DEFAULT_CACHE_TTL,
+                 max_entries: int = DEFAULT_CACHE_MAX_ENTRIES):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stats = {'hits': 0, 'misses': 0, 'revalidated': 0, 'stale': 0}
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def make_key(url: str, params: Dict) -> str:
+        """Build a stable cache key from the endpoint and query parameters"""
+        raw = json.dumps([url, params], sort_keys=True)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+    
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+    
+    def load(self, key: str) -> Optional[Dict]:
+        """Return the cache entry for a key regardless of its age"""
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    def is_fresh(self, entry: Dict) -> bool:
+        """Check whether an entry is younger than the TTL"""
+        return time.time() - entry.get('stored_at', 0) < self.ttl
+    
+    def store(self, key: str, payload, etag: Optional[str] = None,
+              last_modified: Optional[str] = None) -> None:
+        """Atomically write a payload to the cache and evict the oldest entries"""
+        entry = {
+            'stored_at': time.time(),
+            'etag': etag,
+            'last_modified': last_modified,
+            'payload': payload
+        }
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, self._path(key))
+        self._evict()
+    
+    def touch(self, key: str) -> None:
+        """Mark an entry as recently used so eviction keeps it"""
+        try:
+            os.utime(self._path(key))
+        except OSError:
+            pass
+    
+    def _evict(self) -> None:
+        """Remove least recently used entries beyond max_entries"""
+        with self._lock:
+            paths = [
+                os.path.join(self.cache_dir, name)
+                for name in os.listdir(self.cache_dir)
+                if name.endswith('.json')
+            ]
+            if len(paths) <= self.max_entries:
+                return
+            
+            paths.sort(key=lambda path: os.stat(path).st_mtime)
+            for path in paths[:len(paths) - self.max_entries]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+    
+    def record(self, outcome: str) -> None:
+        """Count a cache outcome (hits, misses, revalidated or stale)"""
+        with self._lock:
+            self.stats[outcome] += 1
+    
+    def summary(self) -> str:
+        """Human-readable hit/miss counts for the run summary"""
+        return ", ".join(f"{count} {name}" for name, count in self.stats.items())
+
+
+def build_cache(config: Dict) -> ResponseCache:
+    """Create the response cache described by the configuration"""
+    return ResponseCache(
+        cache_dir=config.get('cache_dir', DEFAULT_CACHE_DIR),
+        ttl=config.get('cache_ttl', DEFAULT_CACHE_TTL),
+        max_entries=config.get('cache_max_entries', DEFAULT_CACHE_MAX_ENTRIES)
+    )
+
+
+class RateLimiter:
+    """Global requests-per-second budget shared by all worker threads"""
+    
+    def __init__(self, requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND):
+        self.interval = 1.0 / requests_per_second if requests_per_second > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+    
+    def acquire(self) -> None:
+        """Block until the caller may send the next request"""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        
+        if slot > now:
+            time.sleep(slot - now)
+    
+    def pause_until(self, resume_at: float) -> None:
+        """Hold back all requests until the given monotonic time"""
+        with self._lock:
+            self._next_slot = max(self._next_slot, resume_at)
+
+
+def pooled_session(pool_connections: int, pool_maxsize: int) -> requests.Session:
+    """Keep-alive session pooling up to `pool_maxsize` connections per host"""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+class ApiClient:
+    """Pooled HTTP session with retries, jittered backoff and rate limiting"""
+    
+    def __init__(self, max_retries: int = DEFAULT_MAX_RETRIES, backoff: float = DEFAULT_RETRY_BACKOFF,
+                 max_backoff: float = DEFAULT_MAX_BACKOFF,
+                 requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND,
+                 pool_size: int = DEFAULT_MAX_WORKERS):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.limiter = RateLimiter(requests_per_second)
+        self.stats = {'requests': 0, 'retries': 0, 'throttled': 0}
+        self._lock = threading.Lock()
+        
+        # One keep-alive pool shared by every category fetch
+        self.session = pooled_session(pool_size, pool_size)
+    
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.stats[name] += 1
+    
+    def _backoff_delay(self, attempt: int) -> float:
+        """Full-jitter exponential backoff"""
+        return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+    
+    @staticmethod
+    def _header_seconds(headers, name: str) -> Optional[float]:
+        value = headers.get(name)
+        try:
+            return max(0.0, float(value)) if value is not None else None
+        except (TypeError, ValueError):
+            return None
+    
+    def _observe_rate_limit(self, headers) -> None:
+        """Pause all workers when RapidAPI reports the quota window is spent"""
+        remaining = self._header_seconds(headers, 'X-RateLimit-Requests-Remaining')
+        if remaining is not None and remaining <= 0:
+            reset = self._header_seconds(headers, 'X-RateLimit-Requests-Reset')
+            if reset:
+                self._count('throttled')
+                self.limiter.pause_until(time.monotonic() + min(reset, self.max_backoff))
+    
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """GET with retries on connection errors, timeouts, 429 and 5xx responses"""
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            self._count('requests')
+            try:
+                response = self.session.get(url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if attempt >= self.max_retries:
+                    raise
+                self._count('retries')
+                time.sleep(self._backoff_delay(attempt))
+                continue
+            
+            self._observe_rate_limit(response.headers)
+            
+            if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                delay = self._header_seconds(response.headers, 'Retry-After')
+                if delay is None:
+                    delay = self._backoff_delay(attempt)
+                self._count('retries')
+                time.sleep(min(delay, self.max_backoff))
+                continue
+            
+            return response
+    
+    def summary(self) -> str:
+        """Human-readable request counts for the run summary"""
+        return ", ".join(f"{count} {name}" for name, count in self.stats.items())
+    
+    def close(self) -> None:
+        self.session.close()
+
+
+def build_client(config: Dict) -> ApiClient:
+    """Create the shared API client described by the configuration"""
+    return ApiClient(
+        max_retries=config.get('max_retries', DEFAULT_MAX_RETRIES),
+        backoff=config.get('retry_backoff', DEFAULT_RETRY_BACKOFF),
+        requests_per_second=config.get('requests_per_second', DEFAULT_REQUESTS_PER_SECOND),
+        pool_size=config.get('max_workers', DEFAULT_MAX_WORKERS)
+    )
+
+
+# Response headers worth keeping in fixtures; request headers (and the API key) never are
+FIXTURE_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Retry-After',
+                   'X-RateLimit-Requests-Remaining', 'X-RateLimit-Requests-Reset')
+
+
+def fixture_path(fixture_dir: str, url: str, params: Optional[Dict]) -> str:
+    """Fixture file for one request, keyed like the response cache"""
+    return os.path.join(fixture_dir, ResponseCache.make_key(url, params or {}) + ".json.gz")
+
+
+class RecordingClient:
+    """Wraps an ApiClient and saves every raw response as a gzipped fixture"""
+    
+    def __init__(self, client: ApiClient, fixture_dir: str):
+        self.client = client
+        self.fixture_dir = fixture_dir
+        self.recorded = 0
+        self._lock = threading.Lock()
+    
+    @property
+    def stats(self) -> Dict[str, int]:
+        return self.client.stats
+    
+    def get(self, url: str, params: Optional[Dict] = None, **kwargs) -> requests.Response:
+        start = time.perf_counter()
+        response = self.client.get(url, params=params, **kwargs)
+        fixture = {
+            'url': url,
+            'params': params or {},
+            'status': response.status_code,
+            'headers': {name: response.headers[name] for name in FIXTURE_HEADERS if name in response.headers},
+            'elapsed': round(time.perf_counter() - start, 6)
+        }
+        # JSON bodies stay readable; anything else is kept byte for byte
+        try:
+            fixture['body'] = response.content.decode('utf-8')
+        except UnicodeDecodeError:
+            fixture['body_base64'] = base64.b64encode(response.content).decode('ascii')
+        raw = json.dumps(fixture, ensure_ascii=False, sort_keys=True).encode('utf-8')
+        # mtime=0 keeps re-recorded identical responses byte-identical
+        write_bytes_atomic(fixture_path(self.fixture_dir, url, params), gzip.compress(raw, mtime=0))
+        with self._lock:
+            self.recorded += 1
+        return response
+    
+    def summary(self) -> str:
+        return f"{self.client.summary()}, {self.recorded} recorded"
+    
+    def close(self) -> None:
+        self.client.close()
+
+
+class ReplayClient:
+    """Serves recorded fixtures instead of the network, at full speed or with recorded latency
+    
+    Requests without a fixture fail like a connection error. Replays run
+    without the cache and with mock_fallback off, so a missing fixture fails
+    the page instead of publishing mock deals.
+    """
+    
+    def __init__(self, fixture_dir: str, latency: bool = False):
+        self.fixture_dir = fixture_dir
+        self.latency = latency
+        self.stats = {'requests': 0, 'replayed': 0, 'missing': 0}
+        self._fixtures: Dict[str, Optional[Dict]] = {}
+        self._lock = threading.Lock()
+    
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.stats[name] += 1
+    
+    def _load(self, path: str) -> Optional[Dict]:
+        with self._lock:
+            if path in self._fixtures:
+                return self._fixtures[path]
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                fixture = json.load(f)
+        except OSError:
+            fixture = None
+        with self._lock:
+            self._fixtures[path] = fixture
+        return fixture
+    
+    def get(self, url: str, params: Optional[Dict] = None, **kwargs) -> requests.Response:
+        self._count('requests')
+        fixture = self._load(fixture_path(self.fixture_dir, url, params))
+        if fixture is None:
+            self._count('missing')
+            raise requests.exceptions.ConnectionError(f"No recorded fixture for {url} {params}")
+        
+        if self.latency:
+            time.sleep(fixture.get('elapsed', 0))
+        self._count('replayed')
+        
+        response = requests.Response()
+        response.status_code = fixture['status']
+        response.headers.update(fixture['headers'])
+        if 'body_base64' in fixture:
+            response._content = base64.b64decode(fixture['body_base64'])
+        else:
+            response._content = fixture['body'].encode('utf-8')
+        response.encoding = 'utf-8'
+        response.url = url
+        return response
+    
+    def summary(self) -> str:
+        return ", ".join(f"{count} {name}" for name, count in self.stats.items())
+    
+    def close(self) -> None:
+        pass
+
+
+def extract_deals(data) -> List[Dict]:
+    """Pull the deals list out of the API response, ignoring anything that isn't a deal object"""
+    # The API response structure may vary, adjust as needed
+    deals = []
+    if isinstance(data, dict):
+        inner = data.get('data')
+        if isinstance(inner, dict):
+            deals = inner.get('deals') or []
+        
+        if not deals:
+            # Try alternative response structures
+            deals = data.get('deals') or []
+    elif isinstance(data, list):
+        deals = data
+    
+    if not isinstance(deals, list):
+        return []
+    return [deal for deal in deals if isinstance(deal, dict)]
+
+
+def fetch_amazon_deals(config: Dict, use_mock: bool = False,
+                       cache: Optional[ResponseCache] = None,
+                       client: Optional[ApiClient] = None,
+                       page: Optional[int] = None) -> Optional[List[Dict]]:
     """Fetch deals from Amazon Real-Time API via RapidAPI"""
     
     if use_mock:
         print("Using mock data for demonstration...")
-        return get_mock_deals()
+        return mark_mock(get_mock_deals())
     
     url = config['api_endpoint']
     
@@ -122,41 +836,500 @@ def fetch_amazon_deals(config: Dict, use_mock: bool = False) -> Optional[List[Di
         'domain': config['domain'],
         'node_id': config['node_id']
     }
+    if page is not None:
+        params['page'] = page
     
-    headers = {
-        'x-rapidapi-host': config['rapidapi_host'],
-        'x-rapidapi-key': config['rapidapi_key']
-    }
+    headers = {'x-rapidapi-host': config['rapidapi_host']}
+    # Replays run without a key; fixtures never depend on one
+    if config.get('rapidapi_key'):
+        headers['x-rapidapi-key'] = config['rapidapi_key']
+    
+    cache_key = None
+    cached = None
+    if cache is not None:
+        cache_key = ResponseCache.make_key(url, params)
+        cached = cache.load(cache_key)
+        if cached is not None and cache.is_fresh(cached):
+            cache.record('hits')
+            cache.touch(cache_key)
+            print(f"Using cached deals for node {params['node_id']}")
+            return extract_deals(cached['payload'])
+        
+        cache.record('misses')
+        if cached is not None:
+            # Ask the API to confirm our stale copy is still current
+            if cached.get('etag'):
+                headers['If-None-Match'] = cached['etag']
+            if cached.get('last_modified'):
+                headers['If-Modified-Since'] = cached['last_modified']
     
     try:
         print(f"Fetching deals from Amazon API...")
-        response = requests.get(url, headers=headers, params=params, timeout=30)
+        http_get = client.get if client is not None else requests.get
+        with METRICS.timed('http_request'):
+            response = http_get(url, headers=headers, params=params, timeout=30)
+        METRICS.count('api_calls')
+        if isinstance(response.content, (bytes, bytearray)):
+            METRICS.count('bytes_received', len(response.content))
+        
+        if cached is not None and response.status_code == 304:
+            cache.record('revalidated')
+            cache.store(cache_key, cached['payload'], cached.get('etag'), cached.get('last_modified'))
+            print(f"Cached deals still current for node {params['node_id']}")
+            return extract_deals(cached['payload'])
+        
         response.raise_for_status()
         
-        data = response.json()
+        with METRICS.timed('json_decode'):
+            data = response.json()
         print(f"Successfully fetched data from API")
         
-        # The API response structure may vary, adjust as needed
-        deals = data.get('data', {}).get('deals', [])
+        deals = extract_deals(data)
         
-        if not deals:
-            # Try alternative response structures
-            deals = data.get('deals', [])
-        
-        if not deals and isinstance(data, list):
-            deals = data
+        if cache is not None and deals:
+            cache.store(cache_key, data, response.headers.get('ETag'), response.headers.get('Last-Modified'))
             
         return deals
     
     except requests.exceptions.RequestException as e:
         print(f"Error fetching deals: {e}")
+        if cached is not None:
+            cache.record('stale')
+            METRICS.count('stale_fallbacks')
+            print("Serving last good cached deals...")
+            return extract_deals(cached['payload'])
+        if not config.get('mock_fallback', False):
+            print("Mock fallback disabled, not publishing placeholder deals")
+            return None
+        METRICS.count('mock_fallbacks')
         print("Falling back to mock data...")
-        return get_mock_deals()
+        return mark_mock(get_mock_deals())
     except json.JSONDecodeError as e:
         print(f"Error parsing JSON response: {e}")
         return None
 
 
+@dataclass
+class Deal:
+    """Normalized deal record with parsed numeric fields"""
+    __slots__ = ('asin', 'title', 'price', 'price_text', 'list_price', 'currency',
+                 'rating', 'reviews', 'url', 'image', 'lowest_price_30d', 'previous_price', 'mock')
+    
+    asin: str
+    title: str
+    price: Optional[float]
+    price_text: str
+    list_price: Optional[float]
+    currency: str
+    rating: Optional[float]
+    reviews: Optional[int]
+    url: str
+    image: str
+    # Filled in from the price history store, when one is in use
+    lowest_price_30d: Optional[float]
+    previous_price: Optional[float]
+    # Demo data standing in for the API; never stored as real observations
+    mock: bool
+    
+    @property
+    def discount(self) -> Optional[float]:
+        """Fractional discount versus the list price, when both are known"""
+        if self.price is None or not self.list_price or self.list_price <= self.price:
+            return None
+        return 1 - self.price / self.list_price
+    
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+# Every known API response key mapped to (field, priority); lower priority wins.
+# Covers the RapidAPI deals shapes as well as the fill-template.js output format.
+DEAL_FIELD_ALIASES = {
+    'product_asin': ('asin', 0),
+    'asin': ('asin', 1),
+    'product_title': ('title', 0),
+    'deal_title': ('title', 1),
+    'title': ('title', 2),
+    'product_price': ('price', 0),
+    'deal_price': ('price', 1),
+    'price': ('price', 2),
+    'product_original_price': ('list_price', 0),
+    'list_price': ('list_price', 1),
+    'original_price': ('list_price', 2),
+    'currency': ('currency', 0),
+    'product_star_rating': ('rating', 0),
+    'rating': ('rating', 1),
+    'stars': ('rating', 2),
+    'product_num_ratings': ('reviews', 0),
+    'reviews_count': ('reviews', 1),
+    'total_reviews': ('reviews', 2),
+    'reviews': ('reviews', 3),
+    'product_url': ('url', 0),
+    'deal_url': ('url', 1),
+    'url': ('url', 2),
+    'product_photo': ('image', 0),
+    'deal_photo': ('image', 1),
+    'thumbnail': ('image', 2),
+    'image': ('image', 3),
+}
+
+# Deal fields that must be strings; other types from the API are ignored
+DEAL_TEXT_FIELDS = frozenset(('asin', 'title', 'currency', 'url', 'image'))
+
+CURRENCY_SYMBOLS = {'USD': '$', 'GBP': '£', 'EUR': '€', 'CAD': 'CA$', 'AUD': 'A$', 'INR': '₹', 'JPY': '¥'}
+SYMBOL_CURRENCIES = {'$': 'USD', '£': 'GBP', '€': 'EUR', '₹': 'INR', '¥': 'JPY'}
+
+ASIN_PATTERN = re.compile(r'/(?:dp|gp/product|gp/aw/d)/([A-Z0-9]{10})(?![A-Z0-9])')
+NUMBER_PATTERN = re.compile(r'\d+(?:\.\d+)?')
+
+
+def extract_asin(url: str) -> str:
+    """Pull the ASIN out of /dp/, /gp/product/ and mobile /gp/aw/d/ product links"""
+    match = ASIN_PATTERN.search(url or '')
+    return match.group(1) if match else ''
+
+
+def canonical_url(url: str, asin: str = '') -> str:
+    """Reduce an Amazon product link to https://<host>/dp/<ASIN>
+    
+    Drops title slugs, /ref= path segments, query strings and any existing
+    affiliate tag so the same product always gets the same URL. Links that
+    aren't on an Amazon host or carry no ASIN are returned unchanged.
+    """
+    if not url:
+        return url
+    host = urlsplit(url).netloc.lower()
+    asin = asin or extract_asin(url)
+    if not asin or 'amazon.' not in host:
+        return url
+    return f"https://{host}/dp/{asin}"
+
+
+def product_key(deal: 'Deal') -> str:
+    """Identity used to spot the same product across categories and runs"""
+    return deal.asin or deal.url
+
+
+def parse_number(value) -> Optional[float]:
+    """Parse numbers like 4.5, "4.5", "$1,299.99" or "4.5 out of 5 stars" """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if not isinstance(value, str):
+        return None
+    match = NUMBER_PATTERN.search(value.replace(',', ''))
+    return float(match.group()) if match else None
+
+
+def parse_count(value) -> Optional[int]:
+    """Parse review counts like 1000, "1000" or "34,521" into ints"""
+    number = parse_number(value)
+    return int(number) if number is not None else None
+
+
+def parse_price(value) -> Tuple[Optional[float], Optional[str]]:
+    """Parse a price string, number or {amount/current_price/value, currency} object"""
+    if isinstance(value, dict):
+        currency = value.get('currency')
+        for key in ('amount', 'current_price', 'value'):
+            if key in value:
+                return parse_number(value[key]), currency
+        return None, currency
+    
+    currency = None
+    if isinstance(value, str):
+        currency = SYMBOL_CURRENCIES.get(value.strip()[:1])
+    return parse_number(value), currency
+
+
+def format_price(amount: Optional[float], currency: str) -> str:
+    """Format a parsed price for display"""
+    if amount is None:
+        return 'N/A'
+    symbol = CURRENCY_SYMBOLS.get(currency)
+    return f"{symbol}{amount:,.2f}" if symbol else f"{amount:,.2f} {currency}"
+
+
+def normalize_deal(raw: Union[Dict, Deal]) -> Deal:
+    """Map any known API deal shape onto a Deal in a single pass over its keys"""
+    if isinstance(raw, Deal):
+        return raw
+    
+    resolved = {}
+    for key, value in raw.items():
+        alias = DEAL_FIELD_ALIASES.get(key)
+        if alias is None or value is None or value == '':
+            continue
+        field, priority = alias
+        # A malformed text field falls back to its default instead of breaking later stages
+        if field in DEAL_TEXT_FIELDS and not isinstance(value, str):
+            continue
+        current = resolved.get(field)
+        if current is None or priority < current[0]:
+            resolved[field] = (priority, value)
+    
+    values = {field: value for field, (_, value) in resolved.items()}
+    
+    price, price_currency = parse_price(values.get('price'))
+    list_price, _ = parse_price(values.get('list_price'))
+    currency = values.get('currency') or price_currency or 'USD'
+    
+    raw_price = values.get('price')
+    price_text = raw_price if isinstance(raw_price, str) else format_price(price, currency)
+    
+    url = values.get('url', '')
+    asin = values.get('asin', '') or extract_asin(url)
+    url = canonical_url(url, asin)
+    
+    return Deal(
+        asin=asin,
+        title=values.get('title', 'Product'),
+        price=price,
+        price_text=price_text,
+        list_price=list_price,
+        currency=currency,
+        rating=parse_number(values.get('rating')),
+        reviews=parse_count(values.get('reviews')),
+        url=url,
+        image=values.get('image', ''),
+        lowest_price_30d=None,
+        previous_price=None,
+        mock=bool(raw.get(MOCK_MARKER))
+    )
+
+
+def normalize_deals(deals: Iterable[Union[Dict, Deal]]) -> Iterator[Deal]:
+    """Lazily normalize a stream of raw deals"""
+    elapsed = 0.0
+    calls = 0
+    try:
+        for deal in deals:
+            start = time.perf_counter()
+            normalized = normalize_deal(deal)
+            elapsed += time.perf_counter() - start
+            calls += 1
+            yield normalized
+    finally:
+        if calls:
+            METRICS.add_time('normalize', elapsed, calls)
+
+
+def iter_amazon_deals(config: Dict, use_mock: bool = False,
+                      cache: Optional[ResponseCache] = None,
+                      client: Optional[ApiClient] = None) -> Iterator[Deal]:
+    """Lazily yield normalized deals page by page until the page budget or candidate target is reached
+    
+    `max_pages` (default 1) bounds the number of API requests and `target_candidates`
+    stops early once enough deals have been seen. Only one page is held at a time,
+    so consumers can start ranking before the last page arrives. A product seen on
+    an earlier page is skipped, and paging stops at a page that adds no new products
+    (an endpoint ignoring `page` would otherwise repeat page one).
+    """
+    max_pages = config.get('max_pages', 1)
+    target = config.get('target_candidates')
+    
+    yielded = 0
+    seen = set()
+    for page in range(1, max_pages + 1):
+        # Later pages must never be padded out with mock data
+        page_config = config if page == 1 else dict(config, mock_fallback=False)
+        deals = fetch_amazon_deals(page_config, use_mock, cache, client,
+                                   page=page if max_pages > 1 else None)
+        if not deals:
+            return
+        
+        new = 0
+        for deal in normalize_deals(deals):
+            key = product_key(deal)
+            if key:
+                if key in seen:
+                    METRICS.count('duplicate_candidates')
+                    continue
+                seen.add(key)
+            new += 1
+            yield deal
+            yielded += 1
+            if target and yielded >= target:
+                return
+        
+        if use_mock or not new:
+            return
+
+
+class PriceHistory:
+    """Append-only SQLite store of price and rating snapshots per ASIN
+    
+    Every snapshot written during one run shares the run's start time, so
+    "since last run" means "the latest snapshot older than this run".
+    """
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS snapshots (
+            asin TEXT NOT NULL,
+            observed_at REAL NOT NULL,
+            category TEXT NOT NULL DEFAULT '',
+            price REAL,
+            list_price REAL,
+            currency TEXT,
+            rating REAL,
+            reviews INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS idx_snapshots_asin_time ON snapshots (asin, observed_at);
+    """
+    
+    BATCH_SIZE = 500
+    # Stays under SQLite's default bound-parameter limit
+    QUERY_CHUNK = 500
+    
+    def __init__(self, path: str = DEFAULT_HISTORY_PATH, run_started: Optional[float] = None):
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self.run_started = run_started if run_started is not None else time.time()
+        self._lock = threading.Lock()
+        # ASINs already snapshotted this run, so products listed under several categories are written once
+        self._recorded = set()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(self.SCHEMA)
+    
+    def close(self) -> None:
+        self._conn.close()
+    
+    def start_run(self, run_started: Optional[float] = None) -> None:
+        """Begin a new run on the same connection, as the daemon does every refresh"""
+        with self._lock:
+            self.run_started = run_started if run_started is not None else time.time()
+            self._recorded.clear()
+    
+    def record(self, deals: Iterable[Deal], category: str = '') -> int:
+        """Bulk insert one snapshot per ASIN not yet recorded this run; returns rows written"""
+        with self._lock:
+            rows = []
+            for deal in deals:
+                if not deal.asin or deal.mock or deal.asin in self._recorded:
+                    continue
+                self._recorded.add(deal.asin)
+                rows.append((deal.asin, self.run_started, category, deal.price, deal.list_price,
+                             deal.currency, deal.rating, deal.reviews))
+            if rows:
+                with self._conn:
+                    self._conn.executemany(
+                        "INSERT INTO snapshots (asin, observed_at, category, price, list_price, currency, rating, reviews) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        rows
+                    )
+        if rows:
+            METRICS.count('history_rows', len(rows))
+        return len(rows)
+    
+    def record_stream(self, deals: Iterable[Union[Dict, Deal]], category: str = '') -> Iterator[Deal]:
+        """Pass deals through unchanged while recording them in batches"""
+        batch = []
+        try:
+            for deal in normalize_deals(deals):
+                batch.append(deal)
+                if len(batch) >= self.BATCH_SIZE:
+                    self.record(batch, category)
+                    batch = []
+                yield deal
+        finally:
+            self.record(batch, category)
+    
+    def _query_by_asin(self, sql: str, asins: List[str], *params) -> Dict[str, float]:
+        results = {}
+        with self._lock:
+            for start in range(0, len(asins), self.QUERY_CHUNK):
+                chunk = asins[start:start + self.QUERY_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                for asin, value in self._conn.execute(sql.format(placeholders=placeholders), (*chunk, *params)):
+                    results[asin] = value
+        return results
+    
+    def lowest_prices(self, asins: List[str], days: int = 30) -> Dict[str, float]:
+        """Lowest recorded price per ASIN over the `days` before this run"""
+        return self._query_by_asin(
+            "SELECT asin, MIN(price) FROM snapshots "
+            "WHERE asin IN ({placeholders}) AND price IS NOT NULL AND observed_at >= ? AND observed_at < ? "
+            "GROUP BY asin",
+            asins, self.run_started - days * 86400, self.run_started
+        )
+    
+    def previous_prices(self, asins: List[str]) -> Dict[str, float]:
+        """Most recent price per ASIN recorded before this run"""
+        return self._query_by_asin(
+            "SELECT s.asin, s.price FROM snapshots s "
+            "WHERE s.asin IN ({placeholders}) AND s.price IS NOT NULL AND s.observed_at = ("
+            "    SELECT MAX(observed_at) FROM snapshots "
+            "    WHERE asin = s.asin AND price IS NOT NULL AND observed_at < ?"
+            ")",
+            asins, self.run_started
+        )
+    
+    def annotate(self, deals: List[Deal]) -> List[Deal]:
+        """Fill in lowest_price_30d and previous_price on each deal from history"""
+        asins = list(dict.fromkeys(deal.asin for deal in deals if deal.asin))
+        if not asins:
+            return deals
+        
+        with METRICS.timed('history_query'):
+            lowest = self.lowest_prices(asins)
+            previous = self.previous_prices(asins)
+        for deal in deals:
+            deal.lowest_price_30d = lowest.get(deal.asin)
+            deal.previous_price = previous.get(deal.asin)
+        return deals
+
+
+def price_note(deal: Deal) -> str:
+    """Short history-based note shown under the price, or '' when nothing stands out
+    
+    A new 30-day low must be strictly below every earlier snapshot, so a price
+    that simply hasn't moved since the last run earns no label.
+    """
+    if deal.price is None:
+        return ''
+    if deal.lowest_price_30d is not None and deal.price < deal.lowest_price_30d:
+        return "Lowest price in 30 days"
+    if deal.previous_price is not None and deal.price < deal.previous_price:
+        return f"Price dropped from {format_price(deal.previous_price, deal.currency)}"
+    return ''
+
+
+class ProductIndex:
+    """Persistent record of which category page each product was last shown on
+    
+    Batch runs use it to keep a product listed under several nodes on the same
+    page from run to run instead of letting it hop between categories.
+    """
+    
+    # Products not seen for this long are forgotten when the index is saved
+    RETENTION_DAYS = 90
+    
+    def __init__(self, path: str = DEFAULT_PRODUCT_INDEX_PATH, run_started: Optional[float] = None):
+        self.path = path
+        self.run_started = run_started if run_started is not None else time.time()
+        self.entries: Dict[str, List] = {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            pass
+    
+    def owner(self, key: str) -> Optional[str]:
+        """Category slug the product was last shown on, if any"""
+        entry = self.entries.get(key)
+        return entry[0] if entry else None
+    
+    def claim(self, key: str, slug: str) -> None:
+        """Record that the product is shown on `slug` this run"""
+        self.entries[key] = [slug, self.run_started]
+    
+    def save(self) -> None:
+        """Drop expired products and write the index atomically"""
+        cutoff = self.run_started - self.RETENTION_DAYS * 86400
+        self.entries = {key: entry for key, entry in self.entries.items() if entry[1] >= cutoff}
+        write_file(self.path, json.dumps(self.entries, separators=(',', ':'), sort_keys=True))
+
+
 def add_affiliate_tag(url: str, affiliate_id: str) -> str:
     """Add Amazon affiliate tag to product URL"""
     if not url:
@@ -171,92 +1344,370 @@ def add_affiliate_tag(url: str, affiliate_id: str) -> str:
     return f"{url}{separator}tag={affiliate_id}"
 
 
-def generate_html(deals: List[Dict], config: Dict) -> str:
-    """Generate HTML page from deals data"""
+DEFAULT_RANKING_WEIGHTS = {
+    'rating': 1.0,
+    'reviews': 1.0,
+    'discount': 1.0,
+    'price_band': 0.5,
+    'relevance': 2.0
+}
+
+# Review counts at or above this saturate the log-scaled review score
+REVIEWS_SATURATION = 100000
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens with a naive plural strip so 'tablets' matches 'tablet'"""
+    return [
+        token[:-1] if len(token) > 3 and token.endswith('s') and not token.endswith('ss') else token
+        for token in TOKEN_PATTERN.findall(text.lower())
+    ]
+
+
+def ranking_keywords(config: Dict) -> List[str]:
+    """Keyword tokens describing the niche, from `keywords` (list or string), else from `niche`
     
-    # Prepare deals with affiliate links
-    processed_deals = []
-    for i, deal in enumerate(deals[:10]):  # Top 10 only
-        product_url = deal.get('product_url', deal.get('url', '#'))
-        
-        # Add affiliate tag to URL
-        if product_url != '#':
-            product_url = add_affiliate_tag(product_url, config['amazon_affiliate_id'])
-        
-        processed_deals.append({
-            'rank': i + 1,
-            'title': deal.get('product_title', deal.get('title', 'Product')),
-            'price': deal.get('product_price', deal.get('price', 'N/A')),
-            'image': deal.get('product_photo', deal.get('image', '')),
-            'url': product_url,
-            'rating': deal.get('product_star_rating', deal.get('rating', 'N/A')),
-            'reviews': deal.get('product_num_ratings', deal.get('reviews', 'N/A'))
-        })
+    Page titles aren't used: words like "Top 10 Electronics Deals" rarely appear
+    in product titles, so filtering on them would empty the page.
+    """
+    keywords = config.get('ranking', {}).get('keywords', config.get('keywords'))
+    if keywords is None:
+        keywords = config.get('niche') or []
+    if isinstance(keywords, str):
+        keywords = [keywords]
+    return sorted({token for keyword in keywords for token in tokenize(keyword)})
+
+
+MAX_NGRAM = 3
+
+
+def ngrams(tokens: List[str], max_n: int = MAX_NGRAM) -> Iterator[str]:
+    """Every run of 1..max_n consecutive tokens, space-joined"""
+    for n in range(1, max_n + 1):
+        for start in range(len(tokens) - n + 1):
+            yield " ".join(tokens[start:start + n])
+
+
+class CategoryResolver:
+    """Maps niche or search phrases to browse node IDs through an n-gram inverted index
     
-    html = f"""<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Top 10 Amazon Deals</title>
-    <style>
-        * {{
-            margin: 0;
-            padding: 0;
-            box-sizing: border-box;
-        }}
-        
-        body {{
-            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            min-height: 100vh;
-            padding: 20px;
-        }}
-        
-        .container {{
-            max-width: 1200px;
-            margin: 0 auto;
-        }}
+    Each node's name and keyword phrases are indexed whole, weighted by their
+    length, and word by word at a lower weight; terms shared by several nodes
+    count for less. A lookup only touches the postings of the phrase's own
+    n-grams and is memoized, so resolving thousands of niches never scans the
+    whole taxonomy.
+    """
+    
+    # Weight of a single word taken from a multi-word keyword
+    PARTIAL_WEIGHT = 0.25
+    # Below this the best match rests on stray words, so no node is picked
+    MIN_SCORE = 0.5
+    
+    def __init__(self, nodes: List[Dict], memo_size: int = 4096):
+        self.nodes = nodes
+        weights: Dict[str, Dict[int, float]] = {}
         
-        header {{
-            text-align: center;
-            color: white;
-            padding: 40px 20px;
-        }}
+        def add(term: str, position: int, weight: float) -> None:
+            postings = weights.setdefault(term, {})
+            postings[position] = max(postings.get(position, 0.0), weight)
         
-        h1 {{
-            font-size: 3em;
-            margin-bottom: 10px;
-            text-shadow: 2px 2px 4px rgba(0,0,0,0.3);
-        }}
+        for position, node in enumerate(nodes):
+            for phrase in [node['name']] + list(node.get('keywords', [])):
+                tokens = tokenize(phrase)
+                if not tokens:
+                    continue
+                add(" ".join(tokens), position, float(len(tokens)))
+                if len(tokens) > 1:
+                    for token in tokens:
+                        add(token, position, self.PARTIAL_WEIGHT)
         
-        .subtitle {{
-            font-size: 1.2em;
+        # Terms shared by many nodes say less about which one is meant
+        self.index = {
+            term: [(position, weight / len(postings)) for position, weight in postings.items()]
+            for term, postings in weights.items()
+        }
+        self._lookup = functools.lru_cache(maxsize=memo_size)(self._score)
+    
+    @classmethod
+    def from_file(cls, path: str) -> 'CategoryResolver':
+        """Build a resolver from a taxonomy JSON file with a `nodes` list"""
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f)['nodes'])
+    
+    def _score(self, tokens: Tuple[str, ...]) -> Tuple[Tuple[str, float], ...]:
+        scores: Dict[int, float] = {}
+        for term in ngrams(list(tokens)):
+            for position, weight in self.index.get(term, ()):
+                scores[position] = scores.get(position, 0.0) + weight
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return tuple((str(self.nodes[position]['node_id']), round(score, 4)) for position, score in ranked)
+    
+    def resolve(self, phrase: str, limit: int = 3) -> List[Tuple[str, float]]:
+        """Best-matching (node_id, score) pairs for a phrase, highest first"""
+        return list(self._lookup(tuple(tokenize(phrase)))[:limit])
+    
+    def best(self, phrase: str) -> Optional[str]:
+        """The single best node ID for a phrase, or None when nothing matches well enough"""
+        matches = self._lookup(tuple(tokenize(phrase)))
+        return matches[0][0] if matches and matches[0][1] >= self.MIN_SCORE else None
+
+
+@functools.lru_cache(maxsize=None)
+def load_taxonomy(path: str = DEFAULT_TAXONOMY_PATH) -> CategoryResolver:
+    """Load and index a taxonomy file once per process"""
+    return CategoryResolver.from_file(path)
+
+
+def score_deal(deal: Deal, weights: Dict[str, float], keywords: List[str],
+               price_min: Optional[float] = None, price_max: Optional[float] = None) -> Tuple[float, float]:
+    """Return (score, relevance) for a deal; each component is scaled to 0..1"""
+    relevance = 0.0
+    if keywords:
+        title_tokens = set(tokenize(deal.title))
+        relevance = sum(1 for keyword in keywords if keyword in title_tokens) / len(keywords)
+    
+    in_band = (
+        deal.price is not None
+        and (price_min is None or deal.price >= price_min)
+        and (price_max is None or deal.price <= price_max)
+    )
+    
+    components = {
+        'rating': (deal.rating or 0.0) / 5.0,
+        'reviews': min(1.0, math.log10(1 + (deal.reviews or 0)) / math.log10(1 + REVIEWS_SATURATION)),
+        'discount': deal.discount or 0.0,
+        'price_band': 1.0 if in_band else 0.0,
+        'relevance': relevance
+    }
+    score = sum(weights.get(name, 0.0) * value for name, value in components.items())
+    return score, relevance
+
+
+def rank_deals(deals: Iterable[Union[Dict, Deal]], config: Dict,
+               limit: Optional[int] = None) -> List[Deal]:
+    """Score, filter and pick the top `limit` deals with a heap-based partial sort
+    
+    Optional `ranking` configuration: `weights` (merged over the defaults), `keywords`,
+    `min_relevance`, `min_rating`, `price_min` and `price_max`. When keywords are set,
+    deals below `min_relevance` (default: any keyword match) are dropped.
+    """
+    if limit is None:
+        limit = config.get('top_n', DEFAULT_TOP_N)
+    
+    ranking = config.get('ranking', {})
+    weights = dict(DEFAULT_RANKING_WEIGHTS, **ranking.get('weights', {}))
+    keywords = ranking_keywords(config)
+    min_relevance = ranking.get('min_relevance', 1e-9 if keywords else 0.0)
+    min_rating = ranking.get('min_rating')
+    price_min = ranking.get('price_min')
+    price_max = ranking.get('price_max')
+    
+    def candidates() -> Iterator[Tuple[float, int, Deal]]:
+        for index, deal in enumerate(normalize_deals(deals)):
+            if min_rating is not None and (deal.rating is None or deal.rating < min_rating):
+                continue
+            score, relevance = score_deal(deal, weights, keywords, price_min, price_max)
+            if relevance < min_relevance:
+                continue
+            # Negated index keeps API order for equal scores
+            yield score, -index, deal
+    
+    return [deal for _, _, deal in heapq.nlargest(limit, candidates(), key=lambda item: item[:2])]
+
+
+IMAGE_DIR = "images"
+IMAGE_WIDTHS = (160, 320, 480)
+IMAGE_QUALITY = 80
+IMAGE_SIZES = "(max-width: 640px) 100vw, 300px"
+# Cards above the fold load eagerly so they don't delay the largest contentful paint
+EAGER_IMAGE_COUNT = 3
+
+# Amazon size tokens such as ._AC_SL1500_. before the extension
+AMAZON_SIZE_PATTERN = re.compile(r'\._[A-Z0-9_,]+_\.(jpg|jpeg|png|webp)$', re.IGNORECASE)
+
+
+@dataclass
+class ImageAsset:
+    """Locally served thumbnail set for one remote product image"""
+    __slots__ = ('src', 'variants')
+    
+    src: str
+    variants: Tuple[Tuple[int, str], ...]
+
+
+@dataclass
+class PageAssets:
+    """Local assets a page links to instead of remote URLs, and how the page is emitted"""
+    images: Dict[str, ImageAsset]
+    # Relative path from the page back to the output root, e.g. '../'
+    prefix: str
+    # Shared stylesheet path relative to the output root; the CSS is inlined when unset
+    stylesheet: Optional[str] = None
+    minify: bool = False
+
+
+def image_asset_name(url: str) -> str:
+    """Stable file name stem for a remote image URL"""
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()[:16]
+
+
+def amazon_resized_url(url: str, width: int) -> Optional[str]:
+    """Ask Amazon's image CDN for a `width`-pixel variant, if the URL carries a size token"""
+    if not AMAZON_SIZE_PATTERN.search(url):
+        return None
+    return AMAZON_SIZE_PATTERN.sub(rf'._AC_SL{width}_.\1', url)
+
+
+def download_bytes(url: str, session: Optional[requests.Session] = None) -> Optional[bytes]:
+    """Download a URL, returning None on any HTTP or network error"""
+    http_get = session.get if session is not None else requests.get
+    try:
+        response = http_get(url, timeout=30)
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        print(f"Error downloading image {url}: {e}")
+        return None
+    
+    METRICS.count('image_bytes_received', len(response.content))
+    return response.content
+
+
+def build_image_asset(url: str, output_dir: str, session: Optional[requests.Session] = None,
+                      widths: Tuple[int, ...] = IMAGE_WIDTHS) -> Optional[ImageAsset]:
+    """Produce resized local thumbnails for one image, reusing files from earlier runs"""
+    name = image_asset_name(url)
+    extension = 'webp' if Image is not None else 'jpg'
+    variants = tuple(
+        (width, f"{IMAGE_DIR}/{name}-{width}.{extension}") for width in widths
+    )
+    
+    def asset(available) -> Optional[ImageAsset]:
+        if not available:
+            return None
+        # Default src is the middle size; srcset lets the browser pick
+        return ImageAsset(src=available[len(available) // 2][1], variants=tuple(available))
+    
+    if all(os.path.exists(os.path.join(output_dir, path)) for _, path in variants):
+        METRICS.count('images_cached')
+        return asset(variants)
+    
+    os.makedirs(os.path.join(output_dir, IMAGE_DIR), exist_ok=True)
+    available = []
+    
+    if Image is not None:
+        original = download_bytes(url, session)
+        if original is None:
+            return None
+        try:
+            with Image.open(io.BytesIO(original)) as image:
+                image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+                for width, path in variants:
+                    thumbnail = image.copy()
+                    thumbnail.thumbnail((width, width))
+                    buffer = io.BytesIO()
+                    thumbnail.save(buffer, 'WEBP', quality=IMAGE_QUALITY)
+                    write_bytes_atomic(os.path.join(output_dir, path), buffer.getvalue())
+                    available.append((width, path))
+        except (OSError, ValueError) as e:
+            print(f"Error resizing image {url}: {e}")
+            return None
+    else:
+        for width, path in variants:
+            variant_url = amazon_resized_url(url, width)
+            if variant_url is None:
+                break
+            content = download_bytes(variant_url, session)
+            if content is None:
+                break
+            write_bytes_atomic(os.path.join(output_dir, path), content)
+            available.append((width, path))
+    
+    METRICS.count('images_processed')
+    return asset(available)
+
+
+def fetch_images(deals: Iterable[Union[Dict, Deal]], output_dir: str,
+                 max_workers: int = DEFAULT_MAX_WORKERS) -> Dict[str, ImageAsset]:
+    """Concurrently build local thumbnails for every distinct image URL among `deals`
+    
+    Downloads use their own session, so they aren't throttled by, counted
+    against or recorded with the API client's requests.
+    """
+    urls = list(dict.fromkeys(deal.image for deal in normalize_deals(deals) if deal.image))
+    if not urls:
+        return {}
+    
+    workers = max(1, min(max_workers, len(urls)))
+    # Image CDN downloads stay apart from the rate-limited API client
+    session = pooled_session(workers, workers)
+    try:
+        with METRICS.timed('images'):
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                assets = pool.map(lambda url: build_image_asset(url, output_dir, session), urls)
+                return {url: asset for url, asset in zip(urls, assets) if asset is not None}
+    finally:
+        session.close()
+
+
+PAGE_CSS = """        * {
+            margin: 0;
+            padding: 0;
+            box-sizing: border-box;
+        }
+        
+        body {
+            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
+            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+            min-height: 100vh;
+            padding: 20px;
+        }
+        
+        .container {
+            max-width: 1200px;
+            margin: 0 auto;
+        }
+        
+        header {
+            text-align: center;
+            color: white;
+            padding: 40px 20px;
+        }
+        
+        h1 {
+            font-size: 3em;
+            margin-bottom: 10px;
+            text-shadow: 2px 2px 4px rgba(0,0,0,0.3);
+        }
+        
+        .subtitle {
+            font-size: 1.2em;
             opacity: 0.9;
-        }}
+        }
         
-        .deals-grid {{
+        .deals-grid {
             display: grid;
             grid-template-columns: repeat(auto-fit, minmax(300px, 1fr));
             gap: 30px;
             padding: 20px;
-        }}
+        }
         
-        .deal-card {{
+        .deal-card {
             background: white;
             border-radius: 15px;
             overflow: hidden;
             box-shadow: 0 10px 30px rgba(0,0,0,0.3);
             transition: transform 0.3s, box-shadow 0.3s;
             position: relative;
-        }}
+        }
         
-        .deal-card:hover {{
+        .deal-card:hover {
             transform: translateY(-10px);
             box-shadow: 0 15px 40px rgba(0,0,0,0.4);
-        }}
+        }
         
-        .rank-badge {{
+        .rank-badge {
             position: absolute;
             top: 15px;
             left: 15px;
@@ -272,21 +1723,21 @@ def generate_html(deals: List[Dict], config: Dict) -> str:
             font-weight: bold;
             z-index: 1;
             box-shadow: 0 3px 10px rgba(0,0,0,0.3);
-        }}
+        }
         
-        .deal-image {{
+        .deal-image {
             width: 100%;
             height: 250px;
             object-fit: contain;
             background: #f8f8f8;
             padding: 20px;
-        }}
+        }
         
-        .deal-content {{
+        .deal-content {
             padding: 20px;
-        }}
+        }
         
-        .deal-title {{
+        .deal-title {
             font-size: 1.1em;
             font-weight: 600;
             color: #232f3e;
@@ -296,22 +1747,29 @@ def generate_html(deals: List[Dict], config: Dict) -> str:
             -webkit-line-clamp: 2;
             -webkit-box-orient: vertical;
             overflow: hidden;
-        }}
+        }
         
-        .deal-price {{
+        .deal-price {
             font-size: 1.8em;
             color: #b12704;
             font-weight: bold;
             margin-bottom: 10px;
-        }}
+        }
+        
+        .deal-price-note {
+            color: #007600;
+            font-weight: 600;
+            font-size: 0.9em;
+            margin: -5px 0 10px;
+        }
         
-        .deal-rating {{
+        .deal-rating {
             color: #666;
             margin-bottom: 15px;
             font-size: 0.9em;
-        }}
+        }
         
-        .deal-button {{
+        .deal-button {
             display: block;
             width: 100%;
             padding: 12px;
@@ -322,56 +1780,84 @@ def generate_html(deals: List[Dict], config: Dict) -> str:
             border-radius: 8px;
             font-weight: 600;
             transition: background 0.3s;
-        }}
+        }
         
-        .deal-button:hover {{
+        .deal-button:hover {
             background: #e88900;
-        }}
+        }
         
-        footer {{
+        footer {
             text-align: center;
             color: white;
             padding: 40px 20px;
             opacity: 0.9;
-        }}
+        }
         
-        .timestamp {{
+        .timestamp {
             font-size: 0.9em;
             margin-top: 10px;
-        }}
-    </style>
-</head>
+        }
+"""
+
+# Page skeleton split around the stylesheet so the CSS is never re-formatted
+PAGE_HEAD_TEMPLATE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>{title}</title>
+"""
+
+STYLE_OPEN = """    <style>
+"""
+
+STYLE_CLOSE = """    </style>
+"""
+
+STYLESHEET_LINK_TEMPLATE = """    <link rel="stylesheet" href="{href}">
+"""
+
+PAGE_BODY_TEMPLATE = """</head>
 <body>
     <div class="container">
         <header>
-            <h1>🏆 Top 10 Amazon Deals</h1>
+            <h1>🏆 {title}</h1>
             <p class="subtitle">Best deals curated just for you</p>
         </header>
         
         <div class="deals-grid">
 """
-    
-    # Add deals
-    for deal in processed_deals:
-        html += f"""
+
+# Inline SVG shown when a product image fails to load; needs no network or extra file
+MISSING_IMAGE = (
+    "data:image/svg+xml,%3Csvg xmlns=%22http://www.w3.org/2000/svg%22 width=%22300%22 height=%22250%22%3E"
+    "%3Crect width=%22100%25%22 height=%22100%25%22 fill=%22%23eee%22/%3E"
+    "%3Ctext x=%2250%25%22 y=%2250%25%22 text-anchor=%22middle%22 fill=%22%23999%22 "
+    "font-family=%22sans-serif%22%3ENo image%3C/text%3E%3C/svg%3E"
+)
+
+CARD_TEMPLATE = """
             <div class="deal-card">
-                <div class="rank-badge">#{deal['rank']}</div>
-                <img src="{deal['image']}" alt="{deal['title']}" class="deal-image" onerror="this.src='https://via.placeholder.com/300x250?text=No+Image'">
+                <div class="rank-badge">#{rank}</div>
+                <img src="{image}"{srcset} alt="{title}" class="deal-image" loading="{loading}" decoding="async" onerror="this.onerror=null;this.removeAttribute('srcset');this.src='{missing_image}'">
                 <div class="deal-content">
-                    <h3 class="deal-title">{deal['title']}</h3>
-                    <div class="deal-price">{deal['price']}</div>
-                    <div class="deal-rating">⭐ {deal['rating']} ({deal['reviews']} reviews)</div>
-                    <a href="{deal['url']}" target="_blank" class="deal-button">View Deal on Amazon</a>
+                    <h3 class="deal-title">{title}</h3>
+                    <div class="deal-price">{price}</div>{price_note}
+                    <div class="deal-rating">⭐ {rating} ({reviews} reviews)</div>
+                    <a href="{url}" target="_blank" class="deal-button">View Deal on Amazon</a>
                 </div>
             </div>
 """
-    
-    html += f"""
+
+PRICE_NOTE_TEMPLATE = """
+                    <div class="deal-price-note">{note}</div>"""
+
+PAGE_FOOTER_TEMPLATE = """
         </div>
         
         <footer>
             <p>Deals fetched from Amazon via RapidAPI</p>
-            <p class="timestamp">Generated on {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</p>
+            <p class="timestamp">Generated on {generated_at}</p>
             <p style="font-size: 0.8em; margin-top: 20px;">
                 As an Amazon Associate, we earn from qualifying purchases.
             </p>
@@ -380,47 +1866,1561 @@ def generate_html(deals: List[Dict], config: Dict) -> str:
 </body>
 </html>
 """
+
+DEFAULT_TOP_N = 10
+WRITE_BUFFER_SIZE = 64 * 1024
+
+
+def prepare_deals(deals: Iterable[Union[Dict, Deal]], config: Dict,
+                  limit: int = DEFAULT_TOP_N, assets: Optional[PageAssets] = None) -> Iterator[Dict]:
+    """Lazily pick the first `limit` deals and resolve display fields with affiliate links"""
+    for i, deal in enumerate(islice(normalize_deals(deals), limit)):
+        # Add affiliate tag to URL
+        product_url = add_affiliate_tag(deal.url, config['amazon_affiliate_id']) if deal.url else '#'
+        
+        image = deal.image
+        srcset = ''
+        local = assets.images.get(deal.image) if assets is not None else None
+        if local is not None:
+            image = assets.prefix + local.src
+            srcset = ", ".join(f"{assets.prefix}{path} {width}w" for width, path in local.variants)
+        
+        yield {
+            'rank': i + 1,
+            'title': deal.title,
+            'price': deal.price_text,
+            'price_note': price_note(deal),
+            'image': image,
+            'srcset': srcset,
+            'url': product_url,
+            'rating': f"{deal.rating:.1f}" if deal.rating is not None else 'N/A',
+            'reviews': f"{deal.reviews:,}" if deal.reviews is not None else 'N/A'
+        }
+
+
+def render_card(deal: Dict) -> str:
+    """Render one deal card with every field HTML-escaped"""
+    escape = html_lib.escape
+    srcset = ''
+    if deal.get('srcset'):
+        srcset = f' srcset="{escape(deal["srcset"], quote=True)}" sizes="{IMAGE_SIZES}"'
+    return CARD_TEMPLATE.format(
+        rank=deal['rank'],
+        image=escape(str(deal['image']), quote=True),
+        srcset=srcset,
+        loading='eager' if deal['rank'] <= EAGER_IMAGE_COUNT else 'lazy',
+        title=escape(str(deal['title']), quote=True),
+        price=escape(str(deal['price'])),
+        price_note=PRICE_NOTE_TEMPLATE.format(note=escape(deal['price_note'])) if deal.get('price_note') else '',
+        rating=escape(str(deal['rating'])),
+        reviews=escape(str(deal['reviews'])),
+        url=escape(str(deal['url']), quote=True),
+        missing_image=MISSING_IMAGE
+    )
+
+
+def iter_html(deals: Iterable[Dict], config: Dict, limit: Optional[int] = None,
+              assets: Optional[PageAssets] = None) -> Iterator[str]:
+    """Yield the HTML page chunk by chunk so it never has to be held in memory"""
+    if limit is None:
+        limit = config.get('top_n', DEFAULT_TOP_N)
+    
+    page_title = html_lib.escape(config.get('title', f'Top {limit} Amazon Deals'))
+    
+    def chunks() -> Iterator[str]:
+        yield PAGE_HEAD_TEMPLATE.format(title=page_title)
+        if assets is not None and assets.stylesheet:
+            yield STYLESHEET_LINK_TEMPLATE.format(href=html_lib.escape(assets.prefix + assets.stylesheet, quote=True))
+        else:
+            yield STYLE_OPEN
+            yield PAGE_CSS
+            yield STYLE_CLOSE
+        yield PAGE_BODY_TEMPLATE.format(title=page_title)
+        for deal in prepare_deals(deals, config, limit, assets):
+            yield render_card(deal)
+        yield PAGE_FOOTER_TEMPLATE.format(generated_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
     
-    return html
+    if assets is not None and assets.minify:
+        return map(minify_html, chunks())
+    return chunks()
 
 
-def main():
-    """Main function to run the generator"""
+def generate_html(deals: List[Dict], config: Dict, limit: Optional[int] = None,
+                  assets: Optional[PageAssets] = None) -> str:
+    """Generate HTML page from deals data"""
+    return "".join(iter_html(deals, config, limit, assets))
+
+
+STYLESHEET_DIR = "assets"
+
+CSS_COMMENT_PATTERN = re.compile(r'/\*.*?\*/', re.DOTALL)
+CSS_SPACE_PATTERN = re.compile(r'\s*([{}:;,>])\s*')
+HTML_TAG_GAP_PATTERN = re.compile(r'>\s*\n\s*|\s*\n\s*<')
+HTML_NEWLINE_PATTERN = re.compile(r'\s*\n\s*')
+
+
+def minify_css(css: str) -> str:
+    """Strip comments and insignificant whitespace from a stylesheet"""
+    css = CSS_COMMENT_PATTERN.sub('', css)
+    css = CSS_SPACE_PATTERN.sub(r'\1', css)
+    css = re.sub(r'\s+', ' ', css)
+    return css.replace(';}', '}').strip()
+
+
+def minify_html(html: str) -> str:
+    """Drop the indentation and line breaks between tags; works on individual chunks
+    
+    Every chunk the renderer yields starts and ends at a line boundary, so the
+    whitespace at its edges is always indentation and can be stripped.
+    """
+    html = HTML_TAG_GAP_PATTERN.sub(lambda match: match.group().strip(), html)
+    return HTML_NEWLINE_PATTERN.sub(' ', html).strip()
+
+
+def write_compressed_siblings(path: str) -> List[str]:
+    """Write precompressed .gz (and .br when Brotli is installed) copies next to a file"""
+    with open(path, 'rb') as f:
+        content = f.read()
+    
+    written = [path + '.gz']
+    write_bytes_atomic(path + '.gz', gzip.compress(content, compresslevel=9, mtime=0))
+    if brotli is not None:
+        write_bytes_atomic(path + '.br', brotli.compress(content))
+        written.append(path + '.br')
+    return written
+
+
+def update_compressed_siblings(path: str, optimize: bool) -> List[str]:
+    """Refresh a rewritten file's .gz/.br copies, or delete them when not optimizing
+    
+    Hosts that serve precompressed files (e.g. nginx gzip_static) would otherwise
+    keep serving the copy from the last optimized run. Returns the paths written.
+    """
+    if optimize:
+        return write_compressed_siblings(path)
+    for sibling in (path + '.gz', path + '.br'):
+        if os.path.exists(sibling):
+            os.unlink(sibling)
+    return []
+
+
+def write_stylesheet(output_dir: str) -> str:
+    """Write the minified, content-hashed shared stylesheet; returns its path relative to output_dir"""
+    css = minify_css(PAGE_CSS)
+    digest = hashlib.sha256(css.encode('utf-8')).hexdigest()[:10]
+    relative_path = f"{STYLESHEET_DIR}/top10.{digest}.css"
+    path = os.path.join(output_dir, relative_path)
+    
+    # The hash is in the name, so an existing file is already up to date
+    if not os.path.exists(path):
+        write_file(path, css)
+        write_compressed_siblings(path)
+    return relative_path
+
+
+def build_page_assets(output_dir: str, prefix: str, images: Optional[Dict[str, ImageAsset]] = None,
+                      optimize: bool = False) -> Optional[PageAssets]:
+    """Describe the local assets for pages `prefix` away from the output root"""
+    if images is None and not optimize:
+        return None
+    return PageAssets(
+        images=images or {},
+        prefix=prefix,
+        stylesheet=write_stylesheet(output_dir) if optimize else None,
+        minify=optimize
+    )
+
+
+# Changes whenever any part of the page skeleton changes, forcing a full re-render
+TEMPLATE_VERSION = hashlib.sha256("".join((
+    PAGE_HEAD_TEMPLATE, STYLE_OPEN, PAGE_CSS, STYLE_CLOSE, STYLESHEET_LINK_TEMPLATE,
+    PAGE_BODY_TEMPLATE, CARD_TEMPLATE, PRICE_NOTE_TEMPLATE, PAGE_FOOTER_TEMPLATE
+)).encode('utf-8')).hexdigest()[:12]
+
+MANIFEST_FILE = ".manifest.json"
+MANIFEST_INDEX_KEY = "__index__"
+
+
+def page_fingerprint(deals: Iterable[Dict], config: Dict, limit: Optional[int] = None,
+                     assets: Optional[PageAssets] = None) -> str:
+    """Hash everything that affects a page's content except the generation timestamp"""
+    if limit is None:
+        limit = config.get('top_n', DEFAULT_TOP_N)
+    
+    payload = {
+        'template': TEMPLATE_VERSION,
+        'title': config.get('title', f'Top {limit} Amazon Deals'),
+        'deals': list(prepare_deals(deals, config, limit, assets)),
+        'stylesheet': assets.stylesheet if assets is not None else None,
+        'minify': assets.minify if assets is not None else False
+    }
+    raw = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def load_manifest(output_dir: str) -> Dict[str, str]:
+    """Load the content-hash manifest from a previous run"""
+    try:
+        with open(os.path.join(output_dir, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(output_dir: str, manifest: Dict[str, str]) -> None:
+    """Persist the content-hash manifest for the next run"""
+    write_file(os.path.join(output_dir, MANIFEST_FILE), json.dumps(manifest, indent=2, sort_keys=True))
+
+
+def render_if_changed(path: str, fingerprint: str, chunks: Iterable[str],
+                      manifest: Dict[str, str], key: str) -> bool:
+    """Write a page only when its fingerprint differs from the manifest; returns True if written"""
+    if manifest.get(key) == fingerprint and os.path.exists(path):
+        METRICS.count('pages_skipped')
+        return False
+    
+    write_atomic(path, chunks)
+    manifest[key] = fingerprint
+    METRICS.count('pages_written')
+    return True
+
+
+SITEMAP_FILE = "sitemap.xml"
+ATOM_FEED_FILE = "feed.xml"
+JSON_FEED_FILE = "feed.json"
+FEED_STATE_FILE = ".feeds.json"
+FEED_MAX_ITEMS = 50
+
+
+def iso_timestamp(seconds: float) -> str:
+    """W3C/RFC 3339 UTC timestamp used by sitemaps and both feed formats"""
+    return datetime.fromtimestamp(seconds, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def deal_signature(deal: Deal) -> str:
+    """Short hash of the fields whose change makes a deal worth announcing again"""
+    return hashlib.sha256(json.dumps([deal.title, deal.price, deal.list_price]).encode('utf-8')).hexdigest()[:12]
+
+
+def load_feed_state(output_dir: str) -> Dict:
+    """Load the deal signatures and feed items written by a previous run"""
+    try:
+        with open(os.path.join(output_dir, FEED_STATE_FILE), 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        state = {}
+    state.setdefault('deals', {})
+    state.setdefault('items', [])
+    return state
+
+
+def update_feed_state(state: Dict, site_url: str, slug: str, deals: List[Deal],
+                      config: Dict, updated: str) -> int:
+    """Queue feed items for the page's new or changed deals; returns how many were added"""
+    previous = state['deals'].get(slug, {})
+    current = {}
+    items = []
+    for deal in deals:
+        key = product_key(deal)
+        signature = deal_signature(deal)
+        current[key] = signature
+        if previous.get(key) == signature:
+            continue
+        items.append({
+            'id': f"{site_url}/{slug}/#{key}-{signature}",
+            'title': deal.title,
+            'url': add_affiliate_tag(deal.url, config['amazon_affiliate_id']) if deal.url else f"{site_url}/{slug}/",
+            'summary': " · ".join(filter(None, (deal.price_text, price_note(deal), config.get('title', slug)))),
+            'image': deal.image,
+            'page': slug,
+            'updated': updated
+        })
+    
+    state['deals'][slug] = current
+    state['items'] = (items + state['items'])[:FEED_MAX_ITEMS]
+    return len(items)
+
+
+def iter_sitemap(pages: List[Tuple[str, str]]) -> Iterator[str]:
+    """Stream a sitemap.xml for (absolute URL, lastmod) pairs"""
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+    for loc, lastmod in pages:
+        yield f"  <url><loc>{html_lib.escape(loc)}</loc><lastmod>{lastmod}</lastmod></url>\n"
+    yield '</urlset>\n'
+
+
+def iter_atom_feed(site_url: str, title: str, items: List[Dict]) -> Iterator[str]:
+    """Stream an Atom feed of the queued deal items, newest first"""
+    escape = html_lib.escape
+    updated = items[0]['updated'] if items else iso_timestamp(0)
+    yield (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<feed xmlns="http://www.w3.org/2005/Atom">\n'
+        f"  <id>{escape(site_url)}/</id>\n"
+        f"  <title>{escape(title)}</title>\n"
+        # RFC 4287 4.1.1: entries carry no author, so the feed must
+        f"  <author><name>{escape(title)}</name></author>\n"
+        f"  <updated>{updated}</updated>\n"
+        f'  <link href="{escape(site_url)}/"/>\n'
+        f'  <link rel="self" href="{escape(site_url)}/{ATOM_FEED_FILE}"/>\n'
+    )
+    for item in items:
+        yield (
+            "  <entry>\n"
+            f"    <id>{escape(item['id'])}</id>\n"
+            f"    <title>{escape(item['title'])}</title>\n"
+            f"    <updated>{item['updated']}</updated>\n"
+            f'    <link href="{escape(item["url"])}"/>\n'
+            f"    <summary>{escape(item['summary'])}</summary>\n"
+            "  </entry>\n"
+        )
+    yield '</feed>\n'
+
+
+def json_feed(site_url: str, title: str, items: List[Dict]) -> str:
+    """Render a JSON Feed 1.1 document of the queued deal items"""
+    return json.dumps({
+        'version': 'https://jsonfeed.org/version/1.1',
+        'title': title,
+        'home_page_url': f"{site_url}/",
+        'feed_url': f"{site_url}/{JSON_FEED_FILE}",
+        'items': [
+            {
+                'id': item['id'],
+                'url': item['url'],
+                'title': item['title'],
+                'summary': item['summary'],
+                'image': item['image'] or None,
+                'date_modified': item['updated'],
+                'tags': [item['page']]
+            }
+            for item in items
+        ]
+    }, ensure_ascii=False, indent=2)
+
+
+def write_site_feeds(output_dir: str, config: Dict, pages: List[Tuple[Dict, List[Deal]]],
+                     manifest: Dict[str, str], optimize: bool = False,
+                     now: Optional[float] = None, listed: Optional[List[Dict]] = None) -> List[str]:
+    """Write sitemap.xml, feed.xml and feed.json for the rendered category pages
+    
+    Each file is only rewritten when its content changes, and the feeds carry
+    just the deals that were new or changed in recent runs, so an unchanged run
+    leaves every file (and its Last-Modified/ETag) alone. The sitemap covers
+    `listed` (default: the rendered categories). Returns written paths.
+    """
+    if listed is None:
+        listed = [category for category, _ in pages]
+    site_url = config['site_url'].rstrip('/')
+    site_title = config.get('site_title', 'Top 10 Amazon Deals')
+    updated = iso_timestamp(now if now is not None else time.time())
+    
+    # A page's mtime only moves when change detection rewrote it
+    sitemap_pages = []
+    for path, url in [(os.path.join(output_dir, "index.html"), f"{site_url}/")] + [
+        (os.path.join(output_dir, category['slug'], "index.html"), f"{site_url}/{category['slug']}/")
+        for category in listed
+    ]:
+        if os.path.exists(path):
+            sitemap_pages.append((url, iso_timestamp(os.path.getmtime(path))))
+    
+    state = load_feed_state(output_dir)
+    previous_deals = state['deals'].copy()
+    added = 0
+    for category, deals in pages:
+        added += update_feed_state(state, site_url, category['slug'], deals,
+                                   category_config(config, category), updated)
+    if added:
+        METRICS.count('feed_items', added)
+    
+    items = state['items']
+    outputs = [
+        (SITEMAP_FILE, list(iter_sitemap(sitemap_pages))),
+        (ATOM_FEED_FILE, list(iter_atom_feed(site_url, site_title, items))),
+        (JSON_FEED_FILE, [json_feed(site_url, site_title, items)])
+    ]
+    written = []
+    for name, chunks in outputs:
+        path = os.path.join(output_dir, name)
+        fingerprint = hashlib.sha256("".join(chunks).encode('utf-8')).hexdigest()
+        if render_if_changed(path, fingerprint, chunks, manifest, name):
+            update_compressed_siblings(path, optimize)
+            written.append(path)
+    
+    if added or state['deals'] != previous_deals:
+        write_file(os.path.join(output_dir, FEED_STATE_FILE), json.dumps(state, separators=(',', ':')))
+    return written
+
+
+# Hosts that only ever serve stand-in images
+PLACEHOLDER_IMAGE_HOSTS = ('via.placeholder.com', 'placehold.co', 'placehold.it', 'dummyimage.com')
+# Only these mean the product or image is gone; 403/429/5xx are often bot blocking or blips
+DEAD_STATUS_CODES = {404, 410}
+# Servers that refuse HEAD get a streamed GET instead
+HEAD_UNSUPPORTED_CODES = {400, 403, 405, 501}
+
+
+class LinkChecker:
+    """Concurrent product and image URL checker with per-host limits and a TTL cache
+    
+    Each URL gets a HEAD request (falling back to a streamed GET when HEAD is
+    refused) from a bounded thread pool, with at most `per_host` requests in
+    flight per host. A URL is dead (False) on 404/410 or a placeholder host,
+    alive (True) on any other < 400 status, and unknown (None) otherwise; only
+    known results are cached.
+    """
+    
+    def __init__(self, cache_path: Optional[str] = DEFAULT_LINK_CACHE_PATH, ttl: float = DEFAULT_LINK_CACHE_TTL,
+                 max_workers: int = 32, per_host: int = 4, timeout: float = 5.0):
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.max_workers = max_workers
+        self.per_host = per_host
+        self.timeout = timeout
+        self.stats = {'checked': 0, 'cached': 0, 'dead': 0, 'unknown': 0}
+        self._lock = threading.Lock()
+        self._host_slots: Dict[str, threading.BoundedSemaphore] = {}
+        self.entries: Dict[str, List] = {}
+        if cache_path:
+            try:
+                with open(cache_path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError):
+                pass
+        
+        self.session = pooled_session(max_workers, per_host)
+    
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.stats[name] += 1
+    
+    def _slot(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.per_host)
+            return self._host_slots[host]
+    
+    def check(self, url: str) -> Optional[bool]:
+        """Check one URL over the network, ignoring the cache"""
+        host = urlsplit(url).netloc.lower()
+        if host in PLACEHOLDER_IMAGE_HOSTS:
+            return False
+        
+        with self._slot(host):
+            self._count('checked')
+            try:
+                response = self.session.head(url, allow_redirects=True, timeout=self.timeout)
+                if response.status_code in HEAD_UNSUPPORTED_CODES:
+                    response = self.session.get(url, allow_redirects=True, timeout=self.timeout, stream=True)
+                    response.close()
+            except requests.exceptions.RequestException:
+                return None
+        
+        if response.status_code in DEAD_STATUS_CODES:
+            return False
+        return True if response.status_code < 400 else None
+    
+    def check_many(self, urls: Iterable[str]) -> Dict[str, Optional[bool]]:
+        """Check each distinct URL once, serving fresh results from the cache"""
+        now = time.time()
+        results = {}
+        pending = []
+        for url in dict.fromkeys(url for url in urls if url):
+            entry = self.entries.get(url)
+            if entry is not None and now - entry[1] < self.ttl:
+                results[url] = entry[0]
+                self._count('cached')
+            else:
+                pending.append(url)
+        
+        if pending:
+            with METRICS.timed('link_check'):
+                with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(pending)))) as pool:
+                    for url, alive in zip(pending, pool.map(self.check, pending)):
+                        results[url] = alive
+                        if alive is None:
+                            self._count('unknown')
+                        else:
+                            self.entries[url] = [alive, now]
+        
+        dead = sum(1 for alive in results.values() if alive is False)
+        with self._lock:
+            self.stats['dead'] += dead
+        return results
+    
+    def prune(self, results: Dict[str, List[Deal]]) -> Dict[str, List[Deal]]:
+        """Drop deals whose product page or image is dead, keeping ones that couldn't be checked"""
+        deals = [deal for ranked in results.values() if ranked for deal in ranked]
+        status = self.check_many([deal.url for deal in deals] + [deal.image for deal in deals])
+        
+        pruned = {}
+        for slug, ranked in results.items():
+            if not ranked:
+                pruned[slug] = ranked
+                continue
+            pruned[slug] = [
+                deal for deal in ranked
+                if status.get(deal.url) is not False and status.get(deal.image) is not False
+            ]
+            METRICS.count('dead_deals_dropped', len(ranked) - len(pruned[slug]))
+        return pruned
+    
+    def save(self) -> None:
+        """Drop expired results and persist the cache"""
+        if not self.cache_path:
+            return
+        cutoff = time.time() - self.ttl
+        self.entries = {url: entry for url, entry in self.entries.items() if entry[1] >= cutoff}
+        write_file(self.cache_path, json.dumps(self.entries, separators=(',', ':')))
+    
+    def summary(self) -> str:
+        """Human-readable check counts for the run summary"""
+        return ", ".join(f"{count} {name}" for name, count in self.stats.items())
+    
+    def close(self) -> None:
+        self.session.close()
+
+
+def build_link_checker(config: Dict) -> LinkChecker:
+    """Create the link checker described by the configuration"""
+    return LinkChecker(
+        cache_path=config.get('link_cache_path', DEFAULT_LINK_CACHE_PATH),
+        ttl=config.get('link_cache_ttl', DEFAULT_LINK_CACHE_TTL),
+        per_host=config.get('link_check_per_host', 4)
+    )
+
+
+def category_config(config: Dict, category: Dict) -> Dict:
+    """Overlay a single category entry on top of the base configuration"""
+    if not category.get('slug') or not category.get('node_id'):
+        raise ValueError(f"Category entry needs 'slug' and 'node_id': {category}")
+    
+    merged = dict(config)
+    merged.update(category)
+    # Ranking settings merge key by key, so a category can set just its keywords and keep the base weights
+    if isinstance(config.get('ranking'), dict):
+        ranking = dict(config['ranking'])
+        if 'keywords' in category:
+            # The category's own keyword list beats keywords inherited from the base ranking
+            ranking.pop('keywords', None)
+        if isinstance(category.get('ranking'), dict):
+            ranking.update(category['ranking'])
+        merged['ranking'] = ranking
+    # A niche describes one page's products; the base one belongs to single-page runs
+    for key in ('niche', 'search_query'):
+        if key not in category:
+            merged.pop(key, None)
+    merged.setdefault('title', category['slug'])
+    return merged
+
+
+def fetch_ranked_deals(config: Dict, use_mock: bool = False,
+                       cache: Optional[ResponseCache] = None,
+                       client: Optional[ApiClient] = None,
+                       history: Optional[PriceHistory] = None,
+                       limit: Optional[int] = None) -> List[Deal]:
+    """Stream every fetched page straight into the ranking stage
+    
+    With a price history store, every fetched deal is recorded on the way
+    through and the ranked deals are annotated with their price history.
+    """
+    deals = iter_amazon_deals(config, use_mock, cache, client)
+    if history is None:
+        return rank_deals(deals, config, limit)
+    
+    ranked = rank_deals(history.record_stream(deals, config.get('slug', '')), config, limit)
+    return history.annotate(ranked)
+
+
+def fetch_categories(config: Dict, categories: List[Dict], use_mock: bool = False,
+                     max_workers: int = DEFAULT_MAX_WORKERS,
+                     cache: Optional[ResponseCache] = None,
+                     client: Optional[ApiClient] = None,
+                     history: Optional[PriceHistory] = None,
+                     spares: int = 0) -> Dict[str, List[Deal]]:
+    """Fetch and rank deals for many categories concurrently using a bounded thread pool
+    
+    `spares` extra deals are ranked per category to stand in for cross-category duplicates.
+    A category whose fetch raises is logged and comes back as None, like one with no deals,
+    so one bad payload can't take down the rest of the batch.
+    """
+    if not categories:
+        return {}
+    
+    workers = max(1, min(max_workers, len(categories)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for category in categories:
+            merged = category_config(config, category)
+            limit = merged.get('top_n', DEFAULT_TOP_N) + spares
+            futures[category['slug']] = pool.submit(fetch_ranked_deals, merged, use_mock, cache, client, history, limit)
+        
+        results = {}
+        for slug, future in futures.items():
+            try:
+                results[slug] = future.result()
+            except Exception as e:
+                print(f"✗ Category '{slug}' failed: {type(e).__name__}: {e}")
+                METRICS.count('category_errors')
+                results[slug] = None
+        return results
+
+
+def dedupe_categories(results: Dict[str, List[Deal]], limits: Dict[str, int],
+                      products: Optional[ProductIndex] = None) -> Dict[str, List[Deal]]:
+    """Trim each category's ranked deals so every product appears on at most one page
+    
+    Categories are visited in `limits` order and the first to list a product
+    keeps it, except that a product stays on the page it was shown on last run
+    when that page would show it again. Lower-ranked spares fill the gaps.
+    """
+    # Products each category would show if it had no competition
+    wanted = {}
+    for slug, limit in limits.items():
+        for deal in (results.get(slug) or [])[:limit]:
+            wanted.setdefault(product_key(deal), set()).add(slug)
+    
+    claimed = {}
+    mock_keys = set()
+    deduped = {}
+    for slug, limit in limits.items():
+        picked = []
+        for deal in results.get(slug) or []:
+            if len(picked) >= limit:
+                break
+            key = product_key(deal)
+            if key in claimed:
+                METRICS.count('duplicates_dropped')
+                continue
+            previous = products.owner(key) if products is not None else None
+            if previous and previous != slug and previous in wanted.get(key, ()):
+                METRICS.count('duplicates_dropped')
+                continue
+            claimed[key] = slug
+            if deal.mock:
+                mock_keys.add(key)
+            picked.append(deal)
+        deduped[slug] = picked
+    
+    if products is not None:
+        # Page assignments for mock deals would outlive the outage that produced them
+        for key, slug in claimed.items():
+            if key not in mock_keys:
+                products.claim(key, slug)
+    return deduped
+
+
+SEARCH_DIR = "search"
+SEARCH_MANIFEST_FILE = "index.json"
+SEARCH_STATE_FILE = ".state.json"
+# Terms are sharded by their first characters; shorter terms aren't indexed
+SEARCH_PREFIX_LENGTH = 2
+
+
+class SearchIndex:
+    """Inverted index over product titles, niches and ASINs, split into prefix shards
+    
+    Each shard (search/<prefix>.json) maps its terms to document refs
+    ("<slug>:<n>") and carries those documents, so a query term needs exactly
+    one small fetch. Per-category postings are kept in search/.state.json:
+    updating a category only rewrites the shards whose terms it gained or lost,
+    and an unchanged category touches nothing.
+    """
+    
+    def __init__(self, search_dir: str):
+        self.search_dir = search_dir
+        try:
+            with open(os.path.join(search_dir, SEARCH_STATE_FILE), 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+        self.categories: Dict[str, Dict] = state.get('categories', {})
+        self.shards: Dict[str, str] = state.get('shards', {})
+        self._dirty = set()
+    
+    @staticmethod
+    def category_entry(config: Dict, deals: List[Deal]) -> Dict:
+        """Documents and term postings for one category's deals"""
+        slug = config['slug']
+        # Same niche the _data file stores; page titles ("Top 10 ... Deals") would match everything
+        niche_terms = tokenize(config.get('niche') or slug)
+        docs = []
+        terms: Dict[str, List[int]] = {}
+        for number, deal in enumerate(deals):
+            url = add_affiliate_tag(deal.url, config['amazon_affiliate_id']) if deal.url else f"{slug}/"
+            docs.append([deal.title, url, deal.price_text])
+            words = tokenize(deal.title) + niche_terms + ([deal.asin.lower()] if deal.asin else [])
+            for term in sorted(set(words)):
+                if len(term) >= SEARCH_PREFIX_LENGTH:
+                    terms.setdefault(term, []).append(number)
+        return {'docs': docs, 'terms': terms}
+    
+    def update(self, config: Dict, deals: List[Deal]) -> bool:
+        """Replace a category's entries; returns True if anything changed"""
+        slug = config['slug']
+        entry = self.category_entry(config, deals)
+        previous = self.categories.get(slug)
+        if previous == entry:
+            return False
+        if previous is not None:
+            # Its docs are renumbered, so every shard it appeared in changes
+            self._dirty.update(term[:SEARCH_PREFIX_LENGTH] for term in previous['terms'])
+        self._dirty.update(term[:SEARCH_PREFIX_LENGTH] for term in entry['terms'])
+        self.categories[slug] = entry
+        return True
+    
+    def remove(self, slug: str) -> bool:
+        """Drop a category's entries; returns True if it was indexed"""
+        previous = self.categories.pop(slug, None)
+        if previous is None:
+            return False
+        self._dirty.update(term[:SEARCH_PREFIX_LENGTH] for term in previous['terms'])
+        return True
+    
+    def retain(self, slugs: Iterable[str]) -> None:
+        """Drop every category not in `slugs`"""
+        keep = set(slugs)
+        for slug in [slug for slug in self.categories if slug not in keep]:
+            self.remove(slug)
+    
+    def build_shards(self, prefixes: Iterable[str]) -> Dict[str, Dict]:
+        """Assemble the shards for `prefixes` in one pass over the postings"""
+        wanted = set(prefixes)
+        shards: Dict[str, Dict] = {}
+        for slug in sorted(self.categories):
+            entry = self.categories[slug]
+            for term, numbers in entry['terms'].items():
+                prefix = term[:SEARCH_PREFIX_LENGTH]
+                if prefix not in wanted:
+                    continue
+                shard = shards.setdefault(prefix, {'terms': {}, 'docs': {}})
+                refs = shard['terms'].setdefault(term, [])
+                for number in numbers:
+                    ref = f"{slug}:{number}"
+                    refs.append(ref)
+                    shard['docs'][ref] = [slug] + entry['docs'][number]
+        return shards
+    
+    def save(self) -> List[str]:
+        """Rewrite the changed shards, the shard manifest and the state; returns written paths"""
+        if not self._dirty and os.path.exists(os.path.join(self.search_dir, SEARCH_STATE_FILE)):
+            return []
+        
+        written = []
+        removed = False
+        shards = self.build_shards(self._dirty)
+        for prefix in sorted(self._dirty):
+            path = os.path.join(self.search_dir, f"{prefix}.json")
+            shard = shards.get(prefix)
+            if shard is None:
+                if self.shards.pop(prefix, None) is not None:
+                    removed = True
+                    if os.path.exists(path):
+                        os.unlink(path)
+                continue
+            content = json.dumps(shard, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+            digest = hashlib.sha256(content.encode('utf-8')).hexdigest()[:10]
+            if self.shards.get(prefix) == digest and os.path.exists(path):
+                continue
+            write_file(path, content)
+            self.shards[prefix] = digest
+            written.append(path)
+        METRICS.count('search_shards_written', len(written))
+        
+        # Shard hashes double as cache-busting versions for the browser
+        manifest = os.path.join(self.search_dir, SEARCH_MANIFEST_FILE)
+        if written or removed or not os.path.exists(manifest):
+            write_file(manifest, json.dumps({'prefix_length': SEARCH_PREFIX_LENGTH, 'shards': self.shards},
+                                            sort_keys=True, separators=(',', ':')))
+            written.append(manifest)
+        write_file(os.path.join(self.search_dir, SEARCH_STATE_FILE),
+                   json.dumps({'categories': self.categories, 'shards': self.shards},
+                              ensure_ascii=False, separators=(',', ':')))
+        self._dirty = set()
+        return written
+
+
+# Mirrors tokenize() and SearchIndex: fetch each query term's shard once, prefix-match, intersect.
+# The prefix length comes from the published manifest; failed fetches are retried on the next keystroke.
+SEARCH_SCRIPT = """
+    <form id="search" role="search" onsubmit="return false">
+        <input type="search" placeholder="Search all deals" aria-label="Search all deals" autocomplete="off">
+        <ul></ul>
+    </form>
+    <script>
+    (function () {
+        var form = document.getElementById('search'), input = form.querySelector('input'), list = form.querySelector('ul');
+        var manifest = null, shards = {}, latest = 0;
+        function getJSON(url) {
+            return fetch(url).then(function (r) {
+                if (!r.ok) { throw new Error(url + ': ' + r.status); }
+                return r.json();
+            });
+        }
+        function loadManifest() {
+            manifest = manifest || getJSON('search/index.json').catch(function (e) { manifest = null; throw e; });
+            return manifest;
+        }
+        function shard(m, prefix) {
+            if (!m.shards[prefix]) { return Promise.resolve(null); }
+            shards[prefix] = shards[prefix] || getJSON('search/' + prefix + '.json?v=' + m.shards[prefix]).catch(function () {
+                delete shards[prefix];
+                return null;
+            });
+            return shards[prefix];
+        }
+        function terms(query, length) {
+            return (query.toLowerCase().match(/[a-z0-9]+/g) || []).map(function (t) {
+                return t.length > 3 && t.slice(-1) === 's' && t.slice(-2) !== 'ss' ? t.slice(0, -1) : t;
+            }).filter(function (t) { return t.length >= length; });
+        }
+        function show(results) {
+            list.textContent = '';
+            if (!results.length) { return; }
+            Object.keys(results[0]).filter(function (ref) {
+                return results.every(function (hits) { return ref in hits; });
+            }).slice(0, 20).forEach(function (ref) {
+                var doc = results[0][ref], item = document.createElement('li'), link = document.createElement('a');
+                link.href = doc[2];
+                link.textContent = doc[1] + ' (' + doc[3] + ')';
+                item.appendChild(link);
+                list.appendChild(item);
+            });
+        }
+        input.addEventListener('input', function () {
+            var request = ++latest;
+            loadManifest().then(function (m) {
+                return Promise.all(terms(input.value, m.prefix_length).map(function (term) {
+                    return shard(m, term.slice(0, m.prefix_length)).then(function (s) {
+                        var hits = {};
+                        if (s) { Object.keys(s.terms).forEach(function (t) {
+                            if (t.indexOf(term) === 0) { s.terms[t].forEach(function (ref) { hits[ref] = s.docs[ref]; }); }
+                        }); }
+                        return hits;
+                    });
+                }));
+            }).then(function (results) {
+                if (request === latest) { show(results); }
+            }).catch(function () {
+                if (request === latest) { list.textContent = ''; }
+            });
+        });
+    })();
+    </script>"""
+
+
+def generate_index_html(categories: List[Dict], search: bool = False) -> str:
+    """Generate an index page linking to every category page"""
+    links = "".join(
+        f"""
+            <li><a href="{html_lib.escape(category['slug'], quote=True)}/index.html">{html_lib.escape(category.get('title', category['slug']))}</a></li>"""
+        for category in categories
+    )
+    
+    return f"""<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Top 10 Amazon Deals</title>
+</head>
+<body>
+    <h1>🏆 Top 10 Amazon Deals</h1>{SEARCH_SCRIPT if search else ''}
+    <ul>{links}
+    </ul>
+    <p class="timestamp">Generated on {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</p>
+</body>
+</html>
+"""
+
+
+def write_atomic(path: str, chunks: Iterable[str]) -> None:
+    """Stream chunks into a temp file and rename it over `path` once complete"""
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path), suffix='.tmp')
+    render_seconds = 0.0
+    write_seconds = 0.0
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8', buffering=WRITE_BUFFER_SIZE) as f:
+            # Producing chunks is rendering; handing them to the file is writing
+            chunk_iter = iter(chunks)
+            while True:
+                start = time.perf_counter()
+                chunk = next(chunk_iter, None)
+                render_seconds += time.perf_counter() - start
+                if chunk is None:
+                    break
+                start = time.perf_counter()
+                f.write(chunk)
+                write_seconds += time.perf_counter() - start
+            start = time.perf_counter()
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+        write_seconds += time.perf_counter() - start
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    
+    METRICS.add_time('render', render_seconds)
+    METRICS.add_time('write', write_seconds)
+
+
+def write_bytes_atomic(path: str, content: bytes) -> None:
+    """Write binary content via a temp file and rename"""
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def write_file(path: str, content: str) -> None:
+    """Write text content to a file, creating parent directories as needed"""
+    write_atomic(path, (content,))
+
+
+def generate_batch(config: Dict, categories: List[Dict], output_dir: str = DEFAULT_OUTPUT_DIR,
+                   use_mock: bool = False, max_workers: int = DEFAULT_MAX_WORKERS,
+                   cache: Optional[ResponseCache] = None,
+                   client: Optional[ApiClient] = None, force: bool = False,
+                   images: bool = False, optimize: bool = False,
+                   history: Optional[PriceHistory] = None, dedupe: bool = False,
+                   products: Optional[ProductIndex] = None,
+                   index_categories: Optional[List[Dict]] = None,
+                   jekyll_dir: Optional[str] = None,
+                   checker: Optional[LinkChecker] = None,
+                   search: bool = False) -> Dict[str, List[str]]:
+    """Fetch and render every category, writing one page per category plus an index
+    
+    Pages whose deals and template are unchanged since the last run are left untouched.
+    With `dedupe`, a product listed under several categories is shown on only one page.
+    `index_categories` lists the whole site when only some categories are refreshed;
+    their pages from earlier runs stay in the index and sitemap. With `jekyll_dir`,
+    each category's _data file and post stub are written there as well. With a
+    `checker`, deals with dead product or image links are replaced by the next best.
+    With `search`, the listed pages' products are kept in a sharded search index.
+    Returns the lists of written, skipped (unchanged) and failed page paths.
+    """
+    spares = config.get('top_n', DEFAULT_TOP_N) if dedupe or checker is not None else 0
+    results = fetch_categories(config, categories, use_mock=use_mock, max_workers=max_workers,
+                               cache=cache, client=client, history=history, spares=spares)
+    if checker is not None:
+        results = checker.prune(results)
+    if spares:
+        limits = {
+            category['slug']: category_config(config, category).get('top_n', DEFAULT_TOP_N)
+            for category in categories
+        }
+        if dedupe:
+            results = dedupe_categories(results, limits, products)
+        else:
+            results = {slug: deals[:limits[slug]] if deals else deals for slug, deals in results.items()}
+    
+    # One image pass over all categories so shared products are downloaded once
+    image_map = None
+    if images:
+        image_map = fetch_images((deal for deals in results.values() if deals for deal in deals),
+                                 output_dir, max_workers)
+    assets = build_page_assets(output_dir, '../', image_map, optimize)
+    
+    manifest = {} if force else load_manifest(output_dir)
+    summary = {'written': [], 'skipped': [], 'failed': []}
+    rendered = []
+    for category in categories:
+        slug = category['slug']
+        deals = results.get(slug)
+        page_file = os.path.join(output_dir, slug, "index.html")
+        if not deals:
+            print(f"✗ No relevant deals for category '{slug}', skipping")
+            summary['failed'].append(page_file)
+            continue
+        
+        page_config = category_config(config, category)
+        rendered.append(category)
+        if jekyll_dir is not None:
+            for path in write_jekyll_category(jekyll_dir, page_config, deals):
+                print(f"✓ Wrote {path}")
+        if render_if_changed(page_file, page_fingerprint(deals, page_config, assets=assets),
+                             iter_html(deals, page_config, assets=assets), manifest, slug):
+            update_compressed_siblings(page_file, optimize)
+            summary['written'].append(page_file)
+            print(f"✓ Generated {page_file} ({len(deals)} deals)")
+        else:
+            summary['skipped'].append(page_file)
+    
+    listed = rendered
+    if index_categories is not None:
+        rendered_slugs = {category['slug'] for category in rendered}
+        listed = [
+            category for category in index_categories
+            if category['slug'] in rendered_slugs
+            or os.path.exists(os.path.join(output_dir, category['slug'], "index.html"))
+        ]
+    
+    if search:
+        search_index = SearchIndex(os.path.join(output_dir, SEARCH_DIR))
+        for category in rendered:
+            search_index.update(category_config(config, category), results[category['slug']])
+        search_index.retain(category['slug'] for category in listed)
+        shards = search_index.save()
+        if shards:
+            print(f"✓ Updated search index ({len(shards)} files)")
+    
+    index_file = os.path.join(output_dir, "index.html")
+    index_fingerprint = hashlib.sha256(json.dumps(
+        [[[c['slug'], c.get('title', c['slug'])] for c in listed], optimize, search]
+    ).encode('utf-8')).hexdigest()
+    index_html = generate_index_html(listed, search)
+    if optimize:
+        index_html = minify_html(index_html)
+    if render_if_changed(index_file, index_fingerprint, (index_html,), manifest, MANIFEST_INDEX_KEY):
+        update_compressed_siblings(index_file, optimize)
+        summary['written'].append(index_file)
+    else:
+        summary['skipped'].append(index_file)
+    
+    if config.get('site_url'):
+        feeds = write_site_feeds(output_dir, config, [(category, results[category['slug']]) for category in rendered],
+                                 manifest, optimize, listed=listed)
+        if feeds:
+            print(f"✓ Updated {', '.join(os.path.basename(path) for path in feeds)}")
+    
+    save_manifest(output_dir, manifest)
+    summary['index'] = index_file
+    return summary
+
+
+POST_TEMPLATE = "---\nlayout: top10\ndata_file: {slug}\n---\n"
+
+
+def jekyll_product(deal: Deal, rank: int, affiliate_id: str) -> Dict:
+    """One product in the _data/<slug>.json shape the top10 layout reads"""
+    return {
+        'rank': rank,
+        'title': deal.title,
+        'asin': deal.asin,
+        # The layout prints its own "$", so amounts are stored bare
+        'price': f"{deal.price:.2f}" if deal.price is not None else 'N/A',
+        'currency': deal.currency,
+        'rating': f"{deal.rating:.1f}" if deal.rating is not None else 'N/A',
+        'reviews': deal.reviews or 0,
+        'image': deal.image,
+        'url': add_affiliate_tag(deal.url, affiliate_id) if deal.url else '',
+        'features': [],
+        'description': ''
+    }
+
+
+def write_jekyll_category(site_dir: str, config: Dict, deals: List[Deal],
+                          now: Optional[float] = None) -> List[str]:
+    """Write _data/<slug>.json and, for new slugs, a _posts/<date>-<slug>.md stub
+    
+    The data file is compact JSON and is only rewritten when its products or
+    titles change, keeping the previous generated_at otherwise. Returns the
+    paths written.
+    """
+    slug = config['slug']
+    now = now if now is not None else time.time()
+    data = {
+        'title': config.get('title', slug),
+        'slug': slug,
+        'niche': config.get('niche') or slug,
+        'generated_at': iso_timestamp(now),
+        'affiliate_id': config['amazon_affiliate_id'],
+        'products': [jekyll_product(deal, rank, config['amazon_affiliate_id'])
+                     for rank, deal in enumerate(deals, 1)]
+    }
+    
+    written = []
+    data_file = os.path.join(site_dir, DEFAULT_DATA_DIR, f"{slug}.json")
+    try:
+        with open(data_file, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+        if isinstance(previous, dict) and previous.get('generated_at'):
+            data['generated_at'] = previous['generated_at']
+            if previous == data:
+                METRICS.count('data_files_skipped')
+                data = None
+            else:
+                data['generated_at'] = iso_timestamp(now)
+    except (OSError, ValueError):
+        pass
+    if data is not None:
+        write_file(data_file, json.dumps(data, ensure_ascii=False, separators=(',', ':')))
+        METRICS.count('data_files_written')
+        written.append(data_file)
+    
+    posts_dir = os.path.join(site_dir, "_posts")
+    if not glob.glob(os.path.join(glob.escape(posts_dir), f"????-??-??-{glob.escape(slug)}.md")):
+        post_file = os.path.join(posts_dir, f"{datetime.fromtimestamp(now, timezone.utc):%Y-%m-%d}-{slug}.md")
+        write_file(post_file, POST_TEMPLATE.format(slug=slug))
+        written.append(post_file)
+    return written
+
+
+DEFAULT_DATA_DIR = "_data"
+# Chunks per worker process; more evens out uneven pages, fewer saves IPC round trips
+REBUILD_CHUNKS_PER_WORKER = 4
+
+
+def data_file_deals(products: List[Dict]) -> List[Deal]:
+    """Turn the products of a _data/<slug>.json file back into Deals"""
+    deals = []
+    for product in products:
+        product = dict(product)
+        # Data files store bare amounts ("89.78") next to a currency code
+        if parse_number(product.get('price')) is not None:
+            product['price'] = {'amount': product['price'], 'currency': product.get('currency', 'USD')}
+        deals.append(normalize_deal(product))
+    return deals
+
+
+def rebuild_page(task: Tuple[str, str, Dict, Optional[PageAssets]]) -> Tuple[str, Optional[Dict], str]:
+    """Render one data file to <output_dir>/<slug>/index.html; runs in a worker process
+    
+    Returns (data path, {'slug', 'title'} or None, error message).
+    """
+    path, output_dir, config, assets = task
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        slug = str(data.get('slug') or os.path.splitext(os.path.basename(path))[0])
+        if not SLUG_PATTERN.match(slug):
+            return path, None, f"unsafe slug '{slug}'"
+        
+        deals = data_file_deals(data.get('products') or [])
+        if not deals:
+            return path, None, "no products"
+        
+        page_config = dict(config, title=data.get('title') or slug)
+        if data.get('affiliate_id'):
+            page_config['amazon_affiliate_id'] = data['affiliate_id']
+        page_file = os.path.join(output_dir, slug, "index.html")
+        write_atomic(page_file, iter_html(deals, page_config, limit=len(deals), assets=assets))
+        update_compressed_siblings(page_file, assets is not None and assets.minify)
+        return path, {'slug': slug, 'title': page_config['title']}, ''
+    except (OSError, ValueError, TypeError, AttributeError) as e:
+        return path, None, str(e)
+
+
+def rebuild_site(config: Dict, data_dir: str = DEFAULT_DATA_DIR, output_dir: str = DEFAULT_OUTPUT_DIR,
+                 processes: Optional[int] = None, optimize: bool = False,
+                 search: bool = False) -> Dict[str, List[str]]:
+    """Re-render a page for every _data/*.json file across a pool of worker processes
+    
+    Rendering is CPU-bound string work, so it is spread over `processes`
+    (default: CPU count) in chunks rather than threads. Each worker writes its
+    pages atomically; the index (and with `search`, the search index) is
+    written once at the end.
+    """
+    paths = sorted(glob.glob(os.path.join(data_dir, "*.json")))
+    summary = {'written': [], 'failed': []}
+    if not paths:
+        summary['index'] = None
+        return summary
+    
+    assets = build_page_assets(output_dir, '../', None, optimize)
+    tasks = [(path, output_dir, config, assets) for path in paths]
+    processes = max(1, min(processes or os.cpu_count() or 1, len(paths)))
+    
+    with METRICS.timed('rebuild'):
+        if processes == 1:
+            results = list(map(rebuild_page, tasks))
+        else:
+            chunksize = max(1, len(tasks) // (processes * REBUILD_CHUNKS_PER_WORKER))
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                results = list(pool.map(rebuild_page, tasks, chunksize=chunksize))
+    
+    pages = []
+    for path, page, error in results:
+        if page is None:
+            print(f"✗ Skipping {path}: {error}")
+            summary['failed'].append(path)
+            continue
+        pages.append(page)
+        summary['written'].append(os.path.join(output_dir, page['slug'], "index.html"))
+    METRICS.count('pages_written', len(pages))
+    
+    if search:
+        search_index = SearchIndex(os.path.join(output_dir, SEARCH_DIR))
+        for path, page, _ in results:
+            if page is not None:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                search_index.update(dict(config, slug=page['slug'], title=page['title'],
+                                         niche=data.get('niche') or page['slug'],
+                                         amazon_affiliate_id=data.get('affiliate_id') or config['amazon_affiliate_id']),
+                                    data_file_deals(data.get('products') or []))
+        search_index.retain(page['slug'] for page in pages)
+        search_index.save()
+    
+    index_file = os.path.join(output_dir, "index.html")
+    index_html = generate_index_html(pages, search)
+    write_file(index_file, minify_html(index_html) if optimize else index_html)
+    update_compressed_siblings(index_file, optimize)
+    summary['index'] = index_file
+    
+    # Rebuilt pages no longer match what batch runs last wrote; make the next batch rewrite them
+    manifest = load_manifest(output_dir)
+    if manifest:
+        for key in [page['slug'] for page in pages] + [MANIFEST_INDEX_KEY]:
+            manifest.pop(key, None)
+        save_manifest(output_dir, manifest)
+    return summary
+
+
+class RefreshScheduler:
+    """Decides which categories are due for a refresh in daemon mode
+    
+    Each category runs every `refresh_interval` seconds (category or global
+    config) with +/- `refresh_jitter` spread. The interval halves for pages
+    whose deals change on every refresh and doubles for pages that never do.
+    `api_budget_per_hour` caps API requests across all categories; when it is
+    exhausted, due categories wait and the most frequently changing go first.
+    """
+    
+    BUDGET_WINDOW = 3600
+    # Weight of the latest refresh in the change-rate moving average
+    CHANGE_SMOOTHING = 0.3
+    # A failed refresh is retried this soon (or at its normal interval, if shorter)
+    RETRY_DELAY = 300
+    
+    def __init__(self, config: Dict, categories: List[Dict], clock=time.monotonic,
+                 rng: Optional[random.Random] = None):
+        self.clock = clock
+        self.rng = rng or random.Random()
+        self.jitter = config.get('refresh_jitter', DEFAULT_REFRESH_JITTER)
+        self.budget = config.get('api_budget_per_hour')
+        self.spent = deque()
+        self.categories = {}
+        self.queue = []
+        now = clock()
+        for order, category in enumerate(categories):
+            merged = category_config(config, category)
+            self.categories[category['slug']] = {
+                'category': category,
+                'order': order,
+                'interval': merged.get('refresh_interval', DEFAULT_REFRESH_INTERVAL),
+                'cost': max(1, merged.get('max_pages', 1)),
+                'change_rate': 0.5
+            }
+            # Everything is due on startup so every page exists
+            heapq.heappush(self.queue, (now, order, category['slug']))
+    
+    def interval(self, slug: str) -> float:
+        """Jittered interval scaled by how often the category's page changes"""
+        entry = self.categories[slug]
+        adaptive = entry['interval'] * 2 ** (1 - 2 * entry['change_rate'])
+        return adaptive * (1 + self.rng.uniform(-self.jitter, self.jitter))
+    
+    def budget_left(self, now: float) -> Optional[float]:
+        """API requests still available in the current window, or None without a budget"""
+        if self.budget is None:
+            return None
+        while self.spent and self.spent[0][0] <= now - self.BUDGET_WINDOW:
+            self.spent.popleft()
+        return self.budget - sum(requests for _, requests in self.spent)
+    
+    def due(self) -> List[Dict]:
+        """Pop the categories to refresh now, most frequently changing first"""
+        now = self.clock()
+        ready = []
+        while self.queue and self.queue[0][0] <= now:
+            ready.append(heapq.heappop(self.queue)[2])
+        ready.sort(key=lambda slug: (-self.categories[slug]['change_rate'], self.categories[slug]['order']))
+        
+        left = self.budget_left(now)
+        picked = []
+        for slug in ready:
+            entry = self.categories[slug]
+            if left is not None and entry['cost'] > left and (picked or self.spent):
+                # Retry once the oldest spend leaves the window
+                retry_at = self.spent[0][0] + self.BUDGET_WINDOW if self.spent else now
+                heapq.heappush(self.queue, (max(retry_at, now), entry['order'], slug))
+                METRICS.count('refreshes_deferred')
+                continue
+            if left is not None:
+                left -= entry['cost']
+            picked.append(entry['category'])
+        return picked
+    
+    def record(self, slug: str, changed: bool) -> None:
+        """Update the category's change rate and schedule its next refresh"""
+        entry = self.categories[slug]
+        entry['change_rate'] += self.CHANGE_SMOOTHING * ((1.0 if changed else 0.0) - entry['change_rate'])
+        heapq.heappush(self.queue, (self.clock() + self.interval(slug), entry['order'], slug))
+    
+    def retry(self, slug: str) -> None:
+        """Reschedule a category whose refresh failed, leaving its change rate alone"""
+        entry = self.categories[slug]
+        delay = min(self.RETRY_DELAY, self.interval(slug))
+        heapq.heappush(self.queue, (self.clock() + delay, entry['order'], slug))
+    
+    def spend(self, requests: int) -> None:
+        """Charge API requests made by a refresh against the budget"""
+        if requests:
+            self.spent.append((self.clock(), requests))
+    
+    def seconds_until_due(self) -> float:
+        """Time to sleep before the next category is due"""
+        if not self.queue:
+            return float(DEFAULT_REFRESH_INTERVAL)
+        return max(0.0, self.queue[0][0] - self.clock())
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="Top10 Site Generator")
+    parser.add_argument('--config', default="config.json", help="Path to configuration file")
+    parser.add_argument('--mock', action='store_true', help="Use mock deals instead of the API")
+    parser.add_argument('--batch', action='store_true',
+                        help="Generate one page per entry in the config 'categories' list")
+    parser.add_argument('--workers', type=int,
+                        help=f"Concurrent requests, overriding config max_workers (default {DEFAULT_MAX_WORKERS})")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Always call the API instead of using cached responses")
+    parser.add_argument('--force', action='store_true',
+                        help="Re-render every page even if its deals have not changed")
+    parser.add_argument('--images', action='store_true',
+                        help="Download product images and serve resized local thumbnails")
+    parser.add_argument('--optimize', action='store_true',
+                        help="Link a shared minified stylesheet, minify HTML and write .gz/.br copies")
+    parser.add_argument('--no-history', action='store_true',
+                        help="Don't record or show price history")
+    parser.add_argument('--dedupe', action='store_true',
+                        help="In batch mode, show each product on at most one category page")
+    parser.add_argument('--daemon', action='store_true',
+                        help="Keep running and refresh each category on its own schedule")
+    parser.add_argument('--site', help="Only generate the named entry of the config 'sites' list")
+    parser.add_argument('--jekyll', nargs='?', const='.', metavar='SITE_DIR',
+                        help="In batch mode, also write _data/<slug>.json and _posts stubs under SITE_DIR (default: .)")
+    parser.add_argument('--check-links', action='store_true',
+                        help="In batch mode, drop deals whose product page or image is gone")
+    parser.add_argument('--search', action='store_true',
+                        help="Keep a sharded search index of every listed product under search/")
+    parser.add_argument('--rebuild', action='store_true',
+                        help="Re-render a page for every _data/*.json file using all CPU cores")
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help="Category data files for --rebuild")
+    parser.add_argument('--processes', type=int, help="Worker processes for --rebuild (default: CPU count)")
+    parser.add_argument('--record', metavar='DIR', help="Save every raw API response as a fixture in DIR")
+    parser.add_argument('--replay', metavar='DIR', help="Serve API responses from fixtures in DIR, without a network")
+    parser.add_argument('--replay-latency', action='store_true',
+                        help="With --replay, wait as long as each recorded response took")
+    parser.add_argument('--report', help="Append a JSON run report (timings and counters) to this JSONL file")
+    parser.add_argument('--prometheus', help="Write run metrics to this Prometheus textfile")
+    return parser.parse_args(argv)
+
+
+def emit_run_report(config: Dict, args: argparse.Namespace, cache: Optional[ResponseCache] = None,
+                    client: Optional[ApiClient] = None) -> None:
+    """Write the machine-readable run report and Prometheus textfile if requested"""
+    report_path = args.report or config.get('report_path')
+    prometheus_path = args.prometheus or config.get('prometheus_path')
+    if not report_path and not prometheus_path:
+        return
+    
+    report = METRICS.report(cache, client)
+    report['mode'] = ('rebuild' if args.rebuild else 'daemon' if args.daemon
+                      else 'batch' if args.batch else 'single')
+    if report_path:
+        append_run_report(report_path, report)
+        print(f"✓ Run report appended to {report_path}")
+    if prometheus_path:
+        write_file(prometheus_path, prometheus_metrics(report))
+        print(f"✓ Prometheus metrics written to {prometheus_path}")
+
+
+def run_batch(config: Dict, args: argparse.Namespace, cache: Optional[ResponseCache] = None,
+              client: Optional[ApiClient] = None, history: Optional[PriceHistory] = None) -> None:
+    """Run the generator over every configured category"""
+    categories = config.get('categories', [])
+    if not categories:
+        print("✗ Batch mode requires a non-empty 'categories' list in the configuration")
+        sys.exit(1)
+    
+    workers = config.get('max_workers', DEFAULT_MAX_WORKERS)
+    print(f"Generating {len(categories)} categories with up to {workers} workers...")
+    print()
+    
+    dedupe = args.dedupe or config.get('dedupe', False)
+    # Page assignments from mock deals would leak into real runs
+    products = None
+    if dedupe and not args.mock:
+        products = ProductIndex(config.get('product_index_path', DEFAULT_PRODUCT_INDEX_PATH))
+    # Mock deals point at made-up ASINs, so every one of them would look dead
+    checker = None
+    if (args.check_links or config.get('check_links', False)) and not args.mock:
+        checker = build_link_checker(config)
+    
+    summary = generate_batch(config, categories, config.get('output_dir', DEFAULT_OUTPUT_DIR),
+                             use_mock=args.mock, max_workers=workers,
+                             cache=cache, client=client, force=args.force,
+                             images=args.images or config.get('images', False),
+                             optimize=args.optimize or config.get('optimize', False),
+                             history=history, dedupe=dedupe, products=products,
+                             jekyll_dir=args.jekyll or config.get('jekyll_dir'), checker=checker,
+                             search=args.search or config.get('search', False))
+    if products is not None:
+        products.save()
+    if checker is not None:
+        checker.save()
+        checker.close()
+    
+    print()
     print("=" * 60)
-    print("Top10 Site Generator")
+    print(f"Batch complete! {len(summary['written'])} pages written, "
+          f"{len(summary['skipped'])} unchanged, {len(summary['failed'])} failed")
+    if cache is not None:
+        print(f"  Cache: {cache.summary()}")
+    if client is not None:
+        print(f"  HTTP: {client.summary()}")
+    if checker is not None:
+        print(f"  Links: {checker.summary()}")
+    print(f"  file://{os.path.abspath(summary['index'])}")
     print("=" * 60)
-    print()
+
+
+def run_daemon(config: Dict, args: argparse.Namespace, cache: Optional[ResponseCache] = None,
+               client: Optional[ApiClient] = None, history: Optional[PriceHistory] = None,
+               stop: Optional[threading.Event] = None, max_cycles: Optional[int] = None) -> None:
+    """Refresh categories on their own schedules until stopped, reusing the warm client and caches"""
+    categories = config.get('categories', [])
+    if not categories:
+        print("✗ Daemon mode requires a non-empty 'categories' list in the configuration")
+        sys.exit(1)
     
-    # Load configuration
-    config = load_config()
-    print(f"✓ Configuration loaded")
-    print(f"  - Amazon Affiliate ID: {config['amazon_affiliate_id']}")
-    print(f"  - API Endpoint: {config['api_endpoint']}")
+    stop = stop or threading.Event()
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    
+    output_dir = config.get('output_dir', DEFAULT_OUTPUT_DIR)
+    scheduler = RefreshScheduler(config, categories)
+    dedupe = args.dedupe or config.get('dedupe', False)
+    products = None
+    if dedupe and not args.mock:
+        products = ProductIndex(config.get('product_index_path', DEFAULT_PRODUCT_INDEX_PATH))
+    checker = None
+    if (args.check_links or config.get('check_links', False)) and not args.mock:
+        checker = build_link_checker(config)
+    
+    print(f"Refreshing {len(categories)} categories on their own schedules (Ctrl+C to stop)...")
+    cycles = 0
+    try:
+        while not stop.is_set() and (max_cycles is None or cycles < max_cycles):
+            due = scheduler.due()
+            if not due:
+                stop.wait(scheduler.seconds_until_due())
+                continue
+            
+            # Only API calls count against the budget; image downloads and cache hits don't
+            calls_before = METRICS.counters.get('api_calls', 0)
+            try:
+                if products is not None:
+                    products.run_started = time.time()
+                if history is not None:
+                    history.start_run()
+                summary = generate_batch(config, due, output_dir, use_mock=args.mock,
+                                         max_workers=config.get('max_workers', DEFAULT_MAX_WORKERS),
+                                         cache=cache, client=client, force=args.force,
+                                         images=args.images or config.get('images', False),
+                                         optimize=args.optimize or config.get('optimize', False),
+                                         history=history, dedupe=dedupe, products=products,
+                                         index_categories=categories,
+                                         jekyll_dir=args.jekyll or config.get('jekyll_dir'), checker=checker,
+                                         search=args.search or config.get('search', False))
+                if products is not None:
+                    products.save()
+                if checker is not None:
+                    checker.save()
+            except Exception as e:
+                # A long-running process must outlive one bad cycle (payload, disk or database error)
+                print(f"✗ Refresh of {len(due)} categories failed: {type(e).__name__}: {e}")
+                METRICS.count('refresh_errors')
+                summary = None
+            scheduler.spend(METRICS.counters.get('api_calls', 0) - calls_before)
+            
+            if summary is None:
+                for category in due:
+                    scheduler.retry(category['slug'])
+                outcome = "Refresh failed"
+            else:
+                written = set(summary['written'])
+                for category in due:
+                    scheduler.record(category['slug'],
+                                     os.path.join(output_dir, category['slug'], "index.html") in written)
+                outcome = f"Refreshed {len(due)} categories, {len(summary['written'])} files written"
+            emit_run_report(config, args, cache, client)
+            METRICS.reset()
+            cycles += 1
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] {outcome}; next in {scheduler.seconds_until_due():.0f}s")
+    except KeyboardInterrupt:
+        pass
+    if checker is not None:
+        checker.close()
+    print("✓ Daemon stopped")
+
+
+def run_rebuild(config: Dict, args: argparse.Namespace) -> None:
+    """Re-render every stored category page without calling the API"""
+    processes = args.processes or os.cpu_count() or 1
+    print(f"Rebuilding pages from {args.data_dir}/*.json with {processes} processes...")
     print()
     
-    # Fetch deals
-    deals = fetch_amazon_deals(config)
+    summary = rebuild_site(config, args.data_dir, config.get('output_dir', DEFAULT_OUTPUT_DIR),
+                           processes=processes, optimize=args.optimize or config.get('optimize', False),
+                           search=args.search or config.get('search', False))
+    if summary['index'] is None:
+        print(f"✗ No data files found in {args.data_dir}")
+        sys.exit(1)
+    
+    print(f"✓ Rebuilt {len(summary['written'])} pages, {len(summary['failed'])} failed")
+    print(f"  file://{os.path.abspath(summary['index'])}")
+
+
+def run_single(config: Dict, args: argparse.Namespace, cache: Optional[ResponseCache] = None,
+               client: Optional[ApiClient] = None, history: Optional[PriceHistory] = None) -> None:
+    """Run the generator for the single category described by the configuration"""
+    # Fetch deals page by page and rank them as they arrive
+    deals = fetch_ranked_deals(config, use_mock=args.mock, cache=cache, client=client, history=history)
     
     if not deals:
-        print("✗ Failed to fetch deals or no deals available")
+        print("✗ Failed to fetch deals or no deals passed the ranking filters")
         sys.exit(1)
     
-    print(f"✓ Fetched {len(deals)} deals")
+    print(f"✓ Fetched and ranked top {len(deals)} deals")
     print()
     
-    # Generate HTML
-    html_content = generate_html(deals, config)
-    
-    # Create output directory if it doesn't exist
-    output_dir = "output"
-    os.makedirs(output_dir, exist_ok=True)
-    
-    # Write HTML file
+    # Stream the HTML straight to disk; the rename keeps a half-written page from being served
+    output_dir = config.get('output_dir', DEFAULT_OUTPUT_DIR)
     output_file = os.path.join(output_dir, "index.html")
-    with open(output_file, 'w', encoding='utf-8') as f:
-        f.write(html_content)
     
-    print(f"✓ Generated HTML file: {output_file}")
+    optimize = args.optimize or config.get('optimize', False)
+    image_map = None
+    if args.images or config.get('images', False):
+        image_map = fetch_images(deals, output_dir, config.get('max_workers', DEFAULT_MAX_WORKERS))
+        print(f"✓ Prepared {len(image_map)} local images")
+    assets = build_page_assets(output_dir, '', image_map, optimize)
+    
+    manifest = {} if args.force else load_manifest(output_dir)
+    if render_if_changed(output_file, page_fingerprint(deals, config, assets=assets),
+                         iter_html(deals, config, assets=assets), manifest, MANIFEST_INDEX_KEY):
+        update_compressed_siblings(output_file, optimize)
+        save_manifest(output_dir, manifest)
+        print(f"✓ Generated HTML file: {output_file}")
+    else:
+        print(f"✓ Deals unchanged, kept existing {output_file}")
+    if cache is not None:
+        print(f"  Cache: {cache.summary()}")
+    if client is not None:
+        print(f"  HTTP: {client.summary()}")
     print()
     print("=" * 60)
     print("Generation complete! Open the file in your browser:")
@@ -428,5 +3428,89 @@ def main():
     print("=" * 60)
 
 
+def select_sites(config: Dict, args: argparse.Namespace) -> List[Dict]:
+    """Resolve which site configurations this run generates"""
+    sites = config.get('sites') or []
+    if args.site:
+        for site in sites:
+            if site.get('name') == args.site:
+                return [site_config(config, site)]
+        print(f"Error: No site named '{args.site}' in the configuration")
+        sys.exit(1)
+    if not sites:
+        return [config]
+    if len(sites) > 1 and (args.daemon or not args.batch):
+        print("Error: The configuration defines several sites; pick one with --site")
+        sys.exit(1)
+    return [site_config(config, site) for site in sites]
+
+
+def main(argv: Optional[List[str]] = None):
+    """Main function to run the generator"""
+    args = parse_args(argv)
+    METRICS.reset()
+    
+    print("=" * 60)
+    print("Top10 Site Generator")
+    print("=" * 60)
+    print()
+    
+    # Load and validate configuration once, before any network I/O
+    with METRICS.timed('config_load'):
+        # Replays need no API key; fixtures never contain one
+        config = load_config(args.config, use_mock=args.mock or bool(args.replay) or args.rebuild,
+                             batch=args.batch or args.daemon)
+        sites = select_sites(config, args)
+    if args.workers is not None:
+        # One setting drives both fetch concurrency and the connection pool size
+        for entry in [config] + sites:
+            entry['max_workers'] = args.workers
+    if args.replay:
+        # A replay must be deterministic: a missing fixture fails, it never turns into mock deals
+        for site in sites:
+            site['mock_fallback'] = False
+    print(f"✓ Configuration loaded")
+    for site in sites:
+        label = f" ({site['name']})" if site.get('name') else ''
+        print(f"  - Amazon Affiliate ID{label}: {site['amazon_affiliate_id']}")
+    print(f"  - API Endpoint: {config['api_endpoint']}")
+    print()
+    
+    # Recordings and replays always reach the client, so a fresh cache can't mask them
+    cache = None if args.no_cache or args.replay or args.record else build_cache(config)
+    pool_size = max(site.get('max_workers', DEFAULT_MAX_WORKERS) for site in sites)
+    client = build_client(dict(config, max_workers=pool_size))
+    if args.replay:
+        client.close()
+        client = ReplayClient(args.replay, latency=args.replay_latency)
+        print(f"✓ Replaying API responses from {args.replay}")
+    elif args.record:
+        client = RecordingClient(client, args.record)
+        print(f"✓ Recording API responses to {args.record}")
+    # Mock and replayed deals would pollute the real price history
+    history = None
+    if not args.no_history and not args.mock and not args.replay:
+        history = PriceHistory(config.get('history_path', DEFAULT_HISTORY_PATH))
+    
+    try:
+        for site in sites:
+            if len(sites) > 1:
+                print(f"Site: {site['name']}")
+            if args.rebuild:
+                run_rebuild(site, args)
+            elif args.daemon:
+                run_daemon(site, args, cache, client, history)
+            elif args.batch:
+                run_batch(site, args, cache, client, history)
+            else:
+                run_single(site, args, cache, client, history)
+    finally:
+        # Daemon mode reports every refresh cycle itself
+        if not args.daemon:
+            emit_run_report(config, args, cache, client)
+        if history is not None:
+            history.close()
+
+
 if __name__ == "__main__":
     main()
@@ -4,9 +4,15 @@ Test suite for Top10 generator
 """
 
 import os
+import io
 import sys
+import gzip
 import json
+import time
+import tempfile
+import threading
 import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest.mock import patch, MagicMock
 
 # Add parent directory to path to import generate module
@@ -17,8 +23,52 @@ from generate import (
     add_affiliate_tag,
     fetch_amazon_deals,
     generate_html,
-    get_mock_deals
+    get_mock_deals,
+    category_config,
+    fetch_categories,
+    generate_batch,
+    ResponseCache,
+    ApiClient,
+    iter_html,
+    write_atomic,
+    page_fingerprint,
+    Deal,
+    normalize_deal,
+    rank_deals,
+    iter_amazon_deals,
+    RunMetrics,
+    METRICS,
+    prometheus_metrics,
+    main,
+    fetch_images,
+    amazon_resized_url,
+    PageAssets,
+    minify_css,
+    minify_html,
+    write_stylesheet,
+    PriceHistory,
+    fetch_ranked_deals,
+    canonical_url,
+    ProductIndex,
+    dedupe_categories,
+    write_site_feeds,
+    RefreshScheduler,
+    run_daemon,
+    parse_args,
+    validate_config,
+    site_config,
+    CategoryResolver,
+    load_taxonomy,
+    RecordingClient,
+    ReplayClient,
+    rebuild_site,
+    write_jekyll_category,
+    LinkChecker,
+    SearchIndex,
+    price_note
 )
+import generate
+import requests
 
 
 class TestTop10Generator(unittest.TestCase):
@@ -128,6 +178,36 @@ class TestTop10Generator(unittest.TestCase):
         self.assertIn("Product 10", html)
         self.assertNotIn("Product 11", html)
     
+    def test_generate_html_custom_limit(self):
+        """Test that pages can render more than ten deals"""
+        deals = [self.sample_deal.copy() for _ in range(60)]
+        for i, deal in enumerate(deals):
+            deal["product_title"] = f"Product {i+1}"
+        
+        html = generate_html(deals, self.test_config, limit=50)
+        
+        self.assertIn("Product 50<", html)
+        self.assertNotIn("Product 51<", html)
+        self.assertIn("Top 50 Amazon Deals", html)
+    
+    def test_generate_html_top_n_from_config(self):
+        """Test that top_n in the configuration sets the page size"""
+        deals = [self.sample_deal.copy() for _ in range(5)]
+        config = dict(self.test_config, top_n=3)
+        
+        html = generate_html(deals, config)
+        
+        self.assertEqual(html.count('class="deal-card"'), 3)
+    
+    def test_generate_html_escapes_titles(self):
+        """Test that product titles cannot inject markup"""
+        deal = dict(self.sample_deal, product_title='Cable <script>alert(1)</script> "6ft"')
+        html = generate_html([deal], self.test_config)
+        
+        self.assertNotIn("<script>", html)
+        self.assertIn("&lt;script&gt;", html)
+        self.assertIn('alt="Cable &lt;script&gt;alert(1)&lt;/script&gt; &quot;6ft&quot;"', html)
+    
     def test_generate_html_structure(self):
         """Test that generated HTML has proper structure"""
         deals = [self.sample_deal]
@@ -165,6 +245,1853 @@ class TestTop10Generator(unittest.TestCase):
         self.assertNotIn(" ", affiliate_id)
 
 
+class TestConfig(unittest.TestCase):
+    """Test cases for configuration loading and validation"""
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "config.json")
+        self.config = {
+            "rapidapi_key": "test_key",
+            "amazon_affiliate_id": "test-affiliate-20",
+            "node_id": "16310101"
+        }
+    
+    def tearDown(self):
+        self.tmp.cleanup()
+    
+    def _load(self, config, env=None, **kwargs):
+        with open(self.path, "w") as f:
+            json.dump(config, f)
+        with patch('sys.stdout'):
+            return load_config(self.path, env=env or {}, **kwargs)
+    
+    def test_defaults_and_env_overrides(self):
+        """Test that defaults fill gaps and environment variables win over the file"""
+        config = self._load(self.config, env={"RAPID_KEY": "env_key", "TOP10_TOP_N": "5",
+                                              "TOP10_OPTIMIZE": "true"})
+        
+        self.assertEqual(config["rapidapi_key"], "env_key")
+        self.assertEqual(config["top_n"], 5)
+        self.assertIs(config["optimize"], True)
+        self.assertEqual(config["domain"], "US")
+        self.assertEqual(config["output_dir"], "output")
+    
+    def test_example_config_is_valid(self):
+        """Test that the shipped example passes validation"""
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.example.json")) as f:
+            example = json.load(f)
+        
+        self.assertEqual(generate.resolve_node_ids(example), [])
+        self.assertEqual(validate_config(example, batch=True), [])
+    
+    def test_validation_reports_every_problem(self):
+        """Test that type, range and category errors are collected together"""
+        errors = validate_config({
+            "amazon_affiliate_id": "test-20",
+            "top_n": "10",
+            "max_workers": 0,
+            "categories": [
+                {"slug": "tablets", "node_id": "1"},
+                {"slug": "tablets", "node_id": "2"},
+                {"slug": "../etc", "node_id": "3", "max_pages": True}
+            ]
+        }, batch=True)
+        
+        self.assertIn("'rapidapi_key' is required (or set RAPID_KEY)", errors)
+        self.assertIn("'top_n' should be int, got str", errors)
+        self.assertIn("'max_workers' must be at least 1", errors)
+        self.assertIn("categories[1]: duplicate slug 'tablets'", errors)
+        self.assertIn("categories[2]: 'slug' must be letters, digits, '-' or '_'", errors)
+        self.assertIn("categories[2]: 'max_pages' should be int, got bool", errors)
+    
+    @patch('generate.requests.get')
+    def test_invalid_config_fails_before_network(self, mock_get):
+        """Test that main exits on a bad config without calling the API"""
+        with open(self.path, "w") as f:
+            json.dump(dict(self.config, top_n=0), f)
+        
+        with patch('sys.stdout'), self.assertRaises(SystemExit):
+            main(["--config", self.path, "--no-cache", "--no-history"])
+        mock_get.assert_not_called()
+    
+    def test_max_workers_drives_fetch_and_pool(self):
+        """Test that config max_workers sets batch concurrency and --workers overrides it"""
+        with open(self.path, "w") as f:
+            json.dump(dict(self.config, max_workers=3, categories=[{"slug": "a", "node_id": "1"}]), f)
+        
+        for argv, expected in (([], 3), (["--workers", "6"], 6)):
+            with patch('generate.generate_batch', return_value={'written': [], 'skipped': [], 'failed': [],
+                                                              'index': 'index.html'}) as batch, \
+                    patch('generate.build_client', wraps=generate.build_client) as build, patch('sys.stdout'):
+                main(["--config", self.path, "--batch", "--mock", "--no-cache"] + argv)
+            self.assertEqual(batch.call_args.kwargs["max_workers"], expected)
+            self.assertEqual(build.call_args.args[0]["max_workers"], expected)
+    
+    def test_sites_overlay_base_settings(self):
+        """Test that each site inherits top-level settings and gets its own output directory"""
+        config = self._load(dict(self.config, sites=[
+            {"name": "uk", "domain": "UK", "amazon_affiliate_id": "test-21"},
+            {"name": "us", "output_dir": "public"}
+        ]))
+        
+        uk = site_config(config, config["sites"][0])
+        us = site_config(config, config["sites"][1])
+        
+        self.assertEqual((uk["domain"], uk["amazon_affiliate_id"], uk["rapidapi_key"]), ("UK", "test-21", "test_key"))
+        self.assertEqual(uk["output_dir"], os.path.join("output", "uk"))
+        self.assertEqual(us["output_dir"], "public")
+        self.assertNotIn("sites", us)
+    
+    def test_invalid_site_is_rejected(self):
+        """Test that each site is validated after overlaying the base settings"""
+        with self.assertRaises(SystemExit):
+            self._load({"node_id": "1", "sites": [{"name": "uk", "rapidapi_key": "k"}]})
+
+
+class TestCategoryResolver(unittest.TestCase):
+    """Test cases for niche-to-node resolution"""
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        self.resolver = CategoryResolver([
+            {"node_id": "1", "name": "Electronics", "keywords": ["electronics", "gadget"]},
+            {"node_id": "2", "name": "Smartwatches", "keywords": ["smart watch", "smartwatch"]},
+            {"node_id": "3", "name": "Televisions", "keywords": ["tv", "smart tv"]}
+        ])
+    
+    def test_phrases_beat_single_words(self):
+        """Test that whole keyword phrases outweigh words shared between nodes"""
+        self.assertEqual(self.resolver.best("Smart watch"), "2")
+        self.assertEqual(self.resolver.best("best smart TV deals"), "3")
+        self.assertEqual([node for node, _ in self.resolver.resolve("smart watch")], ["2", "3"])
+    
+    def test_weak_matches_resolve_to_nothing(self):
+        """Test that a stray shared word isn't enough to pick a node"""
+        self.assertIsNone(self.resolver.best("smart home"))
+        self.assertIsNone(self.resolver.best("garden hose"))
+    
+    def test_lookups_are_memoized(self):
+        """Test that repeated phrases are served from the memo"""
+        for _ in range(3):
+            self.resolver.best("Smart Watches")
+        
+        self.assertEqual(self.resolver._lookup.cache_info().hits, 2)
+    
+    def test_shipped_taxonomy_covers_existing_niches(self):
+        """Test the niches that previously fell back to the default node"""
+        resolver = load_taxonomy()
+        nodes = {niche: resolver.best(niche) for niche in ("Tablets", "Smart watch", "Best coffee makers")}
+        
+        self.assertEqual(len(set(nodes.values())), 3)
+        self.assertNotIn(None, nodes.values())
+    
+    def test_load_config_resolves_category_niches(self):
+        """Test that categories may give a niche instead of a node_id"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "config.json")
+            with open(path, "w") as f:
+                json.dump({
+                    "rapidapi_key": "test_key",
+                    "amazon_affiliate_id": "test-affiliate-20",
+                    "categories": [
+                        {"slug": "tablets", "niche": "Tablets"},
+                        {"slug": "mystery", "niche": "Best test products"}
+                    ]
+                }, f)
+            with patch('sys.stdout') as stdout, self.assertRaises(SystemExit):
+                load_config(path, batch=True, env={})
+        
+        output = "".join(call.args[0] for call in stdout.write.call_args_list)
+        self.assertIn("categories[1]: 'node_id' is required (no taxonomy match for 'Best test products')", output)
+        self.assertNotIn("categories[0]", output)
+
+
+class TestDealNormalization(unittest.TestCase):
+    """Test cases for the Deal record and field resolver"""
+    
+    def test_normalize_product_shape(self):
+        """Test the product_* response shape used by the mock data"""
+        deal = normalize_deal(get_mock_deals()[0])
+        
+        self.assertIsInstance(deal, Deal)
+        self.assertEqual(deal.asin, "B08MQZXN1X")
+        self.assertEqual(deal.price, 54.99)
+        self.assertEqual(deal.price_text, "$54.99")
+        self.assertEqual(deal.rating, 4.5)
+        self.assertEqual(deal.reviews, 34521)
+    
+    def test_normalize_deal_shape(self):
+        """Test the deal_* shape with price objects and list price"""
+        deal = normalize_deal({
+            "product_asin": "B0TEST1234",
+            "deal_title": "Lightning Deal",
+            "deal_price": {"amount": 19.99, "currency": "USD"},
+            "list_price": {"amount": 39.98, "currency": "USD"},
+            "deal_url": "https://www.amazon.com/deal/abc",
+            "deal_photo": "https://example.com/deal.jpg"
+        })
+        
+        self.assertEqual(deal.title, "Lightning Deal")
+        self.assertEqual(deal.price_text, "$19.99")
+        self.assertAlmostEqual(deal.discount, 0.5, places=3)
+        self.assertEqual(deal.image, "https://example.com/deal.jpg")
+    
+    def test_canonical_url_strips_tracking_and_tags(self):
+        """Test that every URL form of a product collapses to /dp/ASIN"""
+        forms = [
+            "https://www.amazon.com/Echo-Dot/dp/B08MQZXN1X/ref=sr_1_3?keywords=echo&qid=1",
+            "https://www.amazon.com/gp/product/B08MQZXN1X?tag=someone-else-20",
+            "https://www.amazon.com/gp/aw/d/B08MQZXN1X",
+            "https://WWW.AMAZON.COM/dp/B08MQZXN1X/"
+        ]
+        
+        for url in forms:
+            self.assertEqual(canonical_url(url), "https://www.amazon.com/dp/B08MQZXN1X")
+        self.assertEqual(canonical_url("https://amzn.to/abc?ref=x"), "https://amzn.to/abc?ref=x")
+        self.assertEqual(canonical_url("https://www.amazon.com/deal/abc"), "https://www.amazon.com/deal/abc")
+    
+    def test_normalize_replaces_foreign_affiliate_tag(self):
+        """Test that already-tagged links end up carrying our tag"""
+        deal = normalize_deal({
+            "title": "Tagged",
+            "url": "https://www.amazon.co.uk/dp/B08MQZXN1X?tag=someone-else-21&ref=deal"
+        })
+        
+        self.assertEqual(deal.asin, "B08MQZXN1X")
+        self.assertEqual(add_affiliate_tag(deal.url, "test-21"),
+                         "https://www.amazon.co.uk/dp/B08MQZXN1X?tag=test-21")
+    
+    def test_normalize_template_shape(self):
+        """Test the fill-template.js shape with nested current_price"""
+        deal = normalize_deal({
+            "title": "Tablet",
+            "price": {"current_price": "12.50", "currency": "EUR"},
+            "rating": "4.3",
+            "reviews_count": 1200,
+            "thumbnail": "https://example.com/t.jpg",
+            "url": "https://www.amazon.com/dp/B00TEST123?ref=x"
+        })
+        
+        self.assertEqual(deal.asin, "B00TEST123")
+        self.assertEqual(deal.price, 12.5)
+        self.assertEqual(deal.currency, "EUR")
+        self.assertEqual(deal.price_text, "€12.50")
+        self.assertEqual(deal.reviews, 1200)
+    
+    def test_normalize_missing_fields(self):
+        """Test that absent or unparseable fields become None"""
+        deal = normalize_deal({"title": "Bare", "price": "N/A", "rating": "N/A"})
+        
+        self.assertIsNone(deal.price)
+        self.assertIsNone(deal.rating)
+        self.assertIsNone(deal.reviews)
+        self.assertIsNone(deal.discount)
+        self.assertEqual(deal.price_text, "N/A")
+    
+    def test_normalize_ignores_non_string_text_fields(self):
+        """Test that malformed text fields fall back to defaults so one bad deal can't break a batch"""
+        deal = normalize_deal({
+            "product_title": ["Listed"], "title": "Fallback title",
+            "product_url": {"href": "https://www.amazon.com/dp/B000000001"},
+            "product_photo": ["https://m.media-amazon.com/a.jpg"],
+            "currency": {"code": "USD"}, "asin": 42, "product_price": "$5.00"
+        })
+        
+        self.assertEqual(deal.title, "Fallback title")
+        self.assertEqual((deal.url, deal.image, deal.asin), ("", "", ""))
+        self.assertEqual(deal.currency, "USD")
+        self.assertEqual(deal.price_text, "$5.00")
+        self.assertEqual(normalize_deal({"title": 7}).title, "Product")
+        with tempfile.TemporaryDirectory() as tmp:
+            self.assertEqual(fetch_images([{"product_photo": ["x"]}], tmp), {})
+    
+    def test_deal_uses_slots(self):
+        """Test that Deal records carry no per-instance dict"""
+        deal = normalize_deal(get_mock_deals()[0])
+        self.assertFalse(hasattr(deal, "__dict__"))
+
+
+class TestRanking(unittest.TestCase):
+    """Test cases for the deal ranking and filtering stage"""
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        self.config = {"amazon_affiliate_id": "test-affiliate-20"}
+    
+    def test_rank_prefers_better_rated_and_reviewed(self):
+        """Test that higher ratings and review counts rank first"""
+        deals = [
+            {"product_title": "Weak", "product_star_rating": "3.1", "product_num_ratings": "12"},
+            {"product_title": "Strong", "product_star_rating": "4.8", "product_num_ratings": "50,000"}
+        ]
+        
+        ranked = rank_deals(deals, self.config)
+        
+        self.assertEqual([deal.title for deal in ranked], ["Strong", "Weak"])
+    
+    def test_rank_drops_irrelevant_products(self):
+        """Test that keyword relevance filters off-niche deals"""
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "_data", "Tablets.json")) as f:
+            products = json.load(f)["products"]
+        products.append({"title": "Fire HD 10 Tablets, 32 GB", "rating": "4.6", "reviews": 9000})
+        config = dict(self.config, ranking={"keywords": ["tablet"]})
+        
+        ranked = rank_deals(products, config)
+        
+        self.assertEqual([deal.title for deal in ranked], ["Fire HD 10 Tablets, 32 GB"])
+    
+    def test_rank_limits_to_top_n(self):
+        """Test that only `limit` deals are returned from a large pool"""
+        deals = [{"title": f"Item {i}", "rating": str(i % 50 / 10)} for i in range(5000)]
+        
+        ranked = rank_deals(deals, self.config, limit=10)
+        
+        self.assertEqual(len(ranked), 10)
+        self.assertTrue(all(deal.rating == 4.9 for deal in ranked))
+    
+    def test_rank_keeps_api_order_for_ties(self):
+        """Test that equal scores preserve the original order"""
+        deals = [{"title": f"Same {i}", "rating": "4.0"} for i in range(5)]
+        
+        ranked = rank_deals(deals, self.config, limit=3)
+        
+        self.assertEqual([deal.title for deal in ranked], ["Same 0", "Same 1", "Same 2"])
+    
+    def test_rank_weights_and_min_rating(self):
+        """Test custom weights and the minimum rating filter"""
+        deals = [
+            {"title": "Discounted", "rating": "4.0", "deal_price": {"amount": 10},
+             "list_price": {"amount": 40}},
+            {"title": "Popular", "rating": "4.9", "reviews": 90000, "price": "$40.00"},
+            {"title": "Poor", "rating": "2.0", "price": "$5.00"}
+        ]
+        config = dict(self.config, ranking={
+            "weights": {"discount": 10.0},
+            "min_rating": 3.5
+        })
+        
+        ranked = rank_deals(deals, config)
+        
+        self.assertEqual([deal.title for deal in ranked], ["Discounted", "Popular"])
+
+
+class TestPriceHistory(unittest.TestCase):
+    """Test cases for the SQLite price history store"""
+    
+    DAY = 86400
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "history.sqlite3")
+        self.now = 1_700_000_000.0
+    
+    def tearDown(self):
+        self.tmp.cleanup()
+    
+    def _record(self, days_ago, prices):
+        history = PriceHistory(self.path, run_started=self.now - days_ago * self.DAY)
+        history.record([normalize_deal({"asin": asin, "title": asin, "price": price})
+                        for asin, price in prices.items()])
+        history.close()
+    
+    def test_lowest_and_previous_prices(self):
+        """Test the 30-day low and last-run price queries"""
+        self._record(45, {"B000000001": "$10.00"})
+        self._record(20, {"B000000001": "$30.00", "B000000002": "$8.00"})
+        self._record(1, {"B000000001": "$25.00"})
+        
+        history = PriceHistory(self.path, run_started=self.now)
+        lowest = history.lowest_prices(["B000000001", "B000000002", "B000000003"])
+        previous = history.previous_prices(["B000000001", "B000000002"])
+        history.close()
+        
+        self.assertEqual(lowest, {"B000000001": 25.0, "B000000002": 8.0})
+        self.assertEqual(previous, {"B000000001": 25.0, "B000000002": 8.0})
+    
+    def test_current_run_is_excluded_from_comparisons(self):
+        """Test that snapshots from this run don't count as history"""
+        history = PriceHistory(self.path, run_started=self.now)
+        history.record([normalize_deal({"asin": "B000000001", "price": "$5.00"})])
+        
+        self.assertEqual(history.previous_prices(["B000000001"]), {})
+        history.close()
+    
+    def test_annotated_deals_render_price_notes(self):
+        """Test that drops and new 30-day lows appear on the cards, and unchanged prices get no label"""
+        self._record(20, {"B000000001": "$30.00"})
+        self._record(2, {"B000000001": "$50.00", "B000000002": "$20.00", "B000000003": "$20.00"})
+        history = PriceHistory(self.path, run_started=self.now)
+        deals = history.annotate([
+            normalize_deal({"asin": "B000000001", "title": "Dropped", "price": "$40.00"}),
+            normalize_deal({"asin": "B000000002", "title": "Steady", "price": "$20.00"}),
+            normalize_deal({"asin": "B000000003", "title": "New low", "price": "$15.00"})
+        ])
+        history.close()
+        
+        self.assertEqual([price_note(deal) for deal in deals],
+                         ["Price dropped from $50.00", "", "Lowest price in 30 days"])
+        html = generate_html(deals, {"amazon_affiliate_id": "test-20"})
+        
+        self.assertIn("Price dropped from $50.00", html)
+        self.assertEqual(html.count("Lowest price in 30 days"), 1)
+    
+    def test_product_recorded_once_per_run(self):
+        """Test that a product listed in two categories gets a single snapshot"""
+        history = PriceHistory(self.path, run_started=self.now)
+        deal = normalize_deal({"asin": "B000000001", "price": "$5.00"})
+        
+        self.assertEqual(history.record([deal], "electronics"), 1)
+        self.assertEqual(history.record([deal], "computers"), 0)
+        history.close()
+    
+    @patch('generate.requests.get')
+    def test_fetch_records_every_candidate(self, mock_get):
+        """Test that all fetched deals are stored, not just the ranked top N"""
+        response = MagicMock()
+        response.status_code = 200
+        response.json.return_value = {"deals": [
+            {"asin": f"B{i:09d}", "title": f"Item {i}", "price": "$10.00"} for i in range(25)
+        ]}
+        mock_get.return_value = response
+        config = {
+            "rapidapi_key": "test_key",
+            "rapidapi_host": "amazon-real-time-api.p.rapidapi.com",
+            "api_endpoint": "https://amazon-real-time-api.p.rapidapi.com/deals",
+            "domain": "US",
+            "node_id": "16310101",
+            "slug": "electronics"
+        }
+        history = PriceHistory(self.path, run_started=self.now)
+        
+        ranked = fetch_ranked_deals(config, history=history)
+        
+        count = history._conn.execute("SELECT COUNT(*) FROM snapshots WHERE category = 'electronics'").fetchone()[0]
+        history.close()
+        self.assertEqual(len(ranked), 10)
+        self.assertEqual(count, 25)
+
+    
+    @patch('generate.requests.get')
+    def test_mock_fallback_deals_are_not_recorded(self, mock_get):
+        """Test that demo deals served during an outage never become snapshots"""
+        mock_get.side_effect = requests.exceptions.ConnectionError("down")
+        config = {
+            "rapidapi_key": "test_key",
+            "rapidapi_host": "amazon-real-time-api.p.rapidapi.com",
+            "api_endpoint": "https://amazon-real-time-api.p.rapidapi.com/deals",
+            "domain": "US",
+            "node_id": "16310101",
+            "mock_fallback": True,
+            "max_retries": 0
+        }
+        history = PriceHistory(self.path, run_started=self.now)
+        
+        with patch('sys.stdout'):
+            ranked = fetch_ranked_deals(config, history=history)
+        
+        count = history._conn.execute("SELECT COUNT(*) FROM snapshots").fetchone()[0]
+        history.close()
+        self.assertTrue(ranked and all(deal.mock for deal in ranked))
+        self.assertEqual(count, 0)
+
+class TestBatchGeneration(unittest.TestCase):
+    """Test cases for multi-category batch generation"""
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        self.config = {
+            "rapidapi_key": "test_key",
+            "rapidapi_host": "amazon-real-time-api.p.rapidapi.com",
+            "amazon_affiliate_id": "test-affiliate-20",
+            "api_endpoint": "https://amazon-real-time-api.p.rapidapi.com/deals",
+            "domain": "US",
+            "node_id": "16310101"
+        }
+        self.categories = [
+            {"slug": "electronics", "title": "Top Electronics", "node_id": "16310101"},
+            {"slug": "computers", "title": "Top Computers", "node_id": "2619525011", "domain": "UK"}
+        ]
+    
+    def test_category_config_overrides_base(self):
+        """Test that category fields override the base configuration"""
+        merged = category_config(self.config, self.categories[1])
+        
+        self.assertEqual(merged["node_id"], "2619525011")
+        self.assertEqual(merged["domain"], "UK")
+        self.assertEqual(merged["amazon_affiliate_id"], "test-affiliate-20")
+    
+    def test_category_config_requires_slug_and_node(self):
+        """Test that incomplete category entries are rejected"""
+        with self.assertRaises(ValueError):
+            category_config(self.config, {"slug": "missing-node"})
+    
+    @patch('generate.requests.get')
+    def test_fetch_categories_uses_category_params(self, mock_get):
+        """Test that each category is fetched with its own node_id"""
+        mock_response = MagicMock()
+        mock_response.json.return_value = {"data": {"deals": [{"product_title": "X"}]}}
+        mock_get.return_value = mock_response
+        
+        results = fetch_categories(self.config, self.categories, max_workers=2)
+        
+        self.assertEqual(set(results), {"electronics", "computers"})
+        node_ids = sorted(call.kwargs["params"]["node_id"] for call in mock_get.call_args_list)
+        self.assertEqual(node_ids, ["16310101", "2619525011"])
+    
+    def test_generate_batch_writes_pages_and_index(self):
+        """Test that batch mode writes one page per category plus an index"""
+        with tempfile.TemporaryDirectory() as output_dir:
+            summary = generate_batch(self.config, self.categories, output_dir=output_dir, use_mock=True)
+            
+            self.assertEqual(len(summary["written"]), 3)
+            with open(os.path.join(output_dir, "computers", "index.html"), encoding="utf-8") as f:
+                self.assertIn("Top Computers", f.read())
+            with open(os.path.join(output_dir, "index.html"), encoding="utf-8") as f:
+                index = f.read()
+            self.assertIn('href="electronics/index.html"', index)
+            self.assertIn('href="computers/index.html"', index)
+    
+    def test_malformed_payloads_yield_no_deals(self):
+        """Test that odd response shapes and non-object items are ignored rather than raising"""
+        self.assertEqual(generate.extract_deals({"data": []}), [])
+        self.assertEqual(generate.extract_deals({"data": {"deals": "none"}}), [])
+        self.assertEqual(generate.extract_deals({"deals": [{"title": "A"}, None, "B", 3]}), [{"title": "A"}])
+        self.assertEqual(generate.extract_deals("oops"), [])
+    
+    def test_failing_category_does_not_stop_the_batch(self):
+        """Test that an exception in one category's fetch only fails that page"""
+        real = generate.fetch_ranked_deals
+        
+        def fetch(config, *args, **kwargs):
+            if config["slug"] == "electronics":
+                raise AttributeError("'list' object has no attribute 'get'")
+            return real(config, *args, **kwargs)
+        
+        with tempfile.TemporaryDirectory() as output_dir:
+            with patch('generate.fetch_ranked_deals', side_effect=fetch), patch('sys.stdout'):
+                summary = generate_batch(self.config, self.categories, output_dir=output_dir, use_mock=True)
+        
+        self.assertEqual(summary["failed"], [os.path.join(output_dir, "electronics", "index.html")])
+        self.assertIn(os.path.join(output_dir, "computers", "index.html"), summary["written"])
+    
+    def test_category_ranking_merges_over_base(self):
+        """Test that a category keeps base ranking weights and its own keywords win"""
+        config = dict(self.config, ranking={"weights": {"rating": 5.0}, "keywords": ["gadget"]})
+        
+        merged = category_config(config, {"slug": "tablets", "node_id": "1", "keywords": ["tablet"]})
+        self.assertEqual(merged["ranking"], {"weights": {"rating": 5.0}})
+        self.assertEqual(generate.ranking_keywords(merged), ["tablet"])
+        
+        merged = category_config(config, {"slug": "tablets", "node_id": "1", "ranking": {"min_rating": 4}})
+        self.assertEqual(merged["ranking"], {"weights": {"rating": 5.0}, "keywords": ["gadget"], "min_rating": 4})
+    
+    def test_niche_is_the_keyword_fallback(self):
+        """Test that a category's niche filters irrelevant products when no keywords are given"""
+        config = dict(self.config, niche="Grocery")
+        deals = [{"title": "Fire Tablet 10"}, {"title": "Echo Dot"}]
+        
+        tablets = category_config(config, {"slug": "tablets", "node_id": "1", "niche": "Tablets"})
+        self.assertEqual([deal.title for deal in rank_deals(deals, tablets)], ["Fire Tablet 10"])
+        
+        inherited = category_config(config, {"slug": "misc", "node_id": "2"})
+        self.assertEqual(generate.ranking_keywords(inherited), [])
+        self.assertEqual(generate.ranking_keywords(dict(tablets, keywords=[])), [])
+    
+    def _ranked(self, *asins):
+        return [normalize_deal({"asin": asin, "title": asin}) for asin in asins]
+    
+    def test_dedupe_categories_fills_from_spares(self):
+        """Test that a shared product stays on the first page and the next page backfills"""
+        results = {
+            "electronics": self._ranked("B000000001", "B000000002", "B000000003"),
+            "computers": self._ranked("B000000002", "B000000004", "B000000005")
+        }
+        
+        deduped = dedupe_categories(results, {"electronics": 2, "computers": 2})
+        
+        self.assertEqual([d.asin for d in deduped["electronics"]], ["B000000001", "B000000002"])
+        self.assertEqual([d.asin for d in deduped["computers"]], ["B000000004", "B000000005"])
+    
+    def test_dedupe_keeps_products_on_last_runs_page(self):
+        """Test that the persistent index stops products hopping between pages"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "products.json")
+            products = ProductIndex(path, run_started=1_700_000_000.0)
+            products.claim("B000000002", "computers")
+            products.claim("B000000009", "archived")
+            products.save()
+            
+            products = ProductIndex(path, run_started=1_700_000_000.0 + 86400)
+            deduped = dedupe_categories({
+                "electronics": self._ranked("B000000001", "B000000002", "B000000003"),
+                "computers": self._ranked("B000000002", "B000000004")
+            }, {"electronics": 2, "computers": 2}, products)
+            products.save()
+            reloaded = ProductIndex(path)
+        
+        self.assertEqual([d.asin for d in deduped["electronics"]], ["B000000001", "B000000003"])
+        self.assertEqual([d.asin for d in deduped["computers"]], ["B000000002", "B000000004"])
+        self.assertEqual(reloaded.owner("B000000003"), "electronics")
+        self.assertEqual(reloaded.owner("B000000009"), "archived")
+    
+    def test_dedupe_does_not_claim_mock_deals(self):
+        """Test that mock fallback deals leave no page assignments behind"""
+        with tempfile.TemporaryDirectory() as tmp:
+            products = ProductIndex(os.path.join(tmp, "products.json"))
+            mock = [normalize_deal({"asin": "B000000007", "title": "Demo", "_mock": True})]
+            
+            deduped = dedupe_categories({"electronics": mock + self._ranked("B000000001")},
+                                        {"electronics": 2}, products)
+        
+        self.assertEqual(len(deduped["electronics"]), 2)
+        self.assertIsNone(products.owner("B000000007"))
+        self.assertEqual(products.owner("B000000001"), "electronics")
+    
+    def test_generate_batch_writes_sitemap_and_feeds(self):
+        """Test that site_url enables sitemap.xml, feed.xml and feed.json"""
+        config = dict(self.config, site_url="https://example.org/deals/", site_title="Deals & Steals")
+        with tempfile.TemporaryDirectory() as output_dir:
+            generate_batch(config, self.categories, output_dir=output_dir, use_mock=True)
+            with open(os.path.join(output_dir, "sitemap.xml"), encoding="utf-8") as f:
+                sitemap = f.read()
+            with open(os.path.join(output_dir, "feed.json"), encoding="utf-8") as f:
+                feed = json.load(f)
+            with open(os.path.join(output_dir, "feed.xml"), encoding="utf-8") as f:
+                atom = f.read()
+        
+        self.assertIn("<loc>https://example.org/deals/computers/</loc><lastmod>", sitemap)
+        self.assertEqual(len(feed["items"]), 2 * len(get_mock_deals()))
+        self.assertIn("tag=test-affiliate-20", feed["items"][0]["url"])
+        self.assertIn("<entry>", atom)
+        # Entries have no author of their own, so the feed needs one
+        self.assertIn("<author><name>Deals &amp; Steals</name></author>", atom.split("<entry>")[0])
+    
+    def test_feeds_only_carry_new_and_changed_deals(self):
+        """Test that unchanged deals add no items and untouched feeds aren't rewritten"""
+        config = dict(self.config, site_url="https://example.org")
+        category = self.categories[0]
+        deals = self._ranked("B000000001", "B000000002")
+        with tempfile.TemporaryDirectory() as output_dir:
+            manifest = {}
+            first = write_site_feeds(output_dir, config, [(category, deals)], manifest, now=1_700_000_000)
+            second = write_site_feeds(output_dir, config, [(category, deals)], manifest, now=1_700_003_600)
+            changed = [deals[0], normalize_deal({"asin": "B000000002", "title": "B000000002", "price": "$5.00"})]
+            third = write_site_feeds(output_dir, config, [(category, changed)], manifest, now=1_700_007_200)
+            with open(os.path.join(output_dir, "feed.json"), encoding="utf-8") as f:
+                items = json.load(f)["items"]
+        
+        self.assertEqual(len(first), 3)
+        self.assertEqual(second, [])
+        self.assertEqual([os.path.basename(path) for path in third], ["feed.xml", "feed.json"])
+        self.assertEqual(len(items), 3)
+        self.assertEqual(items[0]["date_modified"], "2023-11-15T00:13:20Z")
+    
+    def test_generate_batch_skips_unchanged_pages(self):
+        """Test that a second run with identical deals rewrites nothing"""
+        with tempfile.TemporaryDirectory() as output_dir:
+            generate_batch(self.config, self.categories, output_dir=output_dir, use_mock=True)
+            page = os.path.join(output_dir, "electronics", "index.html")
+            first_mtime = os.stat(page).st_mtime_ns
+            
+            summary = generate_batch(self.config, self.categories, output_dir=output_dir, use_mock=True)
+            
+            self.assertEqual(summary["written"], [])
+            self.assertEqual(len(summary["skipped"]), 3)
+            self.assertEqual(os.stat(page).st_mtime_ns, first_mtime)
+    
+    def test_generate_batch_force_rewrites_pages(self):
+        """Test that force ignores the manifest"""
+        with tempfile.TemporaryDirectory() as output_dir:
+            generate_batch(self.config, self.categories, output_dir=output_dir, use_mock=True)
+            summary = generate_batch(self.config, self.categories, output_dir=output_dir,
+                                     use_mock=True, force=True)
+            
+            self.assertEqual(len(summary["written"]), 3)
+
+
+class TestResponseCache(unittest.TestCase):
+    """Test cases for the on-disk API response cache"""
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = ResponseCache(cache_dir=self.tmp.name, ttl=60, max_entries=2)
+        self.config = {
+            "rapidapi_key": "test_key",
+            "rapidapi_host": "amazon-real-time-api.p.rapidapi.com",
+            "amazon_affiliate_id": "test-affiliate-20",
+            "api_endpoint": "https://amazon-real-time-api.p.rapidapi.com/deals",
+            "domain": "US",
+            "node_id": "16310101"
+        }
+        self.payload = {"data": {"deals": [{"product_title": "Cached Product"}]}}
+    
+    def tearDown(self):
+        self.tmp.cleanup()
+    
+    def _response(self, payload=None, status_code=200):
+        response = MagicMock()
+        response.status_code = status_code
+        response.headers = {"ETag": '"v1"'}
+        response.json.return_value = payload
+        return response
+    
+    @patch('generate.requests.get')
+    def test_second_fetch_is_served_from_cache(self, mock_get):
+        """Test that a fresh cache entry avoids a second API call"""
+        mock_get.return_value = self._response(self.payload)
+        
+        first = fetch_amazon_deals(self.config, cache=self.cache)
+        second = fetch_amazon_deals(self.config, cache=self.cache)
+        
+        self.assertEqual(first, second)
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertEqual(self.cache.stats["hits"], 1)
+        self.assertEqual(self.cache.stats["misses"], 1)
+    
+    @patch('generate.requests.get')
+    def test_stale_entry_served_on_request_error(self, mock_get):
+        """Test that the last good payload is used instead of mock data"""
+        key = ResponseCache.make_key(self.config["api_endpoint"], {"domain": "US", "node_id": "16310101"})
+        self.cache.store(key, self.payload)
+        self.cache.ttl = 0
+        mock_get.side_effect = requests.exceptions.ConnectionError("down")
+        
+        deals = fetch_amazon_deals(self.config, cache=self.cache)
+        
+        self.assertEqual(deals[0]["product_title"], "Cached Product")
+        self.assertEqual(self.cache.stats["stale"], 1)
+    
+    @patch('generate.requests.get')
+    def test_not_modified_revalidates_entry(self, mock_get):
+        """Test that a 304 reuses the cached payload and sends the ETag"""
+        key = ResponseCache.make_key(self.config["api_endpoint"], {"domain": "US", "node_id": "16310101"})
+        self.cache.store(key, self.payload, etag='"v1"')
+        self.cache.ttl = 0
+        mock_get.return_value = self._response(status_code=304)
+        
+        deals = fetch_amazon_deals(self.config, cache=self.cache)
+        
+        self.assertEqual(deals[0]["product_title"], "Cached Product")
+        self.assertEqual(mock_get.call_args.kwargs["headers"]["If-None-Match"], '"v1"')
+        self.assertEqual(self.cache.stats["revalidated"], 1)
+    
+    def test_eviction_bounds_entry_count(self):
+        """Test that the cache never holds more than max_entries"""
+        for i in range(5):
+            self.cache.store(f"key{i}", {"deals": [i]})
+        
+        entries = [name for name in os.listdir(self.tmp.name) if name.endswith(".json")]
+        self.assertEqual(len(entries), 2)
+
+
+class TestApiClient(unittest.TestCase):
+    """Test cases for the pooled HTTP client"""
+    
+    def _response(self, status_code, headers=None):
+        response = MagicMock()
+        response.status_code = status_code
+        response.headers = requests.structures.CaseInsensitiveDict(headers or {})
+        return response
+    
+    @patch('generate.time.sleep')
+    def test_retries_server_errors_then_succeeds(self, mock_sleep):
+        """Test that 5xx responses are retried with backoff"""
+        client = ApiClient(max_retries=3, requests_per_second=0)
+        client.session.get = MagicMock(side_effect=[self._response(503), self._response(200)])
+        
+        response = client.get("https://example.com/deals")
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(client.stats["retries"], 1)
+        self.assertEqual(client.session.get.call_count, 2)
+    
+    @patch('generate.time.sleep')
+    def test_honors_retry_after_header(self, mock_sleep):
+        """Test that a 429 waits for the Retry-After delay"""
+        client = ApiClient(max_retries=1, requests_per_second=0)
+        client.session.get = MagicMock(side_effect=[
+            self._response(429, {"Retry-After": "2"}),
+            self._response(200)
+        ])
+        
+        client.get("https://example.com/deals")
+        
+        mock_sleep.assert_any_call(2.0)
+    
+    @patch('generate.time.sleep')
+    def test_gives_up_after_max_retries(self, mock_sleep):
+        """Test that connection errors propagate once retries are exhausted"""
+        client = ApiClient(max_retries=2, requests_per_second=0)
+        client.session.get = MagicMock(side_effect=requests.exceptions.ConnectionError("down"))
+        
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            client.get("https://example.com/deals")
+        self.assertEqual(client.session.get.call_count, 3)
+    
+    def test_exhausted_quota_pauses_limiter(self):
+        """Test that RapidAPI rate-limit headers hold back later requests"""
+        client = ApiClient(requests_per_second=0)
+        client.session.get = MagicMock(return_value=self._response(200, {
+            "X-RateLimit-Requests-Remaining": "0",
+            "X-RateLimit-Requests-Reset": "5"
+        }))
+        
+        client.get("https://example.com/deals")
+        
+        self.assertEqual(client.stats["throttled"], 1)
+        self.assertGreater(client.limiter._next_slot, 0)
+    
+    @patch('generate.time.sleep')
+    def test_mock_fallback_is_opt_in(self, mock_sleep):
+        """Test that failed fetches return None instead of mock deals unless mock_fallback is on"""
+        config = {
+            "rapidapi_key": "test_key",
+            "rapidapi_host": "amazon-real-time-api.p.rapidapi.com",
+            "api_endpoint": "https://amazon-real-time-api.p.rapidapi.com/deals",
+            "domain": "US",
+            "node_id": "16310101",
+            "mock_fallback": False
+        }
+        client = ApiClient(max_retries=0, requests_per_second=0)
+        client.session.get = MagicMock(side_effect=requests.exceptions.Timeout("slow"))
+        
+        self.assertIsNone(fetch_amazon_deals(config, client=client))
+        
+        del config["mock_fallback"]
+        with patch('sys.stdout'):
+            self.assertIsNone(fetch_amazon_deals(config, client=client))
+
+
+class TestPaginatedFetch(unittest.TestCase):
+    """Test cases for the paginated deep fetch generator"""
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        self.config = {
+            "rapidapi_key": "test_key",
+            "rapidapi_host": "amazon-real-time-api.p.rapidapi.com",
+            "api_endpoint": "https://amazon-real-time-api.p.rapidapi.com/deals",
+            "domain": "US",
+            "node_id": "16310101",
+            "max_pages": 5
+        }
+    
+    def _page_responses(self, pages):
+        responses = []
+        for page in pages:
+            response = MagicMock()
+            response.status_code = 200
+            response.headers = {}
+            response.json.return_value = {"data": {"deals": page}}
+            responses.append(response)
+        return responses
+    
+    @patch('generate.requests.get')
+    def test_walks_pages_until_empty(self, mock_get):
+        """Test that pages are requested in order until one comes back empty"""
+        mock_get.side_effect = self._page_responses([
+            [{"title": "A"}, {"title": "B"}],
+            [{"title": "C"}],
+            []
+        ])
+        
+        titles = [deal.title for deal in iter_amazon_deals(self.config)]
+        
+        self.assertEqual(titles, ["A", "B", "C"])
+        pages = [call.kwargs["params"]["page"] for call in mock_get.call_args_list]
+        self.assertEqual(pages, [1, 2, 3])
+    
+    @patch('generate.requests.get')
+    def test_stops_at_target_candidates(self, mock_get):
+        """Test that no further pages are fetched once the target is met"""
+        mock_get.side_effect = self._page_responses([[{"title": str(i)} for i in range(10)]] * 5)
+        config = dict(self.config, target_candidates=15)
+        
+        deals = list(iter_amazon_deals(config))
+        
+        self.assertEqual(len(deals), 15)
+        self.assertEqual(mock_get.call_count, 2)
+    
+    @patch('generate.requests.get')
+    def test_fetch_is_lazy(self, mock_get):
+        """Test that later pages are only requested as the consumer advances"""
+        mock_get.side_effect = self._page_responses([[{"title": "A"}], [{"title": "B"}]])
+        
+        stream = iter_amazon_deals(self.config)
+        next(stream)
+        
+        self.assertEqual(mock_get.call_count, 1)
+    
+    @patch('generate.requests.get')
+    def test_repeated_products_are_dropped_and_paging_stops(self, mock_get):
+        """Test that an endpoint ignoring `page` yields each product once and ends the walk"""
+        page = [{"title": f"P{i}", "product_url": f"https://www.amazon.com/dp/B00000000{i}"} for i in range(1, 4)]
+        mock_get.side_effect = self._page_responses([page, page[1:] + [dict(page[0], product_url="https://www.amazon.com/dp/B000000009")], page])
+        config = dict(self.config, max_pages=3)
+        
+        asins = [deal.asin for deal in fetch_ranked_deals(config, limit=10)]
+        
+        self.assertEqual(sorted(asins), ["B000000001", "B000000002", "B000000003", "B000000009"])
+        self.assertEqual(mock_get.call_count, 3)
+        
+        mock_get.reset_mock()
+        mock_get.side_effect = self._page_responses([page, page, page])
+        self.assertEqual(len(fetch_ranked_deals(config, limit=10)), 3)
+        self.assertEqual(mock_get.call_count, 2)
+    
+    @patch('generate.requests.get')
+    def test_later_page_errors_do_not_add_mock_deals(self, mock_get):
+        """Test that a failure after page one ends the stream cleanly"""
+        mock_get.side_effect = self._page_responses([[{"title": "A"}]]) + [
+            requests.exceptions.ConnectionError("down")
+        ]
+        
+        titles = [deal.title for deal in iter_amazon_deals(self.config)]
+        
+        self.assertEqual(titles, ["A"])
+
+
+class TestStreamingWriter(unittest.TestCase):
+    """Test cases for streamed, atomic page writes"""
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        self.config = {"amazon_affiliate_id": "test-affiliate-20"}
+        self.tmp = tempfile.TemporaryDirectory()
+    
+    def tearDown(self):
+        self.tmp.cleanup()
+    
+    def test_iter_html_matches_generate_html(self):
+        """Test that streamed chunks join to the same document"""
+        deals = get_mock_deals()
+        
+        with patch('generate.datetime') as mock_datetime:
+            mock_datetime.now.return_value.strftime.return_value = "2025-01-01 00:00:00"
+            self.assertEqual("".join(iter_html(deals, self.config)), generate_html(deals, self.config))
+    
+    def test_iter_html_consumes_deals_lazily(self):
+        """Test that only the rendered deals are pulled from a generator"""
+        pulled = []
+        
+        def deal_stream():
+            for deal in get_mock_deals() * 100:
+                pulled.append(deal)
+                yield deal
+        
+        chunks = list(iter_html(deal_stream(), self.config, limit=5))
+        
+        self.assertEqual(len(pulled), 5)
+        self.assertEqual(sum('class="deal-card"' in chunk for chunk in chunks), 5)
+    
+    def test_page_fingerprint_ignores_timestamp_only(self):
+        """Test that the fingerprint tracks deals but not the generation time"""
+        deals = get_mock_deals()
+        first = page_fingerprint(deals, self.config)
+        
+        with patch('generate.datetime') as mock_datetime:
+            mock_datetime.now.return_value.strftime.return_value = "2099-01-01 00:00:00"
+            self.assertEqual(page_fingerprint(deals, self.config), first)
+        
+        changed = [dict(deals[0], product_price="$1.00")] + deals[1:]
+        self.assertNotEqual(page_fingerprint(changed, self.config), first)
+    
+    def test_write_atomic_keeps_old_file_on_failure(self):
+        """Test that a failed render never replaces the published page"""
+        path = os.path.join(self.tmp.name, "index.html")
+        write_atomic(path, ["old page"])
+        
+        def broken_chunks():
+            yield "<html>partial"
+            raise RuntimeError("render failed")
+        
+        with self.assertRaises(RuntimeError):
+            write_atomic(path, broken_chunks())
+        
+        with open(path, encoding="utf-8") as f:
+            self.assertEqual(f.read(), "old page")
+        self.assertEqual(os.listdir(self.tmp.name), ["index.html"])
+
+
+class TestJekyllEmitter(unittest.TestCase):
+    """Test cases for writing Jekyll _data files and post stubs"""
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.site = self.tmp.name
+        self.config = {"slug": "tablets", "title": "Top Tablets", "niche": "Tablets",
+                       "amazon_affiliate_id": "test-20"}
+        self.deals = [normalize_deal(deal) for deal in get_mock_deals()[:3]]
+        self.now = 1_700_000_000
+    
+    def tearDown(self):
+        self.tmp.cleanup()
+    
+    def test_writes_layout_compatible_data_and_post(self):
+        """Test the _data shape the top10 layout reads and the post front matter"""
+        written = write_jekyll_category(self.site, self.config, self.deals, now=self.now)
+        
+        data_file = os.path.join(self.site, "_data", "tablets.json")
+        post_file = os.path.join(self.site, "_posts", "2023-11-14-tablets.md")
+        self.assertEqual(written, [data_file, post_file])
+        with open(data_file, encoding="utf-8") as f:
+            raw = f.read()
+        data = json.loads(raw)
+        self.assertNotIn("\n", raw)
+        self.assertEqual((data["title"], data["slug"], data["niche"]), ("Top Tablets", "tablets", "Tablets"))
+        self.assertEqual(data["products"][0]["rank"], 1)
+        self.assertEqual(data["products"][0]["price"], "54.99")
+        self.assertEqual(data["products"][0]["url"], "https://www.amazon.com/dp/B08MQZXN1X?tag=test-20")
+        with open(post_file) as f:
+            self.assertEqual(f.read(), "---\nlayout: top10\ndata_file: tablets\n---\n")
+    
+    def test_unchanged_products_touch_nothing(self):
+        """Test that a refresh with the same products rewrites no files"""
+        write_jekyll_category(self.site, self.config, self.deals, now=self.now)
+        
+        self.assertEqual(write_jekyll_category(self.site, self.config, self.deals, now=self.now + 86400), [])
+        changed = write_jekyll_category(self.site, self.config, self.deals[:2], now=self.now + 86400)
+        self.assertEqual(changed, [os.path.join(self.site, "_data", "tablets.json")])
+        self.assertEqual(len(os.listdir(os.path.join(self.site, "_posts"))), 1)
+    
+    def test_data_files_round_trip_through_rebuild(self):
+        """Test that emitted data files render the same prices on --rebuild"""
+        write_jekyll_category(self.site, self.config, self.deals, now=self.now)
+        output_dir = os.path.join(self.site, "output")
+        
+        with patch('sys.stdout'):
+            rebuild_site({"amazon_affiliate_id": "test-20"}, os.path.join(self.site, "_data"), output_dir, processes=1)
+        
+        with open(os.path.join(output_dir, "tablets", "index.html"), encoding="utf-8") as f:
+            page = f.read()
+        for deal in self.deals:
+            self.assertIn(deal.price_text, page)
+    
+    def test_generate_batch_emits_every_category(self):
+        """Test that one batch run writes data files for all categories"""
+        categories = [{"slug": "electronics", "node_id": "1"}, {"slug": "computers", "node_id": "2"}]
+        with patch('sys.stdout'):
+            generate_batch(dict(self.config, slug=None), categories, os.path.join(self.site, "output"),
+                           use_mock=True, jekyll_dir=self.site)
+        
+        self.assertEqual(sorted(os.listdir(os.path.join(self.site, "_data"))), ["computers.json", "electronics.json"])
+
+
+class TestRebuild(unittest.TestCase):
+    """Test cases for rebuilding pages from _data files"""
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.data_dir = os.path.join(self.tmp.name, "_data")
+        self.output_dir = os.path.join(self.tmp.name, "output")
+        os.makedirs(self.data_dir)
+        for i in range(6):
+            slug = f"niche-{i}"
+            with open(os.path.join(self.data_dir, f"{slug}.json"), "w") as f:
+                json.dump({
+                    "title": f"Niche {i}",
+                    "slug": slug,
+                    "affiliate_id": "data-20",
+                    "products": [
+                        {"rank": 1, "title": f"Product {i}", "asin": "B000000001", "price": "89.78",
+                         "currency": "USD", "rating": "4.2", "reviews": 4850,
+                         "url": "https://www.amazon.com/dp/B000000001?tag=data-20"},
+                        {"rank": 2, "title": "No price", "asin": "B000000002", "price": "N/A",
+                         "currency": "USD", "rating": "N/A", "reviews": 0}
+                    ]
+                }, f)
+        with open(os.path.join(self.data_dir, "broken.json"), "w") as f:
+            f.write("{not json")
+    
+    def tearDown(self):
+        self.tmp.cleanup()
+    
+    def test_rebuild_renders_every_data_file_in_worker_processes(self):
+        """Test a pooled rebuild writes each page and an index, reporting bad files"""
+        with patch('sys.stdout'):
+            summary = rebuild_site({"amazon_affiliate_id": "config-20"}, self.data_dir, self.output_dir,
+                                   processes=2)
+        
+        self.assertEqual(len(summary["written"]), 6)
+        self.assertEqual([os.path.basename(path) for path in summary["failed"]], ["broken.json"])
+        with open(os.path.join(self.output_dir, "niche-3", "index.html"), encoding="utf-8") as f:
+            page = f.read()
+        self.assertIn("<title>Niche 3</title>", page)
+        self.assertIn("$89.78", page)
+        self.assertIn("dp/B000000001?tag=data-20", page)
+        with open(summary["index"], encoding="utf-8") as f:
+            self.assertIn('href="niche-5/index.html"', f.read())
+    
+    def test_rebuild_invalidates_batch_manifest_entries(self):
+        """Test that the next batch run rewrites pages the rebuild replaced"""
+        generate.save_manifest(self.output_dir, {"niche-0": "abc", "other": "def", "__index__": "123"})
+        
+        with patch('sys.stdout'):
+            rebuild_site({"amazon_affiliate_id": "config-20"}, self.data_dir, self.output_dir, processes=1)
+        
+        self.assertEqual(generate.load_manifest(self.output_dir), {"other": "def"})
+
+
+class TestImageAssets(unittest.TestCase):
+    """Test cases for local thumbnail generation"""
+    
+    IMAGE_URL = "https://m.media-amazon.com/images/I/61f1YfTkTDL._AC_SL1500_.jpg"
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.deals = [
+            {"title": "A", "product_photo": self.IMAGE_URL},
+            {"title": "B", "product_photo": self.IMAGE_URL},
+        ]
+    
+    def tearDown(self):
+        self.tmp.cleanup()
+    
+    def _image_response(self, content):
+        response = MagicMock()
+        response.content = content
+        return response
+    
+    def test_amazon_resized_url(self):
+        """Test rewriting Amazon size tokens"""
+        self.assertEqual(amazon_resized_url(self.IMAGE_URL, 320),
+                         "https://m.media-amazon.com/images/I/61f1YfTkTDL._AC_SL320_.jpg")
+        self.assertIsNone(amazon_resized_url("https://example.com/photo.jpg", 320))
+    
+    @patch('generate.requests.Session.get')
+    def test_fallback_downloads_amazon_variants_once(self, mock_get):
+        """Test that without Pillow each distinct image is fetched as Amazon-sized variants"""
+        mock_get.return_value = self._image_response(b"jpeg-bytes")
+        
+        with patch('generate.Image', None):
+            images = fetch_images(self.deals, self.tmp.name)
+        
+        self.assertEqual(list(images), [self.IMAGE_URL])
+        requested = [call.args[0] for call in mock_get.call_args_list]
+        self.assertEqual(len(requested), 3)
+        self.assertTrue(all("_AC_SL" in url and "1500" not in url for url in requested))
+        for _, path in images[self.IMAGE_URL].variants:
+            self.assertTrue(os.path.exists(os.path.join(self.tmp.name, path)))
+    
+    @unittest.skipIf(generate.Image is None, "Pillow not installed")
+    @patch('generate.requests.Session.get')
+    def test_pillow_resizes_to_webp_and_caches(self, mock_get):
+        """Test that Pillow produces WebP thumbnails reused on the next run"""
+        buffer = io.BytesIO()
+        generate.Image.new("RGB", (1500, 1000), "orange").save(buffer, "JPEG")
+        mock_get.return_value = self._image_response(buffer.getvalue())
+        
+        images = fetch_images(self.deals, self.tmp.name)
+        fetch_images(self.deals, self.tmp.name)
+        
+        self.assertEqual(mock_get.call_count, 1)
+        asset = images[self.IMAGE_URL]
+        width, path = asset.variants[0]
+        with generate.Image.open(os.path.join(self.tmp.name, path)) as thumbnail:
+            self.assertEqual(thumbnail.format, "WEBP")
+            self.assertEqual(thumbnail.size[0], width)
+    
+    @patch('generate.requests.Session.get')
+    def test_rendered_cards_use_local_srcset(self, mock_get):
+        """Test that cards point at local thumbnails with srcset and lazy loading"""
+        mock_get.return_value = self._image_response(b"jpeg-bytes")
+        with patch('generate.Image', None):
+            images = fetch_images(self.deals, self.tmp.name)
+        deals = [dict(deal, product_url="https://www.amazon.com/dp/B000000001") for deal in self.deals * 2]
+        
+        html = generate_html(deals, {"amazon_affiliate_id": "test-20"},
+                             assets=PageAssets(images=images, prefix="../"))
+        
+        self.assertNotIn(self.IMAGE_URL, html)
+        self.assertIn('srcset="../images/', html)
+        self.assertIn(' 160w, ../images/', html)
+        self.assertIn('loading="eager"', html)
+        self.assertIn('loading="lazy"', html)
+    
+    @patch('generate.requests.Session.get')
+    def test_batch_images_bypass_the_api_client(self, mock_get):
+        """Test that image downloads skip the rate-limited API client and its stats"""
+        mock_get.return_value = self._image_response(b"jpeg-bytes")
+        client = ApiClient(max_retries=0, requests_per_second=1)
+        config = {"rapidapi_key": "k", "rapidapi_host": "h", "amazon_affiliate_id": "t-20",
+                  "api_endpoint": "http://unused", "domain": "US", "node_id": "1"}
+        
+        with patch('generate.fetch_ranked_deals', return_value=[normalize_deal(deal) for deal in self.deals]), \
+                patch('generate.Image', None), patch('sys.stdout'):
+            generate_batch(config, [{"slug": "things", "node_id": "1"}], self.tmp.name, client=client, images=True)
+        client.close()
+        
+        self.assertEqual(mock_get.call_count, 3)
+        self.assertEqual(client.stats["requests"], 0)
+    
+    def test_broken_images_fall_back_to_inline_svg(self):
+        """Test that a card's error fallback needs no third-party placeholder service"""
+        html = generate_html(self.deals, {"amazon_affiliate_id": "test-20"})
+        
+        self.assertNotIn("via.placeholder.com", html)
+        self.assertIn("this.src='data:image/svg+xml,", html)
+    
+    @patch('generate.requests.Session.get')
+    def test_failed_download_keeps_remote_image(self, mock_get):
+        """Test that images that cannot be fetched are left as remote URLs"""
+        mock_get.side_effect = requests.exceptions.ConnectionError("down")
+        
+        images = fetch_images(self.deals, self.tmp.name)
+        html = generate_html(self.deals, {"amazon_affiliate_id": "test-20"},
+                             assets=PageAssets(images=images, prefix=""))
+        
+        self.assertEqual(images, {})
+        self.assertIn(self.IMAGE_URL, html)
+
+
+class TestAssetOptimization(unittest.TestCase):
+    """Test cases for the shared stylesheet, minification and precompression"""
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.config = {"amazon_affiliate_id": "test-affiliate-20"}
+    
+    def tearDown(self):
+        self.tmp.cleanup()
+    
+    def test_minify_css(self):
+        """Test that comments and layout whitespace are removed"""
+        css = "/* card */\n.deal-card {\n    margin: 0 auto;\n    color: #fff;\n}\n"
+        self.assertEqual(minify_css(css), ".deal-card{margin:0 auto;color:#fff}")
+    
+    def test_minify_html_keeps_text_spacing(self):
+        """Test that indentation goes but words on separate lines stay separated"""
+        html = "\n    <p>\n        As an Amazon Associate,\n        we earn.\n    </p>\n"
+        self.assertEqual(minify_html(html), "<p>As an Amazon Associate, we earn.</p>")
+    
+    def test_stylesheet_is_content_hashed(self):
+        """Test that the stylesheet name carries its hash and is written once"""
+        first = write_stylesheet(self.tmp.name)
+        second = write_stylesheet(self.tmp.name)
+        
+        self.assertEqual(first, second)
+        self.assertRegex(first, r"^assets/top10\.[0-9a-f]{10}\.css$")
+        self.assertTrue(os.path.exists(os.path.join(self.tmp.name, first + ".gz")))
+    
+    def test_optimized_batch_links_shared_stylesheet(self):
+        """Test that optimized pages link one stylesheet and ship .gz copies"""
+        categories = [
+            {"slug": "electronics", "node_id": "16310101"},
+            {"slug": "computers", "node_id": "2619525011"}
+        ]
+        
+        generate_batch(self.config, categories, output_dir=self.tmp.name, use_mock=True, optimize=True)
+        
+        page_path = os.path.join(self.tmp.name, "computers", "index.html")
+        with open(page_path, encoding="utf-8") as f:
+            page = f.read()
+        self.assertNotIn("<style>", page)
+        self.assertRegex(page, r'<link rel="stylesheet" href="\.\./assets/top10\.[0-9a-f]{10}\.css">')
+        self.assertNotIn("\n", page)
+        with gzip.open(page_path + ".gz", "rt", encoding="utf-8") as f:
+            self.assertEqual(f.read(), page)
+        self.assertEqual(len(os.listdir(os.path.join(self.tmp.name, "assets"))),
+                         3 if generate.brotli is not None else 2)
+    
+    def test_plain_run_removes_stale_compressed_copies(self):
+        """Test that dropping --optimize deletes the .gz copies of the pages it rewrites"""
+        categories = [{"slug": "electronics", "node_id": "16310101"}]
+        generate_batch(self.config, categories, output_dir=self.tmp.name, use_mock=True, optimize=True)
+        generate_batch(self.config, categories, output_dir=self.tmp.name, use_mock=True)
+        
+        for page in ("index.html", os.path.join("electronics", "index.html")):
+            self.assertTrue(os.path.exists(os.path.join(self.tmp.name, page)))
+            self.assertFalse(os.path.exists(os.path.join(self.tmp.name, page + ".gz")))
+    
+    def test_default_render_still_inlines_css(self):
+        """Test that pages without build optimization keep the inline stylesheet"""
+        html = generate_html(get_mock_deals(), self.config)
+        self.assertIn("<style>", html)
+        self.assertNotIn('rel="stylesheet"', html)
+
+
+class TestRunMetrics(unittest.TestCase):
+    """Test cases for stage timing and the run report"""
+    
+    def test_timed_and_count_accumulate(self):
+        """Test that stage timings and counters accumulate across calls"""
+        metrics = RunMetrics()
+        with metrics.timed("render"):
+            pass
+        with metrics.timed("render"):
+            pass
+        metrics.count("bytes_received", 100)
+        metrics.count("bytes_received", 50)
+        
+        report = metrics.report()
+        
+        self.assertEqual(report["stages"]["render"]["calls"], 2)
+        self.assertEqual(report["counters"]["bytes_received"], 150)
+    
+    def test_report_includes_cache_and_http_stats(self):
+        """Test that cache and client stats are folded into the counters"""
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = ResponseCache(cache_dir=cache_dir)
+            cache.record("hits")
+            client = ApiClient(requests_per_second=0)
+            client.stats["retries"] = 2
+            
+            counters = RunMetrics().report(cache, client)["counters"]
+        
+        self.assertEqual(counters["cache_hits"], 1)
+        self.assertEqual(counters["http_retries"], 2)
+    
+    def test_prometheus_format(self):
+        """Test the Prometheus textfile exposition format"""
+        metrics = RunMetrics()
+        metrics.add_time("http_request", 0.5)
+        metrics.count("mock_fallbacks")
+        
+        text = prometheus_metrics(metrics.report())
+        
+        self.assertIn('top10_stage_seconds{stage="http_request"} 0.5', text)
+        self.assertIn('top10_events{name="mock_fallbacks"} 1', text)
+        self.assertIn("# TYPE top10_run_duration_seconds gauge", text)
+    
+    @patch('generate.requests.get')
+    def test_fetch_records_http_metrics(self, mock_get):
+        """Test that API fetches record timing, bytes and mock fallbacks"""
+        config = {
+            "rapidapi_key": "test_key",
+            "rapidapi_host": "amazon-real-time-api.p.rapidapi.com",
+            "api_endpoint": "https://amazon-real-time-api.p.rapidapi.com/deals",
+            "domain": "US",
+            "node_id": "16310101",
+            "mock_fallback": True
+        }
+        response = MagicMock()
+        response.status_code = 200
+        response.content = b'{"deals": [{"title": "A"}]}'
+        response.json.return_value = {"deals": [{"title": "A"}]}
+        mock_get.side_effect = [response, requests.exceptions.ConnectionError("down")]
+        METRICS.reset()
+        
+        fetch_amazon_deals(config)
+        fetch_amazon_deals(config)
+        
+        report = METRICS.report()
+        self.assertEqual(report["stages"]["http_request"]["calls"], 2)
+        self.assertEqual(report["stages"]["json_decode"]["calls"], 1)
+        self.assertEqual(report["counters"]["bytes_received"], len(response.content))
+        self.assertEqual(report["counters"]["mock_fallbacks"], 1)
+    
+    def test_main_writes_jsonl_report(self):
+        """Test that a full run appends a report line and a Prometheus file"""
+        with tempfile.TemporaryDirectory() as workdir:
+            config_path = os.path.join(workdir, "config.json")
+            with open(config_path, "w") as f:
+                json.dump({
+                    "rapidapi_key": "test_key",
+                    "rapidapi_host": "amazon-real-time-api.p.rapidapi.com",
+                    "amazon_affiliate_id": "test-affiliate-20",
+                    "api_endpoint": "https://amazon-real-time-api.p.rapidapi.com/deals",
+                    "domain": "US",
+                    "node_id": "16310101"
+                }, f)
+            report_path = os.path.join(workdir, "runs.jsonl")
+            prom_path = os.path.join(workdir, "top10.prom")
+            cwd = os.getcwd()
+            os.chdir(workdir)
+            try:
+                with patch('sys.stdout'):
+                    main(["--config", config_path, "--mock", "--no-cache",
+                          "--report", report_path, "--prometheus", prom_path])
+            finally:
+                os.chdir(cwd)
+            
+            with open(report_path) as f:
+                report = json.loads(f.readline())
+            self.assertEqual(report["mode"], "single")
+            for stage in ("config_load", "normalize", "render", "write"):
+                self.assertIn(stage, report["stages"])
+            self.assertEqual(report["counters"]["pages_written"], 1)
+            self.assertTrue(os.path.exists(prom_path))
+
+
+class TestRefreshScheduler(unittest.TestCase):
+    """Test cases for daemon mode scheduling"""
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        self.now = 1000.0
+        self.config = {
+            "amazon_affiliate_id": "test-affiliate-20",
+            "refresh_interval": 600,
+            "refresh_jitter": 0
+        }
+        self.categories = [
+            {"slug": "electronics", "node_id": "1"},
+            {"slug": "tablets", "node_id": "2", "refresh_interval": 60},
+            {"slug": "computers", "node_id": "3"}
+        ]
+    
+    def _scheduler(self, **config):
+        return RefreshScheduler(dict(self.config, **config), self.categories, clock=lambda: self.now)
+    
+    def test_everything_due_on_startup(self):
+        """Test that every category is refreshed once straight away"""
+        scheduler = self._scheduler()
+        
+        self.assertEqual([c["slug"] for c in scheduler.due()], ["electronics", "tablets", "computers"])
+        self.assertEqual(scheduler.due(), [])
+    
+    def test_intervals_follow_config_and_change_rate(self):
+        """Test per-category intervals, shortened for pages that keep changing"""
+        scheduler = self._scheduler()
+        scheduler.due()
+        scheduler.record("electronics", changed=True)
+        scheduler.record("tablets", changed=False)
+        scheduler.record("computers", changed=False)
+        
+        self.assertAlmostEqual(scheduler.seconds_until_due(), 60 * 2 ** 0.3)
+        self.now += 600
+        self.assertEqual([c["slug"] for c in scheduler.due()], ["electronics", "tablets"])
+    
+    def test_api_budget_defers_refreshes(self):
+        """Test that categories wait for the budget window once it is spent"""
+        scheduler = self._scheduler(api_budget_per_hour=2)
+        
+        self.assertEqual([c["slug"] for c in scheduler.due()], ["electronics", "tablets"])
+        scheduler.spend(2)
+        self.now += 60
+        self.assertEqual(scheduler.due(), [])
+        self.assertEqual(scheduler.seconds_until_due(), 3600 - 60)
+        self.now += 3600
+        self.assertEqual([c["slug"] for c in scheduler.due()], ["computers"])
+    
+    def test_daemon_cycle_renders_due_categories(self):
+        """Test one daemon refresh against mock data"""
+        config = dict(self.config, categories=self.categories[:2])
+        with tempfile.TemporaryDirectory() as workdir:
+            cwd = os.getcwd()
+            os.chdir(workdir)
+            try:
+                with patch('sys.stdout'):
+                    run_daemon(config, parse_args(["--daemon", "--mock"]), max_cycles=1)
+            finally:
+                os.chdir(cwd)
+            
+            self.assertTrue(os.path.exists(os.path.join(workdir, "output", "tablets", "index.html")))
+            with open(os.path.join(workdir, "output", "index.html"), encoding="utf-8") as f:
+                self.assertIn('href="electronics/index.html"', f.read())
+
+    
+    def test_daemon_survives_a_failed_cycle(self):
+        """Test that an exception in one refresh is logged and the categories are retried"""
+        config = dict(self.config, categories=self.categories[:2])
+        real = generate.generate_batch
+        calls = []
+        
+        def flaky(*args, **kwargs):
+            calls.append(1)
+            if len(calls) == 1:
+                raise OSError("disk full")
+            return real(*args, **kwargs)
+        
+        with tempfile.TemporaryDirectory() as workdir:
+            cwd = os.getcwd()
+            os.chdir(workdir)
+            try:
+                with patch('generate.generate_batch', side_effect=flaky), \
+                        patch.object(RefreshScheduler, 'RETRY_DELAY', 0), patch('sys.stdout'):
+                    run_daemon(config, parse_args(["--daemon", "--mock"]), max_cycles=2)
+            finally:
+                os.chdir(cwd)
+            
+            self.assertEqual(len(calls), 2)
+            self.assertTrue(os.path.exists(os.path.join(workdir, "output", "tablets", "index.html")))
+    
+    def test_budget_counts_api_calls_only(self):
+        """Test that requests other than API calls (such as image downloads) don't spend the budget"""
+        config = dict(self.config, categories=self.categories[:1], api_budget_per_hour=10)
+        spent = []
+        
+        def batch(*args, **kwargs):
+            METRICS.count('api_calls', 2)
+            client.stats['requests'] += 7
+            return {'written': [], 'skipped': [], 'failed': [], 'index': ''}
+        
+        client = MagicMock()
+        client.stats = {'requests': 50}
+        with patch('generate.generate_batch', side_effect=batch), \
+                patch.object(RefreshScheduler, 'spend', lambda self, n: spent.append(n)), patch('sys.stdout'):
+            run_daemon(config, parse_args(["--daemon", "--mock"]), client=client, max_cycles=1)
+        
+        self.assertEqual(spent, [2])
+
+class TestRecordReplay(unittest.TestCase):
+    """Test cases for API fixture recording and offline replay"""
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        import benchmark
+        self.benchmark = benchmark
+        self.tmp = tempfile.TemporaryDirectory()
+        self.fixture_dir = self.tmp.name
+    
+    def tearDown(self):
+        self.tmp.cleanup()
+    
+    def _record(self, latency=0):
+        with self.benchmark.stub_server(latency=latency, page_size=5) as url:
+            config = dict(self.benchmark.BENCH_CONFIG, api_endpoint=url, node_id="7")
+            client = RecordingClient(ApiClient(max_retries=0, requests_per_second=0), self.fixture_dir)
+            with patch('sys.stdout'):
+                deals = fetch_amazon_deals(config, client=client)
+            client.close()
+        return config, deals
+    
+    def test_replay_matches_recording_without_network(self):
+        """Test that replayed responses yield the recorded deals once the server is gone"""
+        config, recorded = self._record()
+        replay = ReplayClient(self.fixture_dir)
+        
+        with patch('sys.stdout'):
+            replayed = fetch_amazon_deals(config, client=replay)
+        
+        self.assertEqual(replayed, recorded)
+        self.assertEqual(replay.stats, {"requests": 1, "replayed": 1, "missing": 0})
+        fixtures = os.listdir(self.fixture_dir)
+        self.assertEqual(len(fixtures), 1)
+        self.assertTrue(fixtures[0].endswith(".json.gz"))
+    
+    def test_fixtures_never_contain_the_api_key(self):
+        """Test that request headers are not written to fixtures"""
+        self._record()
+        
+        with gzip.open(os.path.join(self.fixture_dir, os.listdir(self.fixture_dir)[0]), "rt") as f:
+            self.assertNotIn("bench_key", f.read())
+    
+    def test_replay_with_recorded_latency(self):
+        """Test that latency replay waits as long as the original response took"""
+        config, _ = self._record(latency=0.05)
+        
+        with patch('sys.stdout'), patch('generate.time.sleep') as mock_sleep:
+            fetch_amazon_deals(config, client=ReplayClient(self.fixture_dir, latency=True))
+        
+        self.assertGreaterEqual(mock_sleep.call_args.args[0], 0.05)
+    
+    def test_replay_needs_no_api_key(self):
+        """Test that a config without rapidapi_key replays through main in single and batch mode"""
+        config, recorded = self._record()
+        del config["rapidapi_key"]
+        config_path = os.path.join(self.fixture_dir, "config.json")
+        with open(config_path, "w") as f:
+            json.dump(dict(config, output_dir=os.path.join(self.fixture_dir, "out"),
+                           categories=[{"slug": "seven", "node_id": "7"}]), f)
+        
+        with patch('sys.stdout'):
+            self.assertEqual(fetch_amazon_deals(config, client=ReplayClient(self.fixture_dir)), recorded)
+            main(["--config", config_path, "--replay", self.fixture_dir])
+            main(["--config", config_path, "--replay", self.fixture_dir, "--batch"])
+        
+        self.assertTrue(os.path.exists(os.path.join(self.fixture_dir, "out", "index.html")))
+        self.assertTrue(os.path.exists(os.path.join(self.fixture_dir, "out", "seven", "index.html")))
+    
+    def test_binary_bodies_replay_byte_for_byte(self):
+        """Test that non-UTF-8 responses such as images survive a record and replay"""
+        payload = bytes(range(256))
+        response = requests.Response()
+        response.status_code = 200
+        response._content = payload
+        inner = MagicMock()
+        inner.get.return_value = response
+        
+        RecordingClient(inner, self.fixture_dir).get("https://cdn.example/a.jpg")
+        
+        self.assertEqual(ReplayClient(self.fixture_dir).get("https://cdn.example/a.jpg").content, payload)
+    
+    def test_record_bypasses_cache_and_replay_never_mocks(self):
+        """Test that a warm cache can't hide requests from --record, and replays don't fall back to mock"""
+        workdir = self.fixture_dir
+        config_path = os.path.join(workdir, "config.json")
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            with self.benchmark.stub_server(latency=0, page_size=5) as url:
+                with open(config_path, "w") as f:
+                    json.dump(dict(self.benchmark.BENCH_CONFIG, api_endpoint=url), f)
+                with patch('sys.stdout'):
+                    main(["--config", config_path, "--no-history"])
+                    main(["--config", config_path, "--no-history", "--record", "fx"])
+            self.assertEqual(len(os.listdir("fx")), 1)
+            
+            os.makedirs("empty")
+            with patch('sys.stdout') as stdout, self.assertRaises(SystemExit):
+                main(["--config", config_path, "--replay", "empty", "--force"])
+            printed = "".join(call.args[0] for call in stdout.write.call_args_list)
+            self.assertNotIn("Falling back to mock data", printed)
+        finally:
+            os.chdir(cwd)
+    
+    def test_missing_fixture_fails_like_network_error(self):
+        """Test that unrecorded requests take the normal failure path"""
+        config = dict(self.benchmark.BENCH_CONFIG, api_endpoint="http://127.0.0.1:9/deals", mock_fallback=False)
+        replay = ReplayClient(self.fixture_dir)
+        
+        with patch('sys.stdout'):
+            self.assertIsNone(fetch_amazon_deals(config, client=replay))
+        self.assertEqual(replay.stats["missing"], 1)
+
+
+class TestLinkChecker(unittest.TestCase):
+    """Test cases for concurrent product and image link checking"""
+    
+    def setUp(self):
+        """Start a stub server with live, gone and HEAD-refusing paths"""
+        self.seen = []
+        self.active = 0
+        self.peak = 0
+        lock = threading.Lock()
+        test = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def _respond(self):
+                with lock:
+                    test.seen.append((self.command, self.path))
+                    test.active += 1
+                    test.peak = max(test.peak, test.active)
+                time.sleep(0.02)
+                if self.path.startswith("/gone"):
+                    status = 404
+                elif self.path.startswith("/nohead") and self.command == "HEAD":
+                    status = 405
+                elif self.path.startswith("/busy"):
+                    status = 503
+                else:
+                    status = 200
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                with lock:
+                    test.active -= 1
+            
+            do_HEAD = do_GET = _respond
+            
+            def log_message(self, format, *args):
+                pass
+        
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.tmp.name, "links.json")
+    
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp.cleanup()
+    
+    def test_statuses_with_head_first_and_get_fallback(self):
+        """Test that 404 is dead, 5xx is unknown and HEAD refusals retry with GET"""
+        checker = LinkChecker(cache_path=self.cache_path)
+        status = checker.check_many([self.base + "/ok", self.base + "/gone", self.base + "/nohead",
+                                     self.base + "/busy", "https://via.placeholder.com/300"])
+        
+        self.assertEqual(status, {
+            self.base + "/ok": True,
+            self.base + "/gone": False,
+            self.base + "/nohead": True,
+            self.base + "/busy": None,
+            "https://via.placeholder.com/300": False
+        })
+        self.assertIn(("HEAD", "/ok"), self.seen)
+        self.assertNotIn(("GET", "/ok"), self.seen)
+        self.assertIn(("GET", "/nohead"), self.seen)
+    
+    def test_per_host_limit(self):
+        """Test that no more than per_host requests hit one host at once"""
+        checker = LinkChecker(cache_path=None, max_workers=16, per_host=2)
+        checker.check_many([f"{self.base}/ok/{i}" for i in range(12)])
+        
+        self.assertEqual(len(self.seen), 12)
+        self.assertLessEqual(self.peak, 2)
+    
+    def test_cached_results_respect_ttl(self):
+        """Test that fresh results are reused across runs and unknown ones are retried"""
+        checker = LinkChecker(cache_path=self.cache_path)
+        checker.check_many([self.base + "/ok", self.base + "/busy"])
+        checker.save()
+        
+        again = LinkChecker(cache_path=self.cache_path)
+        again.check_many([self.base + "/ok", self.base + "/busy"])
+        self.assertEqual(again.stats["cached"], 1)
+        self.assertEqual(len(self.seen), 3)
+        
+        expired = LinkChecker(cache_path=self.cache_path, ttl=0)
+        expired.check_many([self.base + "/ok"])
+        self.assertEqual(expired.stats["cached"], 0)
+    
+    def test_batch_replaces_dead_deals_with_spares(self):
+        """Test that deals with a dead page or image are swapped for the next best"""
+        deals = [
+            {"product_title": f"Product {i}", "product_price": "$10.00", "product_star_rating": "4.5",
+             "product_num_ratings": str(1000 - i),
+             "product_url": f"{self.base}/{'gone' if i == 0 else 'ok'}/p{i}",
+             "product_photo": f"{self.base}/{'gone' if i == 1 else 'ok'}/i{i}.jpg"}
+            for i in range(6)
+        ]
+        config = {"rapidapi_key": "k", "rapidapi_host": "h", "amazon_affiliate_id": "t-20",
+                  "api_endpoint": "http://unused", "domain": "US", "node_id": "1", "top_n": 3}
+        checker = LinkChecker(cache_path=None)
+        
+        with patch('generate.fetch_amazon_deals', return_value=deals), patch('sys.stdout'):
+            generate_batch(config, [{"slug": "things", "title": "Things", "node_id": "1"}],
+                           self.tmp.name, checker=checker)
+        
+        with open(os.path.join(self.tmp.name, "things", "index.html"), encoding="utf-8") as f:
+            page = f.read()
+        self.assertNotIn("Product 0", page)
+        self.assertNotIn("Product 1", page)
+        for i in (2, 3, 4):
+            self.assertIn(f"Product {i}", page)
+        self.assertNotIn("Product 5", page)
+
+
+class TestSearchIndex(unittest.TestCase):
+    """Test cases for the sharded client-side search index"""
+    
+    def setUp(self):
+        """Set up test fixtures"""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.search_dir = os.path.join(self.tmp.name, "search")
+        self.config = {"amazon_affiliate_id": "t-20"}
+    
+    def tearDown(self):
+        self.tmp.cleanup()
+    
+    def _deal(self, title, asin):
+        return normalize_deal({"product_title": title, "product_price": "$10.00",
+                               "product_url": f"https://www.amazon.com/dp/{asin}"})
+    
+    def _category(self, slug, niche, deals):
+        return dict(self.config, slug=slug, title=slug.title(), niche=niche), deals
+    
+    def _shard(self, prefix):
+        with open(os.path.join(self.search_dir, f"{prefix}.json"), encoding="utf-8") as f:
+            return json.load(f)
+    
+    def test_titles_niches_and_asins_are_searchable(self):
+        """Test that every term lands in its prefix shard with self-contained documents"""
+        index = SearchIndex(self.search_dir)
+        index.update(*self._category("tablets", "Tablets", [self._deal("Fire HD 10 Tablet", "B0BHZT5S12")]))
+        index.save()
+        
+        shard = self._shard("ta")
+        self.assertEqual(shard["terms"]["tablet"], ["tablets:0"])
+        self.assertEqual(shard["docs"]["tablets:0"][:2], ["tablets", "Fire HD 10 Tablet"])
+        self.assertIn("tag=t-20", shard["docs"]["tablets:0"][2])
+        self.assertEqual(self._shard("b0")["terms"]["b0bhzt5s12"], ["tablets:0"])
+        with open(os.path.join(self.search_dir, "index.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+        self.assertEqual(manifest["prefix_length"], 2)
+        self.assertEqual(set(manifest["shards"]), {"fi", "hd", "10", "ta", "b0"})
+    
+    def test_niche_terms_ignore_the_page_title_and_match_rebuilds(self):
+        """Test that a category without a niche is indexed under its slug, as --rebuild indexes it"""
+        deals = [self._deal("Fire Tablet", "B000000001")]
+        batch = SearchIndex.category_entry(dict(self.config, slug="tablets", title="Top 10 Tablet Deals"), deals)
+        rebuild = SearchIndex.category_entry(dict(self.config, slug="tablets", title="Top 10 Tablet Deals",
+                                                  niche="tablets"), deals)
+        
+        self.assertEqual(batch, rebuild)
+        self.assertNotIn("deal", batch["terms"])
+        self.assertNotIn("top", batch["terms"])
+        self.assertIn("tablet", batch["terms"])
+    
+    def test_updates_only_rewrite_affected_shards(self):
+        """Test that a changed category rewrites just its shards and an unchanged one nothing"""
+        index = SearchIndex(self.search_dir)
+        index.update(*self._category("tablets", "Tablets", [self._deal("Fire Tablet", "B000000001")]))
+        index.update(*self._category("coffee", "Coffee", [self._deal("Espresso Maker", "C000000001")]))
+        index.save()
+        
+        again = SearchIndex(self.search_dir)
+        self.assertFalse(again.update(*self._category("coffee", "Coffee", [self._deal("Espresso Maker", "C000000001")])))
+        self.assertEqual(again.save(), [])
+        
+        self.assertTrue(again.update(*self._category("coffee", "Coffee", [self._deal("Drip Maker", "C000000002")])))
+        written = {os.path.basename(path) for path in again.save()}
+        self.assertEqual(written, {"dr.json", "ma.json", "co.json", "c0.json", "index.json"})
+        self.assertFalse(os.path.exists(os.path.join(self.search_dir, "es.json")))
+        self.assertEqual(self._shard("ta")["terms"]["tablet"], ["tablets:0"])
+    
+    def test_batch_writes_index_and_search_box(self):
+        """Test that batch mode with search builds the shards and links them from the index page"""
+        config = {"rapidapi_key": "k", "rapidapi_host": "h", "amazon_affiliate_id": "t-20",
+                  "api_endpoint": "http://unused", "domain": "US", "node_id": "1"}
+        categories = [{"slug": "snacks", "title": "Snacks", "node_id": "1"}]
+        
+        with patch('sys.stdout'):
+            generate_batch(config, categories, self.tmp.name, use_mock=True, search=True)
+        
+        with open(os.path.join(self.tmp.name, "index.html"), encoding="utf-8") as f:
+            page = f.read()
+        self.assertIn('id="search"', page)
+        self.assertIn("term.slice(0, m.prefix_length)", page)
+        self.assertNotIn("slice(0, 2)", page)
+        self.assertIn("snacks:0", self._shard("sn")["terms"]["snack"])
+        
+        removed = SearchIndex(self.search_dir)
+        removed.retain([])
+        removed.save()
+        with open(os.path.join(self.search_dir, "index.json"), encoding="utf-8") as f:
+            self.assertEqual(json.load(f)["shards"], {})
+        self.assertEqual(sorted(os.listdir(self.search_dir)), [".state.json", "index.json"])
+
+
+class TestBenchmark(unittest.TestCase):
+    """Smoke tests for the benchmark harness"""
+    
+    def test_pipeline_stages_report_metrics(self):
+        """Test that every CPU-bound stage is measured"""
+        import benchmark
+        
+        results = benchmark.bench_pipeline([20], repeat=1)
+        
+        self.assertEqual({entry["stage"] for entry in results},
+                         {"affiliate", "normalize", "rank", "render", "write"})
+        self.assertTrue(all(entry["peak_kb"] is not None for entry in results))
+    
+    def test_stub_server_serves_deals(self):
+        """Test that fetches work against the local stub server"""
+        import benchmark
+        
+        with benchmark.stub_server(latency=0, page_size=5) as url:
+            config = dict(benchmark.BENCH_CONFIG, api_endpoint=url, node_id="7")
+            deals = fetch_amazon_deals(config)
+        
+        self.assertEqual(len(deals), 5)
+    
+    def test_compare_to_baseline_flags_regressions(self):
+        """Test that slowdowns beyond the tolerance are reported"""
+        import benchmark
+        
+        baseline = [{"stage": "render", "size": 1000, "seconds": 0.1},
+                    {"stage": "rank", "size": 10, "seconds": 0.0001}]
+        results = [{"stage": "render", "size": 1000, "seconds": 0.2},
+                   {"stage": "rank", "size": 10, "seconds": 0.0004}]
+        
+        regressions = benchmark.compare_to_baseline(results, baseline, tolerance=0.25)
+        
+        self.assertEqual(len(regressions), 1)
+        self.assertTrue(regressions[0].startswith("render[1000]"))
+
+
 class TestIntegration(unittest.TestCase):
     """Integration tests"""
     